@@ -1,21 +1,26 @@
 #NOTE  lets create an Agent that uses the ReAct pattern,
+#NOTE - USE_REACT runs the real Thought/Action/Observation loop from react_loop.py
+# (tools, parallel tool calls, timeouts, cache and a step budget). Set it to False
+# to go back to the think-then-answer version below
 
 
 chatting = True
 import json
 import requests
 import time  # Add this import
+from reasoning_pipeline import run_reasoning, MODE_SEQUENTIAL, MODE_EARLY
+from react_loop import ReActAgent
 
 #system_message = tbd
 MODEL="qwq:latest"
+PIPELINE_MODE = MODE_EARLY  # qwq closes its thinking with </think>, the early mode stops right there
+USE_REACT = True
 #NOTE I wil create a function that will only make the LLM think more about the answer
 #After that, I can pass the original question AND the thinking to the LLM again
 #So it has more context
 
-def thinking_cycle(memory, new_question):
-    """This gets the full conversation history and the new question and makes the LLM think about it"""
-    
-    # Format the full conversation history first
+def format_memory(memory):
+    """Format the conversation history"""
     formatted_conversation = ""
     for item in memory:
         if "system" in item:
@@ -24,6 +29,14 @@ def thinking_cycle(memory, new_question):
             formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
         elif "agent" in item:
             formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
+    return formatted_conversation
+
+
+def build_thinking_prompt(memory, new_question):
+    """Prompt that makes the LLM think about the new question in the context of the conversation"""
+    
+    # Format the full conversation history first
+    formatted_conversation = format_memory(memory)
     
     # Add the new question
     formatted_conversation += f"<|im_start|>user\n{new_question}<|im_end|>\n"
@@ -31,6 +44,23 @@ def thinking_cycle(memory, new_question):
     # Add specific thinking instructions
     formatted_conversation += f"<|im_start|>system\nThink deeply about the user's latest question in the context of the entire conversation. Consider all relevant information from previous exchanges.\n<|im_end|>\n"
     formatted_conversation += "<|im_start|>assistant\n"
+    return formatted_conversation
+
+
+def build_answer_prompt(memory, thinking):
+    """Prompt with the conversation plus the thinking, used for the final answer"""
+    formatted_conversation = format_memory(memory)
+
+    formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
+
+    formatted_conversation += "<|im_start|>assistant\n"
+    return formatted_conversation
+
+
+def thinking_cycle(memory, new_question):
+    """This gets the full conversation history and the new question and makes the LLM think about it"""
+    
+    formatted_conversation = build_thinking_prompt(memory, new_question)
 
     model_id = MODEL
     api_endpoint = "http://localhost:11434/api/generate"
@@ -63,19 +93,7 @@ def thinking_cycle(memory, new_question):
 def simple_agent(memory, thinking):
     """It takes the tought plus the question and gives back an answer"""
 
-    formatted_conversation = ""
-
-    for item in memory:
-        if "system" in item:
-            formatted_conversation += item["system"]  # Use value from dictionary
-        elif "user" in item:
-            formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
-        elif "agent" in item:
-            formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
-
-    formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
-
-    formatted_conversation += "<|im_start|>assistant\n"
+    formatted_conversation = build_answer_prompt(memory, thinking)
 
 
     # Model name should match exactly as shown in 'ollama list'
@@ -128,6 +146,8 @@ You are a helpful AI assistant that provides clear, accurate, and thoughtful res
 memory = []
 memory.append({"system": system_message})
 
+react_agent = ReActAgent(MODEL)
+
 
 while chatting:
 
@@ -139,6 +159,33 @@ while chatting:
         chatting = False
         break
         
+    if USE_REACT:
+        # Thought/Action/Observation loop until the model gives its final answer
+        response, stats = react_agent.run(format_memory(memory), question)
+        print(f"\nAI:\n{response}\n")
+        print(f"[react] {stats['steps']} steps, {stats['tool_calls']} tool calls ({stats['cache_hits']} cached), {stats['total_time']}s\n")
+        memory.append({"user": question})
+        memory.append({"agent": response})
+        continue
+
+    if PIPELINE_MODE != MODE_SEQUENTIAL:
+        # Streamed thinking with an early start of the answer (or a race against a direct answer)
+        think_prompt = build_thinking_prompt(memory, question)
+        memory.append({"user": question})
+        print("\nAI:\n", end="", flush=True)
+        response, metrics = run_reasoning(
+            MODEL,
+            think_prompt,
+            lambda thinking: build_answer_prompt(memory, thinking),
+            direct_prompt=format_memory(memory) + "<|im_start|>assistant\n",
+            mode=PIPELINE_MODE,
+            on_token=lambda token: print(token, end="", flush=True)
+        )
+        print("\n")
+        print(f"[{metrics['mode']}] first answer token after {metrics.get('answer_ttft')}s, total {metrics['total_time']}s\n")
+        memory.append({"agent": response})
+        continue
+
     # First, get the AI's thinking on the question
     thinking = thinking_cycle(memory, question)
 
@@ -8,10 +8,19 @@
 # by making the thinking also go trought the memory, making it last more there
 
 
+#NOTE - reasoning_pipeline.py can stream the thinking and start the answer early
+#("early") or race a direct answer against the thinking ("race"). "sequential" is
+#the original think-then-answer flow below.
+
+
 chatting = True
 import json
 import requests
 import time  # Add this import
+from reasoning_pipeline import run_reasoning, MODE_SEQUENTIAL, MODE_EARLY
+
+MODEL = "llama3.1:8b"
+PIPELINE_MODE = MODE_EARLY
 
 #system_message = tbd
 
@@ -19,13 +28,44 @@ import time  # Add this import
 #After that, I can pass the original question AND the thinking to the LLM again
 #So it has more context
 
+def build_thinking_prompt(question):
+    """Prompt that makes the LLM think about the question"""
+    return f"<|im_start|>system\nYou are an AI assistant. Think deeply about this question. Explore multiple perspectives and analyze all aspects thoroughly. This is just your internal thinking process.\n<|im_end|>\n<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+
+
+def format_memory(memory):
+    """Format the conversation history"""
+    formatted_conversation = ""
+
+    for item in memory:
+        if "system" in item:
+            formatted_conversation += item["system"]  # Use value from dictionary
+        elif "user" in item:
+            formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
+        elif "agent" in item:
+            formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
+
+    return formatted_conversation
+
+
+def build_answer_prompt(memory, thinking):
+    """Prompt with the conversation plus the thinking, used for the final answer"""
+    formatted_conversation = format_memory(memory)
+
+    formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
+
+    formatted_conversation += "<|im_start|>assistant\n"
+
+    return formatted_conversation
+
+
 def thinking_cycle(question):
     """This one gets the question from the user and makes the LLM think about it"""
     
-    formatted_conversation = f"<|im_start|>system\nYou are an AI assistant. Think deeply about this question. Explore multiple perspectives and analyze all aspects thoroughly. This is just your internal thinking process.\n<|im_end|>\n<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+    formatted_conversation = build_thinking_prompt(question)
 
 
-    model_id = "llama3.1:8b"
+    model_id = MODEL
     api_endpoint = "http://localhost:11434/api/generate"
 
 
@@ -55,23 +95,11 @@ def thinking_cycle(question):
 def simple_agent(memory, thinking):
     """It takes the tought plus the question and gives back an answer"""
 
-    formatted_conversation = ""
-
-    for item in memory:
-        if "system" in item:
-            formatted_conversation += item["system"]  # Use value from dictionary
-        elif "user" in item:
-            formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
-        elif "agent" in item:
-            formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
-
-    formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
-
-    formatted_conversation += "<|im_start|>assistant\n"
+    formatted_conversation = build_answer_prompt(memory, thinking)
 
 
     # Model name should match exactly as shown in 'ollama list'
-    model_id = "llama3.1:8b"
+    model_id = MODEL
     api_endpoint = "http://localhost:11434/api/generate"
 
 
@@ -126,6 +154,23 @@ while chatting:
         chatting = False
         break
         
+    if PIPELINE_MODE != MODE_SEQUENTIAL:
+        # Streamed thinking with an early start of the answer (or a race against a direct answer)
+        memory.append({"user": question})
+        print("\nAI:\n", end="", flush=True)
+        response, metrics = run_reasoning(
+            MODEL,
+            build_thinking_prompt(question),
+            lambda thinking: build_answer_prompt(memory, thinking),
+            direct_prompt=format_memory(memory) + "<|im_start|>assistant\n",
+            mode=PIPELINE_MODE,
+            on_token=lambda token: print(token, end="", flush=True)
+        )
+        print("\n")
+        print(f"[{metrics['mode']}] first answer token after {metrics.get('answer_ttft')}s, total {metrics['total_time']}s\n")
+        memory.append({"agent": response})
+        continue
+
     # First, get the AI's thinking on the question
     thinking = thinking_cycle(question)
 
@@ -7,11 +7,16 @@
 # does not remember the previous thinking and goes out of context... we cna fix this
 # by making the thinking also go trought the memory, making it last more there
 
+#NOTE - Done with thought_store.py: each turn's thinking is kept compressed on disk and
+# only short summaries of the most relevant past thoughts go back in the prompt, so the
+# prompt doesn't grow with every turn
+
 
 chatting = True
 import json
 import requests
 import time  # Add this import
+from thought_store import ThoughtStore
 
 #system_message = tbd
 
@@ -19,7 +24,7 @@ import time  # Add this import
 #After that, I can pass the original question AND the thinking to the LLM again
 #So it has more context
 
-def thinking_cycle(memory, new_question):
+def thinking_cycle(memory, new_question, past_thoughts=""):
     """This gets the full conversation history and the new question and makes the LLM think about it"""
     
     # Format the full conversation history first
@@ -32,6 +37,9 @@ def thinking_cycle(memory, new_question):
         elif "agent" in item:
             formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
     
+    # Add the summaries of the earlier thinking (empty on the first turn)
+    formatted_conversation += past_thoughts
+    
     # Add the new question
     formatted_conversation += f"<|im_start|>user\n{new_question}<|im_end|>\n"
     
@@ -133,6 +141,10 @@ You are a helpful AI assistant that provides clear, accurate, and thoughtful res
 memory = []
 memory.append({"system": system_message})
 
+# Thinking of the earlier turns - a new conversation starts with an empty store
+thought_store = ThoughtStore()
+thought_store.clear()
+
 
 while chatting:
 
@@ -144,8 +156,15 @@ while chatting:
         chatting = False
         break
         
+    # Pick the past thoughts that fit the token budget
+    past_thoughts = thought_store.format_for_prompt(thought_store.select(question))
+
     # First, get the AI's thinking on the question
-    thinking = thinking_cycle(memory, question)
+    thinking = thinking_cycle(memory, question, past_thoughts)
+
+    # Keep it for the next turns (compressed, only the summary goes back in the prompt)
+    entry = thought_store.add(question, thinking)
+    print(f"[thought {entry['id']} stored: {entry['raw_bytes']} -> {entry['compressed_bytes']} bytes, summary ~{entry['summary_tokens']} tokens]")
 
     memory.append({"user": question})
 
@@ -0,0 +1,304 @@
+#NOTE - The actual ReAct pattern: the model writes a Thought, then Actions (tool calls),
+#we run the tools and give back an Observation, and it loops until the model writes a
+#Final Answer. Several actions in the same step don't depend on each other, so they
+#run at the same time in a thread pool. Every tool has its own timeout, results are
+#cached by (tool, args), and the loop has a step and time budget so it can't run forever.
+
+import ast
+import json
+import operator
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "My_Projects", "AI_Agent_with_Voice"))
+from think_filter import split_thinking
+
+API_ENDPOINT = "http://localhost:11434/api/generate"
+
+MAX_STEPS = 5  # Thought/Action/Observation rounds before the answer is forced
+TIME_BUDGET = 90.0  # Seconds for the whole loop
+DEFAULT_TOOL_TIMEOUT = 10.0
+MAX_THINKING_CONTINUATIONS = 3  # Extra generations for a model that ran out of tokens while thinking
+
+# Action: tool_name[arguments]
+ACTION_PATTERN = re.compile(r"^\s*Action:\s*([A-Za-z_][\w]*)\s*\[(.*)\]\s*$", re.MULTILINE)
+FINAL_ANSWER_PATTERN = re.compile(r"Final Answer:\s*(.*)", re.DOTALL)
+
+
+class Tool:
+    """A function the model can call"""
+    def __init__(self, name, func, description, timeout=DEFAULT_TOOL_TIMEOUT, cacheable=True):
+        self.name = name
+        self.func = func
+        self.description = description
+        self.timeout = timeout
+        self.cacheable = cacheable  # False for tools whose result changes (e.g. the time)
+
+
+class ToolRegistry:
+    """The tools available to the agent"""
+    def __init__(self):
+        self.tools = {}
+
+    def register(self, name, description, timeout=DEFAULT_TOOL_TIMEOUT, cacheable=True):
+        """Decorator that registers a function as a tool"""
+        def decorator(func):
+            self.tools[name] = Tool(name, func, description, timeout, cacheable)
+            return func
+        return decorator
+
+    def get(self, name):
+        """Get a tool by name (None if it doesn't exist)"""
+        return self.tools.get(name)
+
+    def describe(self):
+        """Tool list for the prompt"""
+        return "\n".join(f"- {tool.name}[...]: {tool.description}" for tool in self.tools.values())
+
+
+class ToolExecutor:
+    """Runs tool calls concurrently with per-tool timeouts and a result cache"""
+    def __init__(self, registry, max_workers=4):
+        self.registry = registry
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="react-tool")
+        self.cache = {}  # (tool, args) -> result
+        self.cache_hits = 0
+
+    def run_all(self, actions, deadline=None):
+        """Run a list of (tool, args) calls at once, returns their results in the same order"""
+        results = [None] * len(actions)
+        futures = {}
+        start = time.time()
+
+        for i, (name, args) in enumerate(actions):
+            tool = self.registry.get(name)
+            if tool is None:
+                results[i] = f"Error: unknown tool '{name}'. Available tools: {', '.join(self.registry.tools)}"
+                continue
+            key = (name, args)
+            if tool.cacheable and key in self.cache:
+                self.cache_hits += 1
+                results[i] = self.cache[key]
+                continue
+            futures[i] = (tool, key, self.pool.submit(tool.func, args))
+
+        for i, (tool, key, future) in futures.items():
+            # Each tool has its own timeout, but none may go past the loop deadline
+            timeout = tool.timeout - (time.time() - start)
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.time())
+            done, _ = wait([future], timeout=max(0.0, timeout))
+            if not done:
+                future.cancel()
+                results[i] = f"Error: {tool.name} timed out after {tool.timeout:g}s"
+                continue
+            try:
+                result = str(future.result())
+            except Exception as e:
+                results[i] = f"Error: {tool.name} failed: {e}"
+                continue
+            if tool.cacheable:
+                self.cache[key] = result
+            results[i] = result
+        return results
+
+    def shutdown(self):
+        """Stop the thread pool (running tools are left to finish)"""
+        self.pool.shutdown(wait=False)
+
+
+# Default tools
+default_tools = ToolRegistry()
+
+# Powers are the one operator that can take forever (9**9**9), keep them small
+MAX_EXPONENT = 100
+MAX_POWER_BASE = 10 ** 6
+
+def _power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT or abs(base) > MAX_POWER_BASE:
+        raise ValueError(f"powers are limited to bases up to {MAX_POWER_BASE:g} and exponents up to {MAX_EXPONENT}")
+    return operator.pow(base, exponent)
+
+_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.Pow: _power, ast.Mod: operator.mod, ast.FloorDiv: operator.floordiv,
+    ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+
+def _evaluate(node):
+    """Evaluate an arithmetic expression tree (numbers and operators only)"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.left), _evaluate(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    raise ValueError("only numbers and + - * / ** % // are allowed")
+
+@default_tools.register("calculator", "evaluates an arithmetic expression, e.g. calculator[(12.5 * 4) / 3]", timeout=2.0)
+def calculator(expression):
+    return _evaluate(ast.parse(expression, mode="eval"))
+
+@default_tools.register("current_time", "gives the current date and time, e.g. current_time[]", timeout=1.0, cacheable=False)
+def current_time(_):
+    return datetime.now().strftime("%A %Y-%m-%d %H:%M")
+
+@default_tools.register("wikipedia", "gives the summary of a Wikipedia article, e.g. wikipedia[Mexico City]", timeout=8.0)
+def wikipedia(title):
+    url = "https://en.wikipedia.org/api/rest_v1/page/summary/" + requests.utils.quote(title.strip().replace(" ", "_"))
+    response = requests.get(url, timeout=8.0, headers={"User-Agent": "react-agent-example"})
+    if response.status_code != 200:
+        return f"No article found for '{title}'"
+    return response.json().get("extract", "")[:1000]
+
+
+def parse_step(text):
+    """Parse one model step into (final_answer, actions), ignoring its <think> section"""
+    # Reasoning models (qwq) may draft Action or Final Answer lines while thinking
+    _, text = split_thinking(text)
+    # Anything the model made up after an action is not a real observation
+    text = text.split("Observation:")[0]
+    final = FINAL_ANSWER_PATTERN.search(text)
+    actions = [(name, args.strip()) for name, args in ACTION_PATTERN.findall(text)]
+    if final and not actions:
+        return final.group(1).strip(), []
+    return None, actions
+
+
+def thinking_unclosed(text):
+    """True while a <think> section is still open (the model ran out of tokens while thinking)"""
+    return text.rfind("<think>") > text.rfind("</think>")
+
+
+def after_thinking(text):
+    """The part of a step after its <think> section (empty while it is still thinking)"""
+    if thinking_unclosed(text):
+        return ""
+    return text.rsplit("</think>", 1)[-1]
+
+
+def generate(model, prompt, num_predict=512):
+    """One generation that stops before the model invents an observation"""
+    # No server-side stop sequence: qwq writes hypothetical "Observation:" lines while
+    # it thinks, so the stream is only cut at one that comes after the thinking
+    response = requests.post(
+        API_ENDPOINT,
+        json={
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "num_predict": num_predict
+            }
+        },
+        stream=True
+    )
+    text = ""
+    with response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            text += chunk.get("response", "")
+            if chunk.get("done", False) or "Observation:" in after_thinking(text):
+                break
+    return text
+
+
+class ReActAgent:
+    """Thought/Action/Observation loop with parallel tool calls and a budget"""
+    def __init__(self, model, registry=default_tools, max_steps=MAX_STEPS, time_budget=TIME_BUDGET,
+                 generate_func=generate, verbose=True):
+        self.model = model
+        self.registry = registry
+        self.executor = ToolExecutor(registry)
+        self.max_steps = max_steps
+        self.time_budget = time_budget
+        self.generate = generate_func
+        self.verbose = verbose
+
+    def build_prompt(self, conversation, question, scratchpad):
+        """Conversation, ReAct instructions and the steps so far"""
+        instructions = (
+            "<|im_start|>system\nAnswer the user's latest question. You can use these tools:\n"
+            f"{self.registry.describe()}\n\n"
+            "Use this format:\n"
+            "Thought: what you need to do next\n"
+            "Action: tool_name[arguments]\n"
+            "(write several Action lines if you need several independent tools, they run at the same time)\n"
+            "Observation: the tool results (given to you, never write it yourself)\n"
+            "... repeat Thought/Action/Observation as needed ...\n"
+            "Thought: I know the answer\n"
+            "Final Answer: the answer for the user\n<|im_end|>\n"
+        )
+        return (
+            conversation
+            + f"<|im_start|>user\n{question}<|im_end|>\n"
+            + instructions
+            + "<|im_start|>assistant\n"
+            + scratchpad
+        )
+
+    def run(self, conversation, question):
+        """Run the loop for one question, returns (answer, stats)"""
+        start = time.time()
+        deadline = start + self.time_budget
+        scratchpad = ""
+        stats = {"steps": 0, "tool_calls": 0, "cache_hits_before": self.executor.cache_hits}
+
+        for step in range(self.max_steps):
+            if time.time() >= deadline:
+                break
+            stats["steps"] = step + 1
+            output = self._generate_step(self.build_prompt(conversation, question, scratchpad), deadline)
+            # Only the text after the thinking counts, and is kept in the scratchpad -
+            # anything the model made up after an action is not a real observation
+            _, output = split_thinking(output)
+            output = output.split("Observation:")[0].rstrip()
+            if not output:
+                break  # Still thinking when the continuations ran out - force the answer
+            final, actions = parse_step(output)
+            if self.verbose:
+                print(output)
+
+            if final is not None:
+                return final, self._finish(stats, start)
+            if not actions:
+                # No action and no final answer - take what it wrote as the answer
+                return output.replace("Thought:", "").strip(), self._finish(stats, start)
+
+            results = self.executor.run_all(actions, deadline)
+            stats["tool_calls"] += len(actions)
+            observation = "\n".join(f"Observation: {name}[{args}] -> {result}"
+                                    for (name, args), result in zip(actions, results))
+            if self.verbose:
+                print(observation)
+            scratchpad += output + "\n" + observation + "\n"
+
+        # Budget used up - answer with what we have
+        scratchpad += "Thought: I have to answer now with the information I have.\nFinal Answer:"
+        _, answer = split_thinking(self._generate_step(self.build_prompt(conversation, question, scratchpad), deadline))
+        stats["budget_exhausted"] = True
+        return answer.strip(), self._finish(stats, start)
+
+    def _generate_step(self, prompt, deadline):
+        """Generate one step, letting a model that is still thinking continue where it stopped"""
+        output = self.generate(self.model, prompt)
+        for _ in range(MAX_THINKING_CONTINUATIONS):
+            if not thinking_unclosed(output) or time.time() >= deadline:
+                break
+            output += self.generate(self.model, prompt + output)
+        return output
+
+    def _finish(self, stats, start):
+        """Complete the stats of a run"""
+        stats["cache_hits"] = self.executor.cache_hits - stats.pop("cache_hits_before")
+        stats["total_time"] = round(time.time() - start, 2)
+        return stats
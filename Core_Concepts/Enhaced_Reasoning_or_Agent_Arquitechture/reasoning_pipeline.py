@@ -0,0 +1,300 @@
+#NOTE - The 2 stage scripts run the thinking to the end (512 tokens, not streamed) and only
+#then start the answer, so we wait for two full generations. This pipeline gives them
+#other modes so we can compare:
+#   "sequential" -> the original: think fully, then answer
+#   "early"      -> stream the thinking and stop it as soon as it reaches a conclusion
+#                   (or </think> for reasoning models), then start the answer right away
+#   "race"       -> answer directly AND think at the same time, use the reasoned answer
+#                   if the thinking is done before a deadline, otherwise the direct one
+#Every turn writes its latency numbers to a JSONL file, run this file to compare modes.
+
+import json
+import os
+import queue
+import threading
+import time
+import requests
+
+API_ENDPOINT = "http://localhost:11434/api/generate"
+
+MODE_SEQUENTIAL = "sequential"
+MODE_EARLY = "early"
+MODE_RACE = "race"
+MODES = [MODE_SEQUENTIAL, MODE_EARLY, MODE_RACE]
+
+THINKING_TOKENS = 512  # Thinking budget of the original scripts
+EARLY_THINKING_TOKENS = 256  # Max thinking budget for the early-stop mode
+RACE_DEADLINE = 8.0  # Seconds the thinking gets before the direct answer wins
+
+# Phrases that show the thinking reached its conclusion
+# Only unambiguous final-answer cues - "therefore," also starts intermediate steps
+CONCLUSION_MARKERS = ["in conclusion", "to summarize", "in summary", "final answer", "so the answer is"]
+
+METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reasoning_metrics.jsonl")
+
+
+class TokenStream:
+    """Streaming generation from Ollama that can be closed early (which stops the model)"""
+    def __init__(self, model, prompt, num_predict=512):
+        self.response = requests.post(
+            API_ENDPOINT,
+            json={
+                "model": model,
+                "prompt": prompt,
+                "stream": True,
+                "options": {
+                    "num_predict": num_predict
+                }
+            },
+            stream=True
+        )
+        self.closed = False
+        self.token_count = 0
+
+    def __iter__(self):
+        try:
+            for line in self.response.iter_lines():
+                if self.closed:
+                    return
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("done", False):
+                    return
+                self.token_count += 1
+                yield chunk.get("response", "")
+        except Exception:
+            # Closing the stream from another thread ends up here
+            if not self.closed:
+                raise
+
+    def close(self):
+        self.closed = True
+        try:
+            self.response.close()
+        except Exception:
+            pass
+
+
+def reached_conclusion(thinking):
+    """Stopping criterion: the thinking concluded and finished that sentence/paragraph"""
+    lower = thinking.lower()
+    for marker in CONCLUSION_MARKERS:
+        position = lower.rfind(marker)
+        if position == -1:
+            continue
+        # Let it finish the concluding sentence before stopping
+        tail = thinking[position + len(marker):]
+        if "\n\n" in tail or any(tail.rstrip().endswith(p) for p in ".!?"):
+            return True
+    return False
+
+
+def stream_thinking(model, think_prompt, max_tokens, early_stop=True, cancel_event=None):
+    """Stream the thinking stage, stopping at </think>, a conclusion or the token budget"""
+    stream = TokenStream(model, think_prompt, num_predict=max_tokens)
+    thinking = ""
+    stopped_early = False
+    try:
+        for token in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            thinking += token
+            if not early_stop:
+                continue
+
+            # Reasoning models close their own thinking - everything after is an answer
+            if "</think>" in thinking:
+                thinking = thinking.split("</think>")[0]
+                stopped_early = True
+                break
+            if reached_conclusion(thinking):
+                stopped_early = True
+                break
+    finally:
+        stream.close()
+
+    thinking = thinking.replace("<think>", "").strip()
+    return thinking, stream.token_count, stopped_early
+
+
+def stream_answer(model, prompt, on_token=None, metrics=None, turn_start=None, cancel_event=None):
+    """Stream an answer, recording time to first token"""
+    stream = TokenStream(model, prompt)
+    answer = ""
+    try:
+        for token in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if not answer and metrics is not None and turn_start is not None:
+                metrics["answer_ttft"] = round(time.time() - turn_start, 3)
+            answer += token
+            if on_token:
+                on_token(token)
+    finally:
+        stream.close()
+    if metrics is not None:
+        metrics["answer_tokens"] = stream.token_count
+    return answer
+
+
+def run_reasoning(model, think_prompt, build_answer_prompt, direct_prompt=None, mode=MODE_EARLY,
+                  on_token=None, metrics_file=METRICS_FILE):
+    """
+    Run one turn of two-stage reasoning in the given mode.
+    build_answer_prompt(thinking) builds the answer prompt from the thinking,
+    direct_prompt is the plain conversation prompt used by the race mode.
+    Returns (answer, metrics).
+    """
+    turn_start = time.time()
+    metrics = {"mode": mode, "model": model, "timestamp": turn_start}
+
+    if mode == MODE_RACE and direct_prompt is not None:
+        answer = _run_race(model, think_prompt, build_answer_prompt, direct_prompt, on_token, metrics, turn_start)
+    else:
+        max_tokens = THINKING_TOKENS if mode == MODE_SEQUENTIAL else EARLY_THINKING_TOKENS
+        thinking, thinking_tokens, stopped_early = stream_thinking(
+            model, think_prompt, max_tokens, early_stop=(mode != MODE_SEQUENTIAL)
+        )
+        metrics["think_time"] = round(time.time() - turn_start, 3)
+        metrics["thinking_tokens"] = thinking_tokens
+        metrics["stopped_early"] = stopped_early
+        metrics["chosen"] = "reasoned"
+        answer = stream_answer(model, build_answer_prompt(thinking), on_token, metrics, turn_start)
+
+    metrics["total_time"] = round(time.time() - turn_start, 3)
+    save_metrics(metrics, metrics_file)
+    return answer, metrics
+
+
+def _run_race(model, think_prompt, build_answer_prompt, direct_prompt, on_token, metrics, turn_start):
+    """Think and answer directly at the same time, keep whichever is ready in time"""
+    # Direct tokens are held back until the direct answer wins, then streamed as they arrive
+    direct_tokens = queue.Queue()
+    direct_metrics = {}
+    direct_cancel = threading.Event()
+    think_cancel = threading.Event()
+
+    def direct_worker():
+        try:
+            stream_answer(model, direct_prompt, direct_tokens.put, direct_metrics, turn_start, direct_cancel)
+        finally:
+            direct_tokens.put(None)  # End of the direct answer
+
+    direct_thread = threading.Thread(target=direct_worker, daemon=True)
+    direct_thread.start()
+
+    thinking_result = {}
+
+    def think_worker():
+        thinking_result["value"] = stream_thinking(
+            model, think_prompt, EARLY_THINKING_TOKENS, cancel_event=think_cancel
+        )
+
+    think_thread = threading.Thread(target=think_worker, daemon=True)
+    think_thread.start()
+    think_thread.join(timeout=RACE_DEADLINE)
+
+    if "value" in thinking_result:
+        # Thinking made the deadline - the reasoned answer wins
+        direct_cancel.set()
+        thinking, thinking_tokens, stopped_early = thinking_result["value"]
+        metrics["think_time"] = round(time.time() - turn_start, 3)
+        metrics["thinking_tokens"] = thinking_tokens
+        metrics["stopped_early"] = stopped_early
+        metrics["chosen"] = "reasoned"
+        return stream_answer(model, build_answer_prompt(thinking), on_token, metrics, turn_start)
+
+    # Too slow - stop thinking and stream the direct answer (what it has so far, then the rest)
+    think_cancel.set()
+    metrics["chosen"] = "direct"
+    answer = ""
+    while True:
+        token = direct_tokens.get()
+        if token is None:
+            break
+        if not answer:
+            # When the user sees the first token - the direct answer may have started before the deadline
+            metrics["answer_ttft"] = round(time.time() - turn_start, 3)
+            if "answer_ttft" in direct_metrics:
+                metrics["direct_ttft"] = direct_metrics["answer_ttft"]
+        answer += token
+        if on_token:
+            on_token(token)
+    metrics["answer_tokens"] = direct_metrics.get("answer_tokens", 0)
+    return answer
+
+
+def save_metrics(metrics, metrics_file=METRICS_FILE):
+    """Append one turn's metrics to the JSONL file"""
+    if not metrics_file:
+        return
+    try:
+        with open(metrics_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(metrics) + "\n")
+    except OSError as e:
+        print(f"Could not save reasoning metrics: {e}")
+
+
+def summarize_metrics(metrics_file=METRICS_FILE):
+    """Print average latency per mode from the metrics file"""
+    if not os.path.exists(metrics_file):
+        print("No reasoning metrics recorded yet")
+        return {}
+
+    by_mode = {}
+    with open(metrics_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                by_mode.setdefault(entry["mode"], []).append(entry)
+
+    summary = {}
+    print(f"{'mode':<12}{'turns':>6}{'ttft(s)':>10}{'total(s)':>10}{'think tok':>11}{'reasoned':>10}")
+    for mode, entries in by_mode.items():
+        def average(key):
+            values = [e[key] for e in entries if key in e]
+            return sum(values) / len(values) if values else 0.0
+        reasoned = sum(1 for e in entries if e.get("chosen") == "reasoned") / len(entries)
+        summary[mode] = {
+            "turns": len(entries),
+            "answer_ttft": average("answer_ttft"),
+            "total_time": average("total_time"),
+            "thinking_tokens": average("thinking_tokens"),
+            "reasoned_ratio": reasoned,
+        }
+        print(f"{mode:<12}{len(entries):>6}{summary[mode]['answer_ttft']:>10.2f}{summary[mode]['total_time']:>10.2f}"
+              f"{summary[mode]['thinking_tokens']:>11.0f}{reasoned:>10.0%}")
+    return summary
+
+
+# Compare the modes on a few questions
+if __name__ == "__main__":
+    MODEL = "llama3.1:8b"
+    questions = [
+        "Why is the sky blue?",
+        "What is heavier, a kilo of feathers or a kilo of steel?",
+        "How would you plan a three day trip to Mexico City?",
+    ]
+
+    for mode in MODES:
+        for question in questions:
+            think_prompt = (
+                "<|im_start|>system\nYou are an AI assistant. Think deeply about this question. "
+                "This is just your internal thinking process.\n<|im_end|>\n"
+                f"<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+            )
+            direct_prompt = f"<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+
+            def build_answer_prompt(thinking, question=question):
+                return (
+                    f"<|im_start|>user\n{question}<|im_end|>\n"
+                    "<|im_start|>system\nBelow is your detailed thinking about the user's question. "
+                    f"Use this analysis to provide a clear, concise, and helpful answer.\n\n{thinking}\n<|im_end|>\n"
+                    "<|im_start|>assistant\n"
+                )
+
+            _, metrics = run_reasoning(MODEL, think_prompt, build_answer_prompt, direct_prompt, mode=mode)
+            print(f"[{mode}] {question} -> ttft {metrics.get('answer_ttft')}s, total {metrics['total_time']}s")
+
+    summarize_metrics()
@@ -0,0 +1,61 @@
+from react_loop import ReActAgent, ToolRegistry, after_thinking
+
+
+def make_registry(calls):
+    registry = ToolRegistry()
+
+    @registry.register("calculator", "evaluates an arithmetic expression")
+    def calculator(expression):
+        calls.append(expression)
+        return eval(expression, {"__builtins__": {}})
+
+    return registry
+
+
+def scripted(outputs, prompts):
+    """generate_func returning the given outputs in order"""
+    def generate(model, prompt):
+        prompts.append(prompt)
+        return outputs.pop(0)
+    return generate
+
+
+def test_observation_inside_unclosed_thinking_is_not_an_answer():
+    calls, prompts = [], []
+    outputs = [
+        # Out of tokens while thinking, with a hypothetical observation and action in it
+        "<think>I could use the calculator.\nAction: calculator[2+2]\nObservation: 4\nSo",
+        " I'll really call it.</think>\nThought: compute it\nAction: calculator[2+2]",
+        "Thought: I know the answer\nFinal Answer: 4",
+    ]
+    agent = ReActAgent("qwq:latest", registry=make_registry(calls),
+                       generate_func=scripted(outputs, prompts), verbose=False)
+
+    answer, stats = agent.run("", "What is 2+2?")
+
+    assert answer == "4"
+    assert calls == ["2+2"]  # Only the action after </think> ran
+    assert stats["tool_calls"] == 1
+    # The continuation picked up where the unclosed thinking stopped
+    assert prompts[1].endswith("Observation: 4\nSo")
+    # No thinking in the scratchpad of the next step
+    assert "<think>" not in prompts[2].split("<|im_start|>assistant\n")[-1]
+
+
+def test_never_closed_thinking_forces_the_answer():
+    calls, prompts = [], []
+    outputs = ["<think>Observation: maybe"] * 4 + ["Final answer text"]
+    agent = ReActAgent("qwq:latest", registry=make_registry(calls),
+                       generate_func=scripted(outputs, prompts), verbose=False)
+
+    answer, stats = agent.run("", "What is 2+2?")
+
+    assert answer == "Final answer text"
+    assert calls == []
+    assert stats["budget_exhausted"]
+
+
+def test_after_thinking():
+    assert after_thinking("<think>Observation: x") == ""
+    assert after_thinking("<think>a</think>Action: b[]\nObservation:") == "Action: b[]\nObservation:"
+    assert after_thinking("Action: b[]") == "Action: b[]"
@@ -0,0 +1,174 @@
+#NOTE - The V3 agent forgets its thinking every turn, but putting every full thought back
+#in the prompt would make it grow without limit. The store keeps the full thinking of
+#each turn compressed on disk (zlib) and only a short distilled summary goes into the
+#prompt. A budget decides how many past thoughts are injected, the most relevant and
+#most recent ones first.
+
+import json
+import os
+import re
+import time
+import zlib
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thought_store")
+
+SUMMARY_WORDS = 40  # Max words of a distilled summary
+PROMPT_TOKEN_BUDGET = 300  # Max tokens of past thoughts injected in the prompt
+MAX_THOUGHTS = 4  # Never inject more than this many past thoughts
+
+# Sentences with these phrases usually hold the outcome of the thinking
+CONCLUSION_MARKERS = ["in conclusion", "to summarize", "in summary", "so the answer", "therefore", "overall", "the user wants", "the user is asking"]
+
+STOPWORDS = {"the", "a", "an", "and", "or", "is", "are", "was", "were", "to", "of", "in", "on", "for",
+             "it", "that", "this", "with", "as", "be", "i", "you", "me", "my", "your", "what", "how", "why", "do"}
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def keywords(text):
+    """Lowercase content words of a text"""
+    return {word for word in re.findall(r"[a-z0-9']+", text.lower()) if word not in STOPWORDS and len(word) > 2}
+
+
+def distill(thinking, max_words=SUMMARY_WORDS):
+    """Short extractive summary: the conclusion of the thinking plus its opening sentence"""
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', thinking.replace("\n", " ")) if s.strip()]
+    if not sentences:
+        return ""
+
+    picked = [sentences[0]]
+    for sentence in reversed(sentences[1:]):
+        if any(marker in sentence.lower() for marker in CONCLUSION_MARKERS):
+            picked.append(sentence)
+            break
+    else:
+        if len(sentences) > 1:
+            picked.append(sentences[-1])
+
+    words = " ".join(picked).split()
+    summary = " ".join(words[:max_words])
+    if len(words) > max_words:
+        summary += "..."
+    return summary
+
+
+class ThoughtStore:
+    """
+    Thinking traces of a conversation.
+    Full thoughts are zlib-compressed files, the index (one JSON line per
+    thought) holds the question, the summary and the sizes.
+    """
+    def __init__(self, store_dir=STORE_DIR, summarize=None):
+        self.store_dir = store_dir
+        self.index_file = os.path.join(store_dir, "index.jsonl")
+        # Optional function(thinking) -> summary, e.g. an LLM call. Defaults to distill()
+        self.summarize = summarize or distill
+        os.makedirs(store_dir, exist_ok=True)
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        """Read the index of stored thoughts"""
+        entries = []
+        if os.path.exists(self.index_file):
+            with open(self.index_file, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entries.append(json.loads(line))
+        return entries
+
+    def add(self, question, thinking):
+        """Store the thinking of one turn, returns its index entry"""
+        thought_id = len(self.entries) + 1
+        raw = thinking.encode("utf-8")
+        compressed = zlib.compress(raw, 9)
+        with open(self._thought_path(thought_id), "wb") as f:
+            f.write(compressed)
+
+        summary = self.summarize(thinking)
+        entry = {
+            "id": thought_id,
+            "timestamp": time.time(),
+            "question": question,
+            "summary": summary,
+            "summary_tokens": estimate_tokens(summary),
+            "raw_bytes": len(raw),
+            "compressed_bytes": len(compressed),
+        }
+        with open(self.index_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.entries.append(entry)
+        return entry
+
+    def _thought_path(self, thought_id):
+        """File holding one compressed thought"""
+        return os.path.join(self.store_dir, f"thought_{thought_id:05d}.zlib")
+
+    def load_thought(self, thought_id):
+        """Get the full text of a stored thought"""
+        with open(self._thought_path(thought_id), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def select(self, question, token_budget=PROMPT_TOKEN_BUDGET, max_thoughts=MAX_THOUGHTS):
+        """
+        Injection policy: rank past thoughts by relevance to the question (shared
+        keywords) and recency, then take summaries while they fit the token budget.
+        The chosen thoughts are returned in conversation order.
+        """
+        if not self.entries or token_budget <= 0:
+            return []
+
+        question_words = keywords(question)
+        count = len(self.entries)
+
+        def score(position, entry):
+            overlap = len(question_words & keywords(entry["question"] + " " + entry["summary"]))
+            recency = (position + 1) / count  # 1.0 for the latest thought
+            return overlap + recency
+
+        ranked = sorted(enumerate(self.entries), key=lambda item: score(*item), reverse=True)
+
+        chosen = []
+        used = 0
+        for position, entry in ranked:
+            if len(chosen) >= max_thoughts:
+                break
+            if used + entry["summary_tokens"] > token_budget:
+                continue
+            chosen.append(entry)
+            used += entry["summary_tokens"]
+        return sorted(chosen, key=lambda e: e["id"])
+
+    def format_for_prompt(self, entries):
+        """System message with the summaries of the chosen thoughts"""
+        if not entries:
+            return ""
+        lines = [f"- About \"{e['question']}\": {e['summary']}" for e in entries]
+        return (
+            "<|im_start|>system\nSummaries of your thinking in earlier turns of this conversation:\n"
+            + "\n".join(lines)
+            + "\n<|im_end|>\n"
+        )
+
+    def stats(self):
+        """Storage numbers of the store"""
+        raw = sum(e["raw_bytes"] for e in self.entries)
+        compressed = sum(e["compressed_bytes"] for e in self.entries)
+        return {
+            "thoughts": len(self.entries),
+            "raw_bytes": raw,
+            "compressed_bytes": compressed,
+            "ratio": round(raw / compressed, 2) if compressed else 0.0,
+        }
+
+    def clear(self):
+        """Delete every stored thought"""
+        for entry in self.entries:
+            path = self._thought_path(entry["id"])
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+        self.entries = []
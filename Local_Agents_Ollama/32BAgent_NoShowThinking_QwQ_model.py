@@ -1,27 +1,30 @@
 import requests
-import time
-import re
+import json
+import os
+import sys
+
+# The reasoning pipeline lives with the Enhanced Reasoning scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Core_Concepts", "Enhaced_Reasoning_or_Agent_Arquitechture"))
+from reasoning_pipeline import run_reasoning, MODE_SEQUENTIAL, MODE_EARLY
+# Streaming <think> tag filter shared with the voice agent
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "My_Projects", "AI_Agent_with_Voice"))
+from think_filter import ThinkTagFilter
 
 # Model configuration
 MODEL = "deepseek-r1:32b"
 SHOW_THINKING = False
+PIPELINE_MODE = MODE_EARLY  # Stops the thinking stage at </think> instead of running all 512 tokens
 
-def remove_thinking(text, show_thinking=SHOW_THINKING):
-    """Remove thinking tags only if show_thinking is False"""
-    if not show_thinking:
-        # Remove anything between <think> and </think> tags
-        cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-    else:
-        # Keep thinking but make it visually distinct
-        cleaned = text.replace('<think>', '\n--- THINKING ---\n').replace('</think>', '\n--- END THINKING ---\n')
-    # Always trim leading whitespace
-    cleaned = cleaned.lstrip()
-    return cleaned
+def print_token(text):
+    """Print streamed text as soon as it arrives"""
+    print(text, end="", flush=True)
 
-def thinking_cycle(memory, new_question):
-    """This gets the full conversation history and the new question and makes the LLM think about it"""
-    
-    # Format the full conversation history first
+def streaming_filter(show_thinking=SHOW_THINKING):
+    """Filter that prints answer tokens right away (and the thinking if show_thinking)"""
+    return ThinkTagFilter(on_answer=print_token, on_thinking=print_token if show_thinking else None)
+
+def format_memory(memory):
+    """Format the conversation history"""
     formatted_conversation = ""
     for item in memory:
         if "system" in item:
@@ -30,6 +33,13 @@ def thinking_cycle(memory, new_question):
             formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
         elif "agent" in item:
             formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
+    return formatted_conversation
+
+def build_thinking_prompt(memory, new_question):
+    """Prompt that makes the LLM think about the new question in the context of the conversation"""
+    
+    # Format the full conversation history first
+    formatted_conversation = format_memory(memory)
     
     # Add the new question
     formatted_conversation += f"<|im_start|>user\n{new_question}<|im_end|>\n"
@@ -37,6 +47,21 @@ def thinking_cycle(memory, new_question):
     # Add specific thinking instructions
     formatted_conversation += f"<|im_start|>system\nThink deeply about the user's latest question in the context of the entire conversation. Consider all relevant information from previous exchanges.\n<|im_end|>\n"
     formatted_conversation += "<|im_start|>assistant\n"
+    return formatted_conversation
+
+def build_answer_prompt(memory, thinking):
+    """Prompt with the conversation plus the thinking, used for the final answer"""
+    formatted_conversation = format_memory(memory)
+
+    # Add the thinking as system context
+    formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
+    formatted_conversation += "<|im_start|>assistant\n"
+    return formatted_conversation
+
+def thinking_cycle(memory, new_question):
+    """This gets the full conversation history and the new question and makes the LLM think about it"""
+    
+    formatted_conversation = build_thinking_prompt(memory, new_question)
 
     model_id = MODEL
     api_endpoint = "http://localhost:11434/api/generate"
@@ -62,52 +87,63 @@ def thinking_cycle(memory, new_question):
 def simple_agent(memory, thinking):
     """It takes the thought plus the question and gives back an answer"""
 
-    formatted_conversation = ""
-
-    for item in memory:
-        if "system" in item:
-            formatted_conversation += item["system"]
-        elif "user" in item:
-            formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
-        elif "agent" in item:
-            formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
-
-    # Add the thinking as system context
-    formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
-    formatted_conversation += "<|im_start|>assistant\n"
+    formatted_conversation = build_answer_prompt(memory, thinking)
 
     # Model name should match exactly as shown in 'ollama list'
     model_id = MODEL
     api_endpoint = "http://localhost:11434/api/generate"
 
-    # Get the complete response first (non-streaming)
+    print("\nAI:\n", end="", flush=True)
+
+    # Stream the response - answer tokens are printed as they arrive, the thinking is filtered out
+    think_filter = streaming_filter()
     response = requests.post(
         api_endpoint,
         json={
             "model": model_id,
             "prompt": formatted_conversation,
-            "stream": False,
+            "stream": True,
             "options": {
                 "num_predict": 512
             }
-        }
+        },
+        stream=True
     )
-    
-    # Extract the full response
-    result = response.json()
-    full_response = result["response"]
-    
-    # Clean the response by removing thinking tags and leading whitespace
-    cleaned_response = remove_thinking(full_response)
-    
+    with response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            think_filter.feed(chunk.get("response", ""))
+            if chunk.get("done", False):
+                break
+    think_filter.flush()
+    print("\n")
+
+    # Return the cleaned response for storage in memory
+    return think_filter.answer
+
+def pipeline_agent(memory, question):
+    """Streamed thinking that stops at </think>, then the answer (see reasoning_pipeline.py)"""
+    think_prompt = build_thinking_prompt(memory, question)
+    memory.append({"user": question})
+
     print("\nAI:\n", end="", flush=True)
 
-    for char in cleaned_response:
-        print(char, end="", flush=True)
-        time.sleep(0.03)
+    # The answer is printed as it streams, without its thinking section
+    think_filter = streaming_filter()
+    full_response, metrics = run_reasoning(
+        MODEL,
+        think_prompt,
+        lambda thinking: build_answer_prompt(memory, thinking),
+        direct_prompt=format_memory(memory) + "<|im_start|>assistant\n",
+        mode=PIPELINE_MODE,
+        on_token=think_filter.feed
+    )
+    think_filter.flush()
     print("\n")
-    # Return the cleaned response for storage in memory
-    return cleaned_response
+    print(f"[{metrics['mode']}] answer ready after {metrics['total_time']}s\n")
+    return think_filter.answer
 
 # Main system message
 system_message = """<|im_start|>system
@@ -128,6 +164,11 @@ def main():
             chatting = False
             break
             
+        if PIPELINE_MODE != MODE_SEQUENTIAL:
+            response = pipeline_agent(memory, question)
+            memory.append({"agent": response})
+            continue
+
         # First, get the AI's thinking on the question
         thinking = thinking_cycle(memory, question)
         memory.append({"user": question})
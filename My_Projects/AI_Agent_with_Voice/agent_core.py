@@ -0,0 +1,323 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from request_scheduler import PRIORITY_INTERACTIVE
+from metrics import metrics
+
+class AsyncOllamaClient:
+    """
+    Minimal asyncio HTTP client for Ollama's streaming API.
+    Built on asyncio streams so no extra dependency is needed. Cancelling the
+    task that is reading a stream closes the socket, which stops Ollama.
+    An optional ResponseCache returns deterministic requests (temperature 0
+    or seeded) instantly when the same request was answered before.
+    """
+    def __init__(self, base_url="http://localhost:11434", connect_timeout=5.0, cache=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self.connect_timeout = connect_timeout
+        self.cache = cache
+        self.keep_alive = {}  # model -> keep_alive sent when a request doesn't give one
+
+    async def _request_stream(self, path, payload=None, method="POST"):
+        """Send a request (JSON payload for POST) and yield each JSON line of the streamed reply"""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            self.connect_timeout
+        )
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+            request = (
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n"
+                "\r\n"
+            ).encode("latin-1") + body
+            writer.write(request)
+            await writer.drain()
+
+            # Status line and headers
+            status_line = await reader.readline()
+            status = int(status_line.split(b" ", 2)[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            if status != 200:
+                error_body = await reader.read()
+                raise RuntimeError(f"Ollama returned HTTP {status}: {error_body[:200].decode('utf-8', 'replace')}")
+
+            # Split the body into JSON lines
+            chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+            buffer = b""
+            async for data in self._iter_body(reader, chunked):
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    if line.strip():
+                        yield json.loads(line)
+            if buffer.strip():
+                yield json.loads(buffer)
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _iter_body(reader, chunked):
+        """Yield the raw body, decoding chunked transfer encoding if needed"""
+        if not chunked:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                yield data
+
+        while True:
+            size_line = await reader.readline()
+            if not size_line:
+                return
+            size = int(size_line.split(b";")[0].strip(), 16)
+            if size == 0:
+                return
+            data = await reader.readexactly(size)
+            await reader.readline()  # CRLF after each chunk
+            yield data
+
+    async def stream_generate(self, model, prompt, options=None, keep_alive=None):
+        """Stream the text of a generation token by token"""
+        if self.cache is not None:
+            cached = self.cache.get(model, prompt, options)
+            if cached is not None:
+                metrics.inc("model.response_cache_hits")
+                yield cached
+                return
+        
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+        if keep_alive is None:
+            keep_alive = self.keep_alive.get(model)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+
+        text_so_far = ""
+        async for chunk in self._request_stream("/api/generate", payload):
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            text = chunk.get("response", "")
+            if text:
+                text_so_far += text
+                yield text
+            if chunk.get("done", False):
+                # Only complete responses are cached (a cancelled stream never gets here)
+                if self.cache is not None:
+                    self.cache.put(model, prompt, options, text_so_far)
+                return
+
+    async def load_model(self, model, keep_alive=None):
+        """Load a model without generating (keep_alive=0 unloads it instead)"""
+        payload = {"model": model}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        async for chunk in self._request_stream("/api/generate", payload):
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            if chunk.get("done", False):
+                return
+    
+    async def get_json(self, path):
+        """GET a JSON document (e.g. /api/ps)"""
+        documents = self._request_stream(path, method="GET")
+        try:
+            async for document in documents:
+                return document
+        finally:
+            await documents.aclose()
+        return {}
+    
+    async def generate(self, model, prompt, options=None, keep_alive=None):
+        """Generate the full text of a reply"""
+        text = ""
+        async for token in self.stream_generate(model, prompt, options, keep_alive):
+            text += token
+        return text
+
+
+class AgentCore:
+    """
+    Asyncio core shared by the GUI and the CLI agents.
+
+    The event loop runs in a dedicated thread beside Tk. Work is organised in
+    stages ("think", "answer", "tts") and each stage has a concurrency limit
+    and a timeout, so cancellation and load are handled in one place instead
+    of by one thread per request.
+    """
+    def __init__(self, client=None, limits=None, timeouts=None, blocking_workers=2, scheduler=None):
+        self.client = client or AsyncOllamaClient()
+        # Optional RequestScheduler shared by many sessions (server slots and priorities)
+        self.scheduler = scheduler
+
+        # How many tasks may run at once in each stage
+        self.limits = {"think": 1, "answer": 1, "tts": 1}
+        if limits:
+            self.limits.update(limits)
+
+        # Seconds before a stage gives up ("first_token" applies to every stream)
+        self.timeouts = {"think": 120.0, "answer": 300.0, "tts": 60.0, "first_token": 60.0}
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        # Bounded pool for blocking work (e.g. speech synthesis)
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="agent-core-blocking")
+
+        self.loop = None
+        self.thread = None
+        self.semaphores = {}
+        self.ready = threading.Event()
+
+    def start(self):
+        """Start the event loop thread"""
+        if self.thread and self.thread.is_alive():
+            return self
+        self.thread = threading.Thread(target=self._run_loop, name="agent-core", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def _run_loop(self):
+        """Event loop thread"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # Semaphores belong to the loop, so they are created here
+        self.semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.limits.items()}
+        self.ready.set()
+        self.loop.run_forever()
+
+    def stop(self):
+        """Cancel everything still running and stop the loop"""
+        if not self.loop:
+            return
+
+        def _shutdown():
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.stop()
+
+        self.loop.call_soon_threadsafe(_shutdown)
+        self.executor.shutdown(wait=False)
+
+    def submit(self, coro):
+        """Run a coroutine on the core from any thread, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _semaphore(self, stage):
+        """Get the semaphore of a stage, creating one for unknown stages"""
+        if stage not in self.semaphores:
+            self.semaphores[stage] = asyncio.Semaphore(self.limits.get(stage, 1))
+        return self.semaphores[stage]
+
+    async def run_stage(self, stage, coro, timeout=None):
+        """Run a coroutine within a stage's concurrency limit and timeout"""
+        async with self._semaphore(stage):
+            return await asyncio.wait_for(coro, timeout or self.timeouts.get(stage))
+
+    async def run_blocking(self, stage, func, *args, timeout=None):
+        """Run a blocking function in the bounded executor within a stage"""
+        # Submit only once the stage has room, so its limit also bounds the executor work
+        async with self._semaphore(stage):
+            future = self.loop.run_in_executor(self.executor, func, *args)
+            return await asyncio.wait_for(future, timeout or self.timeouts.get(stage))
+
+    async def stream(self, stage, model, prompt, options=None, on_token=None, timeout=None, keep_alive=None,
+                     priority=PRIORITY_INTERACTIVE):
+        """Stream a generation within a stage, with a first-token and a total timeout"""
+        async def consume():
+            text = ""
+            count = 0
+            request_start = time.perf_counter()
+            tokens = self.client.stream_generate(model, prompt, options, keep_alive).__aiter__()
+            token_timeout = self.timeouts.get("first_token")
+            try:
+                while True:
+                    try:
+                        token = await asyncio.wait_for(tokens.__anext__(), token_timeout)
+                    except StopAsyncIteration:
+                        break
+                    if not count:
+                        metrics.observe("model.ttft_ms", (time.perf_counter() - request_start) * 1000)
+                    token_timeout = None  # Only the first token has its own deadline
+                    count += 1
+                    text += token
+                    if on_token:
+                        on_token(token)
+            finally:
+                metrics.inc("model.tokens", count)
+                await tokens.aclose()
+            metrics.observe(f"model.{stage}_ms", (time.perf_counter() - request_start) * 1000)
+            return text
+
+        metrics.inc("model.requests")
+        try:
+            if self.scheduler is None:
+                return await self.run_stage(stage, consume(), timeout)
+
+            # Wait for a server slot first - the timeouts only start once the request is sent
+            cost = (options or {}).get("num_predict", 512) + len(prompt) // 4
+            async with self.scheduler.slot(priority, cost):
+                return await self.run_stage(stage, consume(), timeout)
+        except Exception:
+            metrics.inc("model.errors")  # Timeouts included, cancellation is not an error
+            raise
+
+    async def two_stage(self, model, think_prompt, build_answer_prompt, on_token=None, options=None):
+        """Think first, then answer using the thinking (the two-stage reasoning pattern)"""
+        thinking = await self.stream("think", model, think_prompt, options)
+        answer = await self.stream("answer", model, build_answer_prompt(thinking), options, on_token=on_token)
+        return thinking, answer
+
+
+# Simple CLI agent running on the core
+if __name__ == "__main__":
+    import sys
+    from model import ChatbotModel, GenerationError
+    from response_cache import ResponseCache
+
+    # --replay: seeded generations, identical conversations are answered from the cache
+    replay = "--replay" in sys.argv
+    core = AgentCore(AsyncOllamaClient(cache=ResponseCache() if replay else None)).start()
+    chatbot = ChatbotModel()
+    if replay:
+        chatbot.options["seed"] = 42
+
+    print(f"Chatting with {chatbot.model_name} (type 'bye' to exit)")
+    while True:
+        question = input("You:\n")
+        if question.lower() in ["bye", "exit", "quit"]:
+            print("\nAI:\nThanks for the conversation! 🌮\n")
+            break
+
+        chatbot.add_to_memory("user", question)
+        print("\nAI:\n", end="", flush=True)
+        future = core.submit(chatbot.agenerate_response(core, on_token=lambda t: print(t, end="", flush=True)))
+        try:
+            response = future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            response = ""
+        except GenerationError as e:
+            print(f"\nError: {e}\n")
+            chatbot.memory.pop()  # Ask again later without the failed turn
+            continue
+        print("\n")
+        chatbot.add_to_memory("agent", response)
+
+    core.stop()
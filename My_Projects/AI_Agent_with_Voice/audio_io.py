@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+import wave
+import numpy as np
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # No PortAudio (e.g. a headless server) - only the virtual backend can be used
+    sd = None
+
+class SoundDeviceBackend:
+    """The real sound card, through sounddevice"""
+    def play(self, audio, samplerate):
+        sd.play(audio, samplerate)
+
+    def wait(self):
+        sd.wait()
+
+    def stop(self):
+        sd.stop()
+
+    def rec(self, frames, samplerate, channels=1, dtype="float32"):
+        return sd.rec(frames, samplerate=samplerate, channels=channels, dtype=dtype)
+
+    def query_devices(self, device=None, kind=None):
+        return sd.query_devices(device, kind)
+
+    def default_input_device(self):
+        return sd.default.device[0]
+
+    def input_stream(self, samplerate, blocksize, callback, device=None, channels=1, dtype="int16"):
+        """Raw microphone stream calling callback(indata, frames, time_info, status)"""
+        if device is not None:
+            return sd.RawInputStream(samplerate=samplerate, blocksize=blocksize, channels=channels,
+                                     dtype=dtype, callback=callback, device=device)
+        return sd.RawInputStream(samplerate=samplerate, blocksize=blocksize, channels=channels,
+                                 dtype=dtype, callback=callback)
+
+    def time(self):
+        """Clock of the audio stream"""
+        return time.time()
+
+
+def read_wav(path, sample_rate=None):
+    """Mono float32 samples of a WAV file, resampled to sample_rate if given"""
+    with wave.open(path, "rb") as f:
+        rate = f.getframerate()
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        data = f.readframes(f.getnframes())
+    if width == 1:
+        audio = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        audio = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
+    elif width == 4:
+        audio = np.frombuffer(data, dtype=np.int32).astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width in {path}: {width} bytes")
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return resample(audio, rate, sample_rate or rate), sample_rate or rate
+
+
+def resample(audio, rate, target_rate):
+    """Linear resampling (good enough for speech recognition tests)"""
+    if rate == target_rate or len(audio) == 0:
+        return audio.astype(np.float32)
+    positions = np.arange(int(len(audio) * target_rate / rate)) * rate / target_rate
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def write_wav(path, audio, sample_rate):
+    """Write float samples (-1..1) as a 16-bit mono WAV file"""
+    samples = (np.clip(np.asarray(audio, dtype=np.float32).ravel(), -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+class VirtualInputStream:
+    """Microphone stream of a VirtualAudioBackend, fed from its input buffer by a thread"""
+    def __init__(self, backend, samplerate, blocksize, callback, channels=1, dtype="int16"):
+        if channels != 1 or dtype != "int16":
+            raise ValueError("The virtual microphone only produces mono int16 audio")
+        self.backend = backend
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.backend.start_clock(self.samplerate)
+        self.thread = threading.Thread(target=self._run, daemon=True, name="virtual-microphone")
+        self.thread.start()
+
+    def _run(self):
+        block_seconds = self.blocksize / self.samplerate
+        next_block = time.perf_counter()
+        while not self.stop_event.is_set():
+            block = self.backend.next_input_block(self.blocksize, self.samplerate)
+            if block is None:
+                # Nothing left to say - wait for more input instead of spinning on silence
+                self.backend.input_available.wait(0.05)
+                next_block = time.perf_counter()
+                continue
+
+            self.callback(block.tobytes(), self.blocksize, None, None)
+
+            # Pace the blocks like a real device (speed 2 = twice as fast, 0 = as fast as possible)
+            if self.backend.speed > 0:
+                next_block += block_seconds / self.backend.speed
+                delay = next_block - time.perf_counter()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    def close(self):
+        self.stop()
+
+
+class VirtualAudioBackend:
+    """
+    Audio device without hardware, for headless tests and benchmarks.
+
+    The microphone plays back queued input (WAV files or sample arrays), each
+    followed by tail_silence seconds of silence so end-of-speech detection
+    fires, at real-time pace (speed=1), faster (speed>1) or as fast as
+    possible (speed=0). The stream clock (time()) follows the audio, so
+    silence timeouts behave the same at any speed. Everything played is kept
+    in memory (unless keep_output is False) and can be saved as a WAV file.
+    """
+    def __init__(self, input_audio=None, speed=1.0, output_file=None, tail_silence=3.0, keep_output=True):
+        self.speed = speed
+        self.output_file = output_file
+        self.tail_silence = tail_silence
+        self.keep_output = keep_output
+        self.lock = threading.Lock()
+
+        # Microphone side
+        self.pending = []  # (samples float32, sample_rate or None for "any") waiting to be streamed
+        self.current = None  # int16 samples being streamed
+        self.position = 0
+        self.input_available = threading.Event()
+        self.input_done = threading.Event()  # Set when all queued input has been streamed
+        self.input_done.set()
+        self.clock_start = None
+        self.frames_streamed = 0
+        self.clock_rate = 16000
+
+        # Speaker side
+        self.played = []  # (perf_counter time, samples, sample_rate) per play()
+        self.output = []  # (samples, sample_rate)
+        self.playing_until = 0
+        self.stop_event = threading.Event()
+
+        if input_audio is not None:
+            for item in input_audio if isinstance(input_audio, (list, tuple)) else [input_audio]:
+                self.queue_input(item)
+
+    # --- Microphone ---
+
+    def queue_input(self, audio, sample_rate=None):
+        """Queue a WAV path or float samples (-1..1) to be 'spoken' into the microphone"""
+        if isinstance(audio, str):
+            audio, sample_rate = read_wav(audio)
+        audio = np.asarray(audio, dtype=np.float32).ravel()
+        with self.lock:
+            self.pending.append((audio, sample_rate))
+            self.input_done.clear()
+        self.input_available.set()
+
+    def next_input_block(self, frames, samplerate):
+        """Next block of int16 samples for the stream, None when there is no input left"""
+        with self.lock:
+            if self.current is None or self.position >= len(self.current):
+                if not self.pending:
+                    self.current = None
+                    self.input_available.clear()
+                    self.input_done.set()
+                    return None
+                audio, rate = self.pending.pop(0)
+                audio = resample(audio, rate or samplerate, samplerate)
+                silence = np.zeros(int(self.tail_silence * samplerate), dtype=np.float32)
+                self.current = (np.clip(np.concatenate([audio, silence]), -1, 1) * 32767).astype(np.int16)
+                self.position = 0
+            block = self.current[self.position:self.position + frames]
+            self.position += frames
+            self.frames_streamed += frames
+        if len(block) < frames:
+            block = np.concatenate([block, np.zeros(frames - len(block), dtype=np.int16)])
+        return block
+
+    def start_clock(self, samplerate):
+        self.clock_start = time.time()
+        self.frames_streamed = 0
+        self.clock_rate = samplerate
+
+    def time(self):
+        """Stream clock: start time plus the audio streamed so far"""
+        if self.clock_start is None:
+            return time.time()
+        return self.clock_start + self.frames_streamed / self.clock_rate
+
+    def input_stream(self, samplerate, blocksize, callback, device=None, channels=1, dtype="int16"):
+        return VirtualInputStream(self, samplerate, blocksize, callback, channels, dtype)
+
+    def rec(self, frames, samplerate, channels=1, dtype="float32"):
+        """Record frames from the queued input at once"""
+        blocks = []
+        remaining = frames
+        while remaining > 0:
+            block = self.next_input_block(min(remaining, samplerate), samplerate)
+            if block is None:
+                blocks.append(np.zeros(remaining, dtype=np.int16))
+                break
+            blocks.append(block)
+            remaining -= len(block)
+        audio = np.concatenate(blocks)[:frames].astype(np.float32) / 32768
+        return np.repeat(audio[:, None], channels, axis=1).astype(dtype)
+
+    # --- Speaker ---
+
+    def play(self, audio, samplerate):
+        audio = np.asarray(audio, dtype=np.float32)
+        now = time.perf_counter()
+        with self.lock:
+            self.played.append((now, len(audio), samplerate))
+            if self.keep_output:
+                self.output.append((audio, samplerate))
+        self.playing_until = now + (len(audio) / samplerate / self.speed if self.speed > 0 else 0)
+        self.stop_event.clear()
+
+    def wait(self):
+        """Block for as long as the audio would take to play (returns early on stop())"""
+        remaining = self.playing_until - time.perf_counter()
+        if remaining > 0:
+            self.stop_event.wait(remaining)
+
+    def stop(self):
+        self.playing_until = 0
+        self.stop_event.set()
+
+    def save_output(self, path=None):
+        """Write everything played so far into one WAV file, returns the path"""
+        path = path or self.output_file
+        with self.lock:
+            output = list(self.output)
+        if not output:
+            return None
+        rate = output[0][1]
+        write_wav(path, np.concatenate([resample(audio.ravel(), r, rate) for audio, r in output]), rate)
+        return path
+
+    # --- Devices ---
+
+    DEVICES = [
+        {"name": "Virtual Microphone", "index": 0, "max_input_channels": 1, "max_output_channels": 0, "default_samplerate": 16000.0},
+        {"name": "Virtual Speaker", "index": 1, "max_input_channels": 0, "max_output_channels": 1, "default_samplerate": 24000.0},
+    ]
+
+    def query_devices(self, device=None, kind=None):
+        if kind == "input":
+            return self.DEVICES[0]
+        if kind == "output":
+            return self.DEVICES[1]
+        if device is not None:
+            return self.DEVICES[device]
+        return list(self.DEVICES)
+
+    def default_input_device(self):
+        return 0
+
+
+def default_backend():
+    """
+    The audio backend for the app: the sound card, or a virtual device when
+    VOICE_AUDIO_INPUT is set (comma-separated WAV files spoken into the
+    microphone; VOICE_AUDIO_SPEED and VOICE_AUDIO_OUTPUT set the pace and
+    a WAV file for the replies) or sounddevice is not available.
+    """
+    inputs = os.getenv("VOICE_AUDIO_INPUT")
+    if inputs or sd is None:
+        if sd is None:
+            print("sounddevice/PortAudio not available - using the virtual audio device")
+        return VirtualAudioBackend(
+            input_audio=[path.strip() for path in inputs.split(",") if path.strip()] if inputs else None,
+            speed=float(os.getenv("VOICE_AUDIO_SPEED", "1")),
+            output_file=os.getenv("VOICE_AUDIO_OUTPUT")
+        )
+    return SoundDeviceBackend()
+
+
+# Transcribe WAV files through the virtual microphone - recognition timing without hardware
+if __name__ == "__main__":
+    import argparse
+    from speech import SpeechRecognizer
+
+    parser = argparse.ArgumentParser(description="Run WAV files through SpeechRecognizer on the virtual microphone")
+    parser.add_argument("wav", nargs="+")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 4 = four times faster, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    backend = VirtualAudioBackend(input_audio=args.wav, speed=args.speed)
+    recognizer = SpeechRecognizer(audio=backend, default_device_name=None, blocksize=800)
+    start = time.perf_counter()
+
+    def on_speech(text):
+        print(f"[{time.perf_counter() - start:7.2f}s wall, {backend.time() - backend.clock_start:7.2f}s audio] {text}")
+
+    recognizer.start_listening(on_speech)
+    while not backend.input_done.wait(0.1):
+        pass
+    recognizer.stop_listening()
+    print(f"Done in {time.perf_counter() - start:.2f}s for {backend.frames_streamed / recognizer.sample_rate:.2f}s of audio")
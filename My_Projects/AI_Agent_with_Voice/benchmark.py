@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from agent_core import AgentCore, AsyncOllamaClient
+from fake_ollama import FakeOllamaServer
+from model import ChatbotModel
+from request_scheduler import RequestScheduler
+
+# The two-stage reasoning functions live with the Enhanced Reasoning scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Core_Concepts", "Enhaced_Reasoning_or_Agent_Arquitechture"))
+import reasoning_pipeline
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results")
+
+# Scripted conversation - every simulated user goes through these turns
+SCRIPT = [
+    "Hi! Can you help me plan a trip?",
+    "I want to visit Mexico City for three days.",
+    "What should I see on the first day?",
+    "And where should I eat tacos?",
+    "How do I get from the airport to the center?",
+    "Can you summarize the whole plan?",
+]
+
+
+def percentiles(values):
+    """p50/p95/p99, mean and max of a list of numbers"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": round(pick(50), 6),
+        "p95": round(pick(95), 6),
+        "p99": round(pick(99), 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+async def run_conversation(core, model_name, turns):
+    """One simulated user going through the script, returns per-turn measurements"""
+    chatbot = ChatbotModel(model_name)
+    measurements = []
+    for turn, message in enumerate(SCRIPT[:turns]):
+        chatbot.add_to_memory("user", message)
+
+        build_start = time.perf_counter()
+        prompt = chatbot.format_conversation() + "<|im_start|>assistant\n"
+        build_time = time.perf_counter() - build_start
+
+        start = time.perf_counter()
+        first_token = {}
+        token_count = {"n": 0}
+
+        def on_token(text):
+            if "t" not in first_token:
+                first_token["t"] = time.perf_counter() - start
+            token_count["n"] += 1
+
+        response = await chatbot.agenerate_response(core, on_token=on_token, use_cache=False)
+        total = time.perf_counter() - start
+        chatbot.add_to_memory("agent", response)
+
+        generation_time = total - first_token.get("t", total)
+        measurements.append({
+            "turn": turn,
+            "prompt_chars": len(prompt),
+            "prompt_build_time": build_time,
+            "ttft": first_token.get("t", total),
+            "total_time": total,
+            "tokens": token_count["n"],
+            "tokens_per_second": (token_count["n"] - 1) / generation_time if generation_time > 0 and token_count["n"] > 1 else 0.0,
+        })
+    return measurements
+
+
+def benchmark_chat(server, conversations, turns, parallel):
+    """Concurrent scripted conversations through ChatbotModel on the AgentCore"""
+    core = AgentCore(
+        AsyncOllamaClient(server.url),
+        limits={"answer": 1000},
+        scheduler=RequestScheduler(parallel)
+    ).start()
+
+    async def run_all():
+        return await asyncio.gather(*[run_conversation(core, "llama3.1:8b", turns) for _ in range(conversations)])
+
+    start = time.perf_counter()
+    results = core.submit(run_all()).result()
+    wall_time = time.perf_counter() - start
+    scheduler_stats = core.scheduler.stats()
+    core.stop()
+
+    turns_flat = [m for conversation in results for m in conversation]
+    total_tokens = sum(m["tokens"] for m in turns_flat)
+    by_turn = {}
+    for m in turns_flat:
+        by_turn.setdefault(m["turn"], []).append(m)
+
+    return {
+        "wall_time": round(wall_time, 3),
+        "turns": len(turns_flat),
+        "throughput_tokens_per_second": round(total_tokens / wall_time, 2) if wall_time else 0.0,
+        "ttft": percentiles([m["ttft"] for m in turns_flat]),
+        "total_time": percentiles([m["total_time"] for m in turns_flat]),
+        "tokens_per_second": percentiles([m["tokens_per_second"] for m in turns_flat]),
+        "prompt_build_time": percentiles([m["prompt_build_time"] for m in turns_flat]),
+        "queue_wait": scheduler_stats["wait"],
+        # How prompt size and build time grow as the conversation gets longer
+        "per_turn": {
+            turn: {
+                "prompt_chars": max(m["prompt_chars"] for m in ms),
+                "prompt_build_time_mean": round(sum(m["prompt_build_time"] for m in ms) / len(ms), 6),
+                "ttft_p50": percentiles([m["ttft"] for m in ms])["p50"],
+            }
+            for turn, ms in sorted(by_turn.items())
+        },
+    }
+
+
+def benchmark_two_stage(server, questions):
+    """The two-stage reasoning functions in each pipeline mode"""
+    reasoning_pipeline.API_ENDPOINT = f"{server.url}/api/generate"
+    results = {}
+    for mode in reasoning_pipeline.MODES:
+        runs = []
+        for question in SCRIPT[:questions]:
+            think_prompt = f"<|im_start|>user\n{question}<|im_end|>\n<|im_start|>system\nThink deeply.\n<|im_end|>\n<|im_start|>assistant\n"
+            direct_prompt = f"<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+            _, metrics = reasoning_pipeline.run_reasoning(
+                "llama3.1:8b",
+                think_prompt,
+                lambda thinking, q=question: f"<|im_start|>user\n{q}<|im_end|>\n<|im_start|>system\n{thinking}\n<|im_end|>\n<|im_start|>assistant\n",
+                direct_prompt=direct_prompt,
+                mode=mode,
+                metrics_file=None
+            )
+            runs.append(metrics)
+        results[mode] = {
+            "answer_ttft": percentiles([r.get("answer_ttft", r["total_time"]) for r in runs]),
+            "total_time": percentiles([r["total_time"] for r in runs]),
+        }
+    return results
+
+
+def compare(current, baseline_file):
+    """Print how the main numbers moved against an earlier results file"""
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_file}:")
+    for key in ("ttft", "total_time", "prompt_build_time"):
+        for p in ("p50", "p95", "p99"):
+            old = baseline["chat"][key].get(p)
+            new = current["chat"][key].get(p)
+            if old:
+                print(f"  {key:<18}{p:<5}{old:>12.6f} -> {new:>12.6f} ({(new - old) / old:+.1%})")
+    old = baseline["chat"]["throughput_tokens_per_second"]
+    new = current["chat"]["throughput_tokens_per_second"]
+    if old:
+        print(f"  {'throughput':<23}{old:>12.2f} -> {new:>12.2f} ({(new - old) / old:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmark against a fake Ollama server")
+    parser.add_argument("--conversations", type=int, default=8, help="simulated users at the same time")
+    parser.add_argument("--turns", type=int, default=len(SCRIPT))
+    parser.add_argument("--parallel", type=int, default=4, help="server slots (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second per request")
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="prompt tokens evaluated per second")
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--skip-two-stage", action="store_true")
+    parser.add_argument("--output", help="results file (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        token_rate=args.token_rate,
+        first_token_latency=args.first_token_latency,
+        prompt_rate=args.prompt_rate,
+        response_tokens=args.response_tokens
+    ).start()
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    results = {
+        "timestamp": time.time(),
+        "config": vars(args),
+        "chat": benchmark_chat(server, args.conversations, args.turns, args.parallel),
+    }
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    if not args.skip_two_stage:
+        results["two_stage"] = benchmark_two_stage(server, min(3, args.turns))
+    tracemalloc.stop()
+
+    results["memory"] = {
+        "python_growth_bytes": memory_after - memory_before,
+        "python_peak_bytes": memory_peak,
+        "max_rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+    }
+    results["server"] = {"requests": server.requests, "max_concurrent_requests": server.max_active}
+    server.stop()
+
+    chat = results["chat"]
+    print(f"{chat['turns']} turns in {chat['wall_time']}s, {chat['throughput_tokens_per_second']} tokens/s overall")
+    for key, scale, unit in (("ttft", 1000, "ms"), ("total_time", 1000, "ms"), ("tokens_per_second", 1, "tok/s"),
+                             ("prompt_build_time", 1000, "ms")):
+        s = chat[key]
+        print(f"  {key:<18} p50 {s['p50'] * scale:.3f}  p95 {s['p95'] * scale:.3f}  p99 {s['p99'] * scale:.3f} {unit}")
+    for mode, r in results.get("two_stage", {}).items():
+        print(f"  two-stage {mode:<11} answer ttft p50 {r['answer_ttft']['p50']:.3f}s  total p50 {r['total_time']['p50']:.3f}s")
+    print(f"  memory growth {results['memory']['python_growth_bytes'] / 1024:.1f} KiB (peak {memory_peak / 1024:.1f} KiB)")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
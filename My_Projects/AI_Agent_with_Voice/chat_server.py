@@ -0,0 +1,309 @@
+import asyncio
+import json
+import time
+import uuid
+from agent_core import AgentCore
+from model import ChatbotModel, GenerationError
+from request_scheduler import RequestScheduler
+
+class ChatSession:
+    """One client conversation with its own ChatbotModel memory"""
+    def __init__(self, session_id, model_name):
+        self.session_id = session_id
+        self.model = ChatbotModel(model_name)
+        self.lock = asyncio.Lock()  # One message at a time per conversation
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.turns = 0
+        self.summary = ""  # Refreshed in the background every few turns
+        self.summary_task = None
+
+
+class ChatServer:
+    """
+    Headless chat server - no Tk, no audio - built on asyncio streams.
+
+    Endpoints (JSON bodies):
+        POST   /sessions                 {"model": "llama3.1:8b"}  -> {"session_id": ...}
+        POST   /sessions/<id>/messages   {"message": "...", "stream": true}
+               streams Server-Sent Events: "token" events, then one "done" event
+        GET    /sessions/<id>            conversation memory and its latest summary
+        DELETE /sessions/<id>
+        GET    /stats                    sessions and scheduler queue
+
+    Every session has its own ChatbotModel. Generations share one AgentCore
+    and a RequestScheduler, so many clients can use one Ollama server.
+    Conversation summaries run at background priority, so they only take a
+    server slot when no reply is waiting for one.
+    """
+    def __init__(self, host="127.0.0.1", port=8765, default_model="llama3.1:8b", core=None,
+                 session_ttl=3600, max_body=1024 * 1024, summarize_every=4):
+        self.host = host
+        self.port = port
+        self.default_model = default_model
+        # Concurrency is decided by the scheduler, not by the stage limits
+        self.core = core or AgentCore(
+            limits={"think": 1000, "answer": 1000, "summary": 1000, "cache": 4},
+            scheduler=RequestScheduler()
+        )
+        self.summarize_every = summarize_every  # Turns between summaries (0 = never)
+        self.session_ttl = session_ttl  # Idle seconds before a session is dropped
+        self.max_body = max_body
+        self.sessions = {}
+        self.server = None
+        self.requests_served = 0
+
+    # --- HTTP plumbing ---
+
+    async def _read_request(self, reader):
+        """Parse one HTTP request, returns (method, path, body) or None"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > self.max_body:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?")[0].rstrip("/") or "/", body
+
+    @staticmethod
+    async def _send_json(writer, status, payload):
+        """Write a complete JSON response"""
+        reasons = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 500: "Internal Server Error"}
+        body = json.dumps(payload).encode("utf-8")
+        writer.write((
+            f"HTTP/1.1 {status} {reasons.get(status, 'OK')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode("latin-1") + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _send_event(writer, event, payload):
+        """Write one Server-Sent Event"""
+        writer.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        """Serve one request per connection"""
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            self.requests_served += 1
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                await self._send_json(writer, 400, {"error": "body must be JSON"})
+                return
+            await self._route(method, path, payload, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        except Exception as e:
+            print(f"Error serving request: {e}")
+            try:
+                await self._send_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, payload, reader, writer):
+        """Dispatch a request to its handler"""
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts == ["sessions"]:
+            session = self.create_session(payload.get("model"))
+            await self._send_json(writer, 201, {"session_id": session.session_id, "model": session.model.model_name})
+        elif method == "GET" and parts == ["stats"]:
+            await self._send_json(writer, 200, self.stats())
+        elif len(parts) >= 2 and parts[0] == "sessions":
+            session = self.sessions.get(parts[1])
+            if session is None:
+                await self._send_json(writer, 404, {"error": "unknown session"})
+            elif method == "POST" and parts[2:] == ["messages"]:
+                await self._handle_message(session, payload, reader, writer)
+            elif method == "GET" and len(parts) == 2:
+                await self._send_json(writer, 200, {"session_id": session.session_id, "memory": session.model.memory[1:],
+                                                    "summary": session.summary})
+            elif method == "DELETE" and len(parts) == 2:
+                self.drop_session(session)
+                await self._send_json(writer, 200, {"deleted": session.session_id})
+            else:
+                await self._send_json(writer, 404, {"error": "not found"})
+        else:
+            await self._send_json(writer, 404, {"error": "not found"})
+
+    # --- Chat ---
+
+    def create_session(self, model_name=None):
+        """Start a new conversation"""
+        session = ChatSession(uuid.uuid4().hex[:12], model_name or self.default_model)
+        self.sessions[session.session_id] = session
+        return session
+
+    def drop_session(self, session):
+        """Forget a conversation and stop its background summary"""
+        self.sessions.pop(session.session_id, None)
+        if session.summary_task and not session.summary_task.done():
+            session.summary_task.cancel()
+
+    async def _handle_message(self, session, payload, reader, writer):
+        """Generate the reply to a message, streamed as SSE unless "stream" is false"""
+        message = (payload.get("message") or "").strip()
+        if not message:
+            await self._send_json(writer, 400, {"error": "message is required"})
+            return
+        if session.lock.locked():
+            await self._send_json(writer, 409, {"error": "session is busy with another message"})
+            return
+
+        stream = payload.get("stream", True)
+        async with session.lock:
+            session.last_active = time.time()
+            start = time.time()
+            first_token = {}
+            tokens = asyncio.Queue()
+
+            def on_token(text):
+                if "time" not in first_token:
+                    first_token["time"] = time.time() - start
+                tokens.put_nowait(text)
+
+            session.model.add_to_memory("user", message)
+            generation = asyncio.ensure_future(session.model.agenerate_reasoned_response(self.core, on_token=on_token))
+
+            if stream:
+                writer.write((
+                    "HTTP/1.1 200 OK\r\n"
+                    "Content-Type: text/event-stream\r\n"
+                    "Cache-Control: no-cache\r\n"
+                    "Connection: close\r\n"
+                    "\r\n"
+                ).encode("latin-1"))
+                try:
+                    # Forward tokens until the generation is finished and the queue is empty
+                    while not (generation.done() and tokens.empty()):
+                        getter = asyncio.ensure_future(tokens.get())
+                        await asyncio.wait([getter, generation], return_when=asyncio.FIRST_COMPLETED)
+                        if getter.done():
+                            await self._send_event(writer, "token", {"text": getter.result()})
+                        else:
+                            getter.cancel()
+                except ConnectionError:
+                    # The client left - stop generating and forget the message
+                    generation.cancel()
+                    session.model.memory.pop()
+                    return
+            else:
+                # Nothing is sent until the reply is done - watch for the client hanging up meanwhile
+                hangup = asyncio.ensure_future(reader.read(1))
+                await asyncio.wait([hangup, generation], return_when=asyncio.FIRST_COMPLETED)
+                if not generation.done():
+                    generation.cancel()
+                    session.model.memory.pop()
+                    return
+                hangup.cancel()
+
+            try:
+                response = await generation
+            except GenerationError as e:
+                # Failed turns stay out of the history, and the client gets a real error
+                session.model.memory.pop()
+                if stream:
+                    await self._send_event(writer, "error", {"error": str(e)})
+                else:
+                    await self._send_json(writer, 500, {"error": str(e)})
+                return
+            session.model.add_to_memory("agent", response)
+            session.turns += 1
+            if self.summarize_every and session.turns % self.summarize_every == 0:
+                self._start_summary(session)
+            result = {
+                "response": response,
+                "ttft": round(first_token.get("time", time.time() - start), 3),
+                "total_time": round(time.time() - start, 3),
+            }
+            if stream:
+                await self._send_event(writer, "done", result)
+            else:
+                await self._send_json(writer, 200, result)
+
+    def _start_summary(self, session):
+        """Refresh the session summary in the background (skipped if one is still running)"""
+        if session.summary_task and not session.summary_task.done():
+            return
+
+        async def summarize():
+            try:
+                session.summary = await session.model.asummarize(self.core)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Could not summarize session {session.session_id}: {e}")
+
+        session.summary_task = asyncio.ensure_future(summarize())
+
+    # --- Lifecycle ---
+
+    async def _expire_sessions(self):
+        """Drop sessions that have been idle longer than the TTL"""
+        while True:
+            await asyncio.sleep(60)
+            now = time.time()
+            for session_id, session in list(self.sessions.items()):
+                if now - session.last_active > self.session_ttl and not session.lock.locked():
+                    self.drop_session(session)
+
+    async def start(self):
+        """Start listening (runs on the AgentCore loop)"""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        asyncio.ensure_future(self._expire_sessions())
+        print(f"Chat server listening on http://{self.host}:{self.port}")
+        return self.server
+
+    def stats(self):
+        """Sessions and scheduler state"""
+        return {
+            "sessions": len(self.sessions),
+            "busy_sessions": sum(1 for s in self.sessions.values() if s.lock.locked()),
+            "requests_served": self.requests_served,
+            "scheduler": self.core.scheduler.stats() if self.core.scheduler else None,
+        }
+
+    def serve_forever(self):
+        """Run the server until interrupted"""
+        self.core.start()
+        self.core.submit(self.start()).result()
+        try:
+            self.core.thread.join()
+        except KeyboardInterrupt:
+            print("Chat server stopped.")
+        finally:
+            self.core.stop()
+
+
+# Run the server
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Headless chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", default="llama3.1:8b")
+    parser.add_argument("--summarize-every", type=int, default=4, help="turns between background summaries (0 = off)")
+    args = parser.parse_args()
+
+    ChatServer(args.host, args.port, args.model, summarize_every=args.summarize_every).serve_forever()
@@ -1,7 +1,41 @@
-import threading
+import time
 import queue
+import asyncio
 from speech import SpeechRecognizer
 from tts import TextToSpeech
+from voice_commands import CommandRecognizer, spoken_model_name
+from model import GenerationHandle
+from agent_core import AgentCore
+from model_residency import ModelResidencyManager
+from latency_trace import tracer
+from metrics import metrics
+from audio_io import default_backend
+
+class SpeculativeRequest:
+    """
+    A response generated from a partial voice transcript while the user may
+    still be speaking. It is only used if the final transcript matches.
+    """
+    def __init__(self, text, memory_length):
+        self.text = text
+        self.memory_length = memory_length  # Conversation length the response was built on
+        self.handle = GenerationHandle()  # Cancelling it stops the speculative generation in Ollama
+        self.future = None  # AgentCore task generating the response
+
+    @property
+    def cancelled(self):
+        return self.handle.is_cancelled()
+
+    def cancel(self):
+        """Stop generating, the transcript changed"""
+        self.handle.cancel()
+
+    def matches(self, text, memory_length):
+        """Check if this speculation is valid for the final transcript"""
+        return (not self.cancelled
+                and self.memory_length == memory_length
+                and ChatbotController.normalize_transcript(text) == self.text)
+
 
 class ChatbotController:
     """
@@ -11,6 +45,13 @@ class ChatbotController:
         self.model = model
         self.view = view
         self.response_queue = queue.Queue()
+        self.showing_responses = False
+        
+        # Asyncio core running generations in its own loop thread (one stream at a time)
+        self.core = AgentCore().start()
+        
+        # Sound card, or a virtual device for headless runs (VOICE_AUDIO_INPUT)
+        self.audio = default_backend()
         
         # Initialize speech recognizer (None until activated)
         self.speech_recognizer = None
@@ -21,9 +62,22 @@ class ChatbotController:
         self.tts = None
         self.tts_enabled = False
         self.tts_init_checked = False
+        
+        # Barge-in: the user can interrupt the assistant by starting to speak
+        self.barge_in_enabled = False
+        self.generation_id = 0  # Bumped when a response is superseded, stale replies are dropped
+        self.current_generation = None  # GenerationHandle of the in-flight request
+        self.streaming_generation = None  # Handle whose answer is being streamed into the view
+        
+        # Speculative responses: start generating on a pause, before the utterance is final
+        self.speculative_enabled = False
+        self.speculation = None
+        
+        # Live latency breakdown of the current voice turn in the status bar
+        tracer.on_update = lambda summary: self.view.post(self.view.set_status, f"Latency: {summary}")
         try:
             # Try to initialize the TTS engine
-            self.tts = TextToSpeech()
+            self.tts = TextToSpeech(audio=self.audio)
             
             # Print audio device information to help debug issues
             try:
@@ -50,6 +104,11 @@ class ChatbotController:
         self.view.set_model_change_callback(self.handle_model_change)
         self.view.set_voice_toggle_callback(self.handle_voice_toggle)
         self.view.set_select_mic_callback(self.handle_mic_selection)
+        self.view.set_voice_commands_toggle_callback(self.handle_voice_commands_toggle)
+        self.view.set_barge_in_toggle_callback(self.handle_barge_in_toggle)
+        self.view.set_speculative_toggle_callback(self.handle_speculative_toggle)
+        self.view.set_stop_callback(self.handle_stop_generation)
+        self.view.set_profile_toggle_callback(self.handle_profile_toggle)
         
         # Set callbacks for TTS controls
         self.view.set_tts_toggle_callback(self.handle_tts_toggle)
@@ -61,15 +120,19 @@ class ChatbotController:
         # Initialize model with the default selection from view
         self.model.model_name = self.view.get_selected_model()
         
-        # Start response checker
-        self.view.start_response_checker(self.check_for_responses)
+        # Keep the selected model loaded in Ollama (preloaded now, not on the first message)
+        self.residency = ModelResidencyManager(self.core, self.view.available_models)
+        self.residency.request_switch(self.model.model_name, self._show_model_load_progress)
+        
+        # Responses are posted to the view's event channel by the worker threads,
+        # so there is no polling loop to start here
         
         # Try to find the default microphone index
         try:
-            temp_recognizer = SpeechRecognizer()
+            temp_recognizer = SpeechRecognizer(audio=self.audio)
             self.selected_mic_index = temp_recognizer.find_device_by_name(self.default_device_name)
             if self.selected_mic_index is not None:
-                mic_name = next((name for idx, name in temp_recognizer.list_microphones() 
+                mic_name = next((name for idx, name in temp_recognizer.list_microphones(self.audio) 
                                  if idx == self.selected_mic_index), "Unknown")
                 self.view.set_status(f"Default microphone: {mic_name}")
             else:
@@ -196,6 +259,8 @@ class ChatbotController:
     
     def reset_conversation(self):
         """Reset the conversation to initial state"""
+        self.cancel_speculation()
+        self.cancel_generation()
         self.model.reset_memory()
         self.view.clear_conversation()
         self.view.display_welcome_message()
@@ -218,14 +283,21 @@ class ChatbotController:
         
         # Update status
         self.view.set_status(f"Model changed to {new_model_name}")
+        
+        # Load it right away so the first reply isn't a cold start
+        self.residency.request_switch(new_model_name, self._show_model_load_progress)
+    
+    def _show_model_load_progress(self, text):
+        """Show model loading progress in the status bar (called from the core loop)"""
+        self.view.post(self.view.set_status, text)
     
     def handle_mic_selection(self):
         """Handle microphone selection request"""
         # Get list of available microphones
         try:
             # Create a temporary SpeechRecognizer just to get the microphone list
-            temp_recognizer = SpeechRecognizer()
-            microphones = temp_recognizer.list_microphones()
+            temp_recognizer = SpeechRecognizer(audio=self.audio)
+            microphones = temp_recognizer.list_microphones(self.audio)
             
             # Show microphone selector dialog
             selected_mic = self.view.show_microphone_selector(microphones)
@@ -248,25 +320,33 @@ class ChatbotController:
                 
             # If we already have a speech recognizer, recreate it with the new microphone
             if self.speech_recognizer:
-                # Remember if it was active
-                was_active = hasattr(self.speech_recognizer, 'stream')
-                
-                # Stop the current one
-                self.speech_recognizer.stop_listening()
-                
-                # Create a new one with the selected microphone
-                self.speech_recognizer = SpeechRecognizer(
-                    device_index=self.selected_mic_index,
-                    default_device_name=self.default_device_name
-                )
-                
-                # Restart if it was active
-                if was_active:
-                    self.speech_recognizer.start_listening(self.handle_voice_input)
+                self._recreate_speech_recognizer()
                     
         except Exception as e:
             self.view.set_status(f"Error listing microphones: {str(e)}")
     
+    def _recreate_speech_recognizer(self):
+        """Replace the speech recognizer (new microphone or block size), restarting it if it was active"""
+        # Remember if it was active
+        was_active = hasattr(self.speech_recognizer, 'stream')
+        
+        # Stop the current one
+        self.speech_recognizer.stop_listening()
+        
+        # Create a new one with the current settings
+        self.speech_recognizer = SpeechRecognizer(
+            device_index=self.selected_mic_index,
+            default_device_name=self.default_device_name,
+            blocksize=self._recognizer_blocksize(),
+            audio=self.audio
+        )
+        self._setup_voice_commands()
+        self._setup_barge_in()
+        
+        # Restart if it was active
+        if was_active:
+            self._start_listening()
+    
     def handle_voice_toggle(self, is_active):
         """Handle voice input toggle"""
         if is_active:
@@ -275,17 +355,18 @@ class ChatbotController:
                 if self.speech_recognizer is None:
                     self.speech_recognizer = SpeechRecognizer(
                         device_index=self.selected_mic_index,
-                        default_device_name=self.default_device_name
+                        default_device_name=self.default_device_name,
+                        blocksize=self._recognizer_blocksize(),
+                        audio=self.audio
                     )
+                    self._setup_voice_commands()
+                    self._setup_barge_in()
                 
                 # Start voice UI by clearing any previous voice display
                 self.view.start_voice_input()
                 
                 # Start listening with callbacks for both word and final results
-                success = self.speech_recognizer.start_listening(
-                    callback=self.handle_voice_input,
-                    word_callback=self.handle_word_input
-                )
+                success = self._start_listening()
                 
                 if success:
                     self.view.set_status("Voice input active - speak clearly")
@@ -313,11 +394,187 @@ class ChatbotController:
             self.view.voice_button.config(text="🎤 Enable Voice")
             self.view.set_status("Voice input disabled")
     
+    def _start_listening(self):
+        """Start the speech recognizer with all voice callbacks"""
+        # Transcripts arrive on the recognition/audio threads - hand them to the Tk thread
+        return self.speech_recognizer.start_listening(
+            callback=lambda text: self.view.post(self.handle_voice_input, text),
+            word_callback=lambda text: self.view.post(self.handle_word_input, text),
+            speech_start_callback=self.handle_speech_start,
+            pause_callback=lambda text: self.view.post(self.handle_voice_pause, text)
+        )
+    
+    def _setup_voice_commands(self):
+        """Attach a grammar-based command recognizer to the speech recognizer"""
+        if not self.speech_recognizer:
+            return
+        
+        if not self.view.voice_commands_enabled.get():
+            self.speech_recognizer.set_command_recognizer(None)
+            return
+        
+        # Reuse the already loaded Vosk model, handlers run on the Tk thread
+        commands = CommandRecognizer(
+            self.speech_recognizer.model,
+            sample_rate=self.speech_recognizer.sample_rate,
+            dispatch=lambda handler, phrase: self.view.post(self._run_voice_command, handler, phrase)
+        )
+        commands.add_command("stop", self.handle_stop_command)
+        commands.add_command("reset", self.handle_reset_command)
+        commands.add_command("change voice", self.handle_change_voice_command)
+        for model_name in self.view.available_models:
+            commands.add_command(
+                f"use {spoken_model_name(model_name)}",
+                lambda phrase, name=model_name: self.view.select_model(name)
+            )
+        
+        self.speech_recognizer.set_command_recognizer(commands)
+    
+    def handle_voice_commands_toggle(self, enabled):
+        """Handle voice commands toggle"""
+        self._setup_voice_commands()
+        self.view.set_status(f"Voice commands {'enabled' if enabled else 'disabled'}")
+    
+    def _run_voice_command(self, handler, phrase):
+        """Run a voice command handler, removing the command words from the display"""
+        self.view.clear_voice_text()
+        handler(phrase)
+        self.view.set_status(f"Voice command: {phrase}")
+    
+    def handle_stop_command(self, phrase):
+        """Voice command: stop generating and speaking, like the Stop button"""
+        self.handle_stop_generation()
+    
+    def handle_reset_command(self, phrase):
+        """Voice command: restart the conversation"""
+        self.reset_conversation()
+    
+    def handle_change_voice_command(self, phrase):
+        """Voice command: switch to the next available voice"""
+        if not self.tts or not self.tts.is_initialized:
+            return
+        
+        voices = self.tts.get_available_speakers()
+        if not voices:
+            return
+        
+        current = self.view.voice_var.get()
+        next_voice = voices[(voices.index(current) + 1) % len(voices)] if current in voices else voices[0]
+        self.view.voice_var.set(next_voice)
+        self.handle_voice_change(next_voice)
+    
+    def _setup_barge_in(self):
+        """Give the speech recognizer the playback signal used to ignore our own voice"""
+        if not self.speech_recognizer:
+            return
+        
+        if self.barge_in_enabled and self.tts:
+            self.speech_recognizer.echo_reference = self.tts.get_playback_level
+        else:
+            self.speech_recognizer.echo_reference = None
+    
+    def _recognizer_blocksize(self):
+        """50ms audio blocks with barge-in so speech onset is caught quickly, the default 0.5s otherwise"""
+        return 800 if self.barge_in_enabled else 8000
+    
+    def handle_barge_in_toggle(self, enabled):
+        """Handle barge-in toggle"""
+        self.barge_in_enabled = enabled
+        if self.speech_recognizer and self.speech_recognizer.blocksize != self._recognizer_blocksize():
+            self._recreate_speech_recognizer()  # Also sets up barge-in
+        else:
+            self._setup_barge_in()
+        self.view.set_status(f"Barge-in {'enabled' if enabled else 'disabled'}")
+    
+    def handle_speech_start(self):
+        """Called from the audio thread when the user starts speaking"""
+        if not self.barge_in_enabled or not self.tts or not self.tts.is_busy():
+            return
+        
+        # Don't block the audio callback - cut playback from the core's loop thread
+        self.core.loop.call_soon_threadsafe(self._barge_in)
+    
+    def _barge_in(self):
+        """Interrupt the assistant so the user can talk"""
+        print("Barge-in: user started speaking")
+        self.tts.interrupt()
+        # Generation state belongs to the Tk thread, this runs on the core's loop
+        self.view.post(self.cancel_generation)
+        self.view.post(self._on_barge_in)
+    
+    def _on_barge_in(self):
+        """Update the UI after a barge-in (runs on the Tk thread)"""
+        self.view.interrupt_response()
+        self.view.stop_thinking_animation()
+        self.view.set_input_enabled(True)
+        self.view.set_status("Listening...")
+    
+    def cancel_generation(self):
+        """Cancel the in-flight generation so Ollama stops and its reply is discarded (Tk thread only)"""
+        if self.current_generation:
+            self.current_generation.cancel()
+            self.current_generation = None
+        self.generation_id += 1
+        self._end_stream(interrupted=True)
+        
+        # Drop replies that were already queued for display
+        while not self.response_queue.empty():
+            try:
+                self.response_queue.get_nowait()
+            except queue.Empty:
+                break
+    
+    @staticmethod
+    def normalize_transcript(text):
+        """Normalize a transcript so partial and final results can be compared"""
+        return " ".join(text.lower().split())
+    
+    def handle_speculative_toggle(self, enabled):
+        """Handle speculative response toggle"""
+        self.speculative_enabled = enabled
+        if not enabled:
+            self.cancel_speculation()
+        self.view.set_status(f"Speculative responses {'enabled' if enabled else 'disabled'}")
+    
+    def handle_voice_pause(self, text):
+        """Called on the Tk thread when the user pauses - start a response early"""
+        if not self.speculative_enabled:
+            return
+        
+        normalized = self.normalize_transcript(text)
+        if self.speculation and not self.speculation.cancelled and self.speculation.text == normalized:
+            return  # Already generating for this transcript
+        
+        self.cancel_speculation()
+        speculation = SpeculativeRequest(normalized, len(self.model.memory))
+        self.speculation = speculation
+        print(f"Speculative request for: '{normalized}'")
+        
+        # Same reasoning as a normal reply, the settings are read here on the Tk thread
+        speculation.future = self.core.submit(self.model.agenerate_reasoned_response(
+            self.core,
+            show_thinking=self.view.get_show_thinking(),
+            think_first=self.view.get_think_first(),
+            pending_message=text
+        ))
+        speculation.handle.attach_future(speculation.future)
+    
+    def cancel_speculation(self):
+        """Discard the current speculative response (the transcript changed)"""
+        if self.speculation:
+            self.speculation.cancel()
+            self.speculation = None
+    
     def handle_word_input(self, text):
         """Handle new word(s) detected in speech"""
         if not text:
             return
         
+        # The user kept talking - the speculative transcript is outdated
+        if self.speculation:
+            print("Transcript changed - cancelling speculative request")
+            self.cancel_speculation()
+        
         # Update the display with the new word(s)
         self.view.append_voice_text(text)
     
@@ -326,63 +583,208 @@ class ChatbotController:
         if not text:
             return
         
+        # Use the speculative response if it was generated for this exact transcript
+        speculation = self.speculation
+        self.speculation = None
+        if speculation and not speculation.matches(text, len(self.model.memory)):
+            print("Final transcript differs - restarting request")
+            speculation.cancel()
+            speculation = None
+        
         # Process the voice input as a user message
-        self.handle_user_message(text, is_voice=True)
+        self.handle_user_message(text, is_voice=True, speculation=speculation)
     
-    def handle_user_message(self, message, is_voice=False):
+    def handle_user_message(self, message, is_voice=False, speculation=None):
         """Process a user message"""
         # Add to memory
         self.model.add_to_memory("user", message)
         
-        # Update UI (for keyboard input - voice input already updated in real-time)
+        # Update UI (voice input was typed in real time - this finishes it and stores it)
+        self.view.display_user_message(message, is_voice=is_voice)
         if not is_voice:
-            self.view.display_user_message(message)
+            tracer.begin_turn(source="text")  # Voice turns were started by the recognizer
             
         self.view.start_thinking_animation()
+        self.view.start_thinking_panel()
         self.view.set_status("Thinking...")
         self.view.set_input_enabled(False)
         
-        # Start processing in background
-        threading.Thread(
-            target=self.process_message_thread,
-            args=(message,),
-            daemon=True
-        ).start()
+        # A new message supersedes the one still generating - free the server for it
+        if self.current_generation:
+            print(f"Superseding generation {self.current_generation.generation_id}")
+            self.current_generation.cancel()
+        self._end_stream(interrupted=True)
+        
+        # Each message gets a generation id so superseded replies can be recognized
+        self.generation_id += 1
+        handle = speculation.handle if speculation else GenerationHandle()
+        handle.generation_id = self.generation_id
+        self.current_generation = handle
+        
+        # Reasoning settings are read here, Tk variables belong to this thread
+        show_thinking = self.view.get_show_thinking()
+        think_first = self.view.get_think_first()
+        
+        # Process on the asyncio core
+        future = self.core.submit(self.process_message(message, handle, speculation, show_thinking, think_first))
+        if not speculation:
+            handle.attach_future(future)
     
-    def process_message_thread(self, message):
-        """Background thread to process user message"""
+    async def process_message(self, message, handle, speculation=None, show_thinking=False, think_first=False):
+        """
+        Process a user message on the asyncio core. Generation state and memory
+        are only changed on the Tk thread, so results are posted to the view.
+        """
+        tracer.mark("request_send")
         try:
-            # Generate response directly (no thinking step)
-            response = self.model.generate_response()
-            
-            # Add to memory
-            self.model.add_to_memory("agent", response)
+            if speculation:
+                # Commit the speculative response (it may still be finishing)
+                response = await asyncio.wrap_future(speculation.future)
+                tracer.mark("first_token")  # Already generated - the reply is ready now
+            else:
+                # Stream the thinking into the thinking panel while it is generated
+                def on_thinking(text):
+                    self.view.post(self._show_thinking, handle, text)
+                
+                # Answer tokens are shown and spoken as they arrive
+                def on_token(text):
+                    tracer.mark("first_token")
+                    self.view.post(self._show_token, handle, text)
+                
+                # Reasoning models think and answer in one call, others only think first if asked
+                response = await self.model.agenerate_reasoned_response(
+                    self.core,
+                    show_thinking=show_thinking,
+                    think_first=think_first,
+                    on_token=on_token,
+                    on_thinking=on_thinking
+                )
             
-            # Queue response for UI
-            self.response_queue.put(response)
+            self.view.post(self._on_response, handle, response)
+        except asyncio.CancelledError:
+            print(f"Generation {handle.generation_id} cancelled")
+            return
         except Exception as e:
-            error_msg = f"Error processing message: {str(e)}"
-            self.response_queue.put(error_msg)
+            # Shown to the user, but never stored as the assistant's reply
+            self.view.post(self._on_generation_error, handle, f"Error processing message: {str(e)}")
+    
+    def _show_thinking(self, handle, text):
+        """Stream thinking into the panel unless the generation was superseded (runs on the Tk thread)"""
+        if handle.generation_id == self.generation_id:
+            self.view.append_thinking(text)
+    
+    def _show_token(self, handle, text):
+        """Show a streamed answer token unless the generation was superseded (runs on the Tk thread)"""
+        if handle.is_cancelled() or handle.generation_id != self.generation_id:
+            return
+        if self.streaming_generation is not handle:
+            self.streaming_generation = handle
+            self.view.start_ai_stream(speak_callback=self._speak_callback())
+        self.view.append_ai_token(text)
+    
+    def _end_stream(self, interrupted=False):
+        """Close the streamed answer in the view, if one is open (interrupted: don't speak the rest)"""
+        if self.streaming_generation:
+            self.streaming_generation = None
+            if interrupted:
+                self.view.interrupt_response()
+            self.view.finish_ai_stream()
+    
+    def _on_response(self, handle, response):
+        """Store and show a finished reply (runs on the Tk thread)"""
+        # Cancelled or superseded while we were generating - drop the stale reply
+        if handle.is_cancelled() or handle.generation_id != self.generation_id:
+            print(f"Discarding superseded response (generation {handle.generation_id})")
+            return
+        self.current_generation = None
+        self.model.add_to_memory("agent", response)
+        
+        # Streamed replies are already on screen, whole ones (speculation, cache) are typed out
+        if self.streaming_generation is handle:
+            self._end_stream()
+            latency = tracer.summary()
+            self.view.set_status(f"Ready | {latency}" if latency else "Ready")
+            self.view.set_input_enabled(True)
+            return
+        self.response_queue.put(response)
+        self.check_for_responses()
+    
+    def _on_generation_error(self, handle, error_msg):
+        """Show a failed generation and drop its user turn (runs on the Tk thread)"""
+        if handle.is_cancelled() or handle.generation_id != self.generation_id:
+            return
+        self.current_generation = None
+        self._end_stream(interrupted=True)
+        
+        # Without this the next message would follow two user turns in a row
+        if self.model.memory and "user" in self.model.memory[-1]:
+            self.model.memory.pop()
+        
+        self.response_queue.put(error_msg)
+        self.check_for_responses()
+    
+    def handle_profile_toggle(self):
+        """Start the profiler, or stop it and save the report (F9)"""
+        path = f"profile_{time.strftime('%Y%m%d-%H%M%S')}.txt"
+        if metrics.toggle_profiling(path):
+            self.view.set_status("Profiling all threads - press F9 again to stop")
+        else:
+            print(f"Profile saved to {path}")
+            self.view.set_status(f"Profile saved to {path}")
+    
+    def handle_stop_generation(self):
+        """Handle the Stop button - abort the running generation"""
+        self.cancel_generation()
+        self.cancel_speculation()
+        
+        # Stop typing and speaking whatever was already being shown
+        self.view.interrupt_response()
+        if self.tts and self.tts.is_initialized:
+            self.tts.interrupt()
+        
+        self.view.stop_thinking_animation()
+        self.view.set_input_enabled(True)
+        self.view.set_status("Generation stopped")
     
     def check_for_responses(self):
-        """Check for responses in the queue and update UI"""
-        if not self.response_queue.empty():
-            response = self.response_queue.get()
-            
-            # Create a sentence speaker function for progressive TTS
-            def speak_sentence(sentence):
-                if self.tts_enabled and self.tts and hasattr(self.tts, 'is_initialized') and self.tts.is_initialized:
-                    print(f"Speaking sentence: '{sentence}'")
-                    self.tts.speak(sentence)
-            
-            # Only use progressive speech if TTS is enabled
-            speak_callback = None
-            if self.tts_enabled and self.tts and hasattr(self.tts, 'is_initialized') and self.tts.is_initialized:
-                speak_callback = speak_sentence
-                print("Progressive speech enabled - will speak as text displays")
+        """Show all responses waiting in the queue (runs on the Tk thread)"""
+        # Typing out a response processes Tk events, so this can be re-entered -
+        # the outer call will pick up anything queued meanwhile
+        if self.showing_responses:
+            return
+        
+        self.showing_responses = True
+        try:
+            self._show_queued_responses()
+        finally:
+            self.showing_responses = False
+    
+    def _show_queued_responses(self):
+        """Display every queued response in order"""
+        while not self.response_queue.empty():
+            try:
+                response = self.response_queue.get_nowait()
+            except queue.Empty:
+                break
             
             # Display the response with progressive speech
-            self.view.display_ai_response(response, speak_callback=speak_callback)
+            self.view.display_ai_response(response, speak_callback=self._speak_callback())
                     
-            self.view.set_status("Ready")
+            # Keep the latency breakdown of this turn visible
+            latency = tracer.summary()
+            self.view.set_status(f"Ready | {latency}" if latency else "Ready")
             self.view.set_input_enabled(True)
+    
+    def _speak_callback(self):
+        """Sentence speaker for progressive TTS, or None if TTS is off"""
+        if not (self.tts_enabled and self.tts and hasattr(self.tts, 'is_initialized') and self.tts.is_initialized):
+            return None
+        
+        def speak_sentence(sentence):
+            if self.tts_enabled and self.tts and self.tts.is_initialized:
+                print(f"Speaking sentence: '{sentence}'")
+                tracer.mark("sentence_ready")
+                self.tts.speak(sentence)
+        
+        print("Progressive speech enabled - will speak as text displays")
+        return speak_sentence
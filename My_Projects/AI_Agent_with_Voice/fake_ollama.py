@@ -0,0 +1,150 @@
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the model streams tokens at a steady rate so we can measure how the client "
+         "keeps up with it and where the time goes between the request and the answer").split()
+
+class FakeOllamaServer:
+    """
+    Local stand-in for Ollama with configurable speed, for benchmarks and tests.
+
+    Latency of a generation: first_token_latency + prompt tokens / prompt_rate
+    (prompt evaluation), then tokens at token_rate per second. Jitter is a
+    fraction applied randomly to every delay. Supports /api/generate
+    (streaming or not), /api/embeddings, /api/ps and /api/tags.
+    """
+    def __init__(self, host="127.0.0.1", port=0, token_rate=50.0, first_token_latency=0.1,
+                 prompt_rate=2000.0, response_tokens=60, jitter=0.1, think=False):
+        self.token_rate = token_rate
+        self.first_token_latency = first_token_latency
+        self.prompt_rate = prompt_rate  # Prompt tokens evaluated per second
+        self.response_tokens = response_tokens
+        self.jitter = jitter
+        self.think = think  # Wrap the first part of each reply in <think> tags
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/api/ps"):
+                    self._send_json({"models": []})
+                else:
+                    self._send_json({"models": [{"name": "llama3.1:8b"}]})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.startswith("/api/embeddings"):
+                    rng = random.Random(payload.get("prompt", ""))
+                    self._send_json({"embedding": [rng.uniform(-1, 1) for _ in range(64)]})
+                    return
+                server._generate(self, payload)
+
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # Clients cancelling a stream is normal here, anything else is still reported
+                if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+                    return
+                super().handle_error(request, client_address)
+
+        self.httpd = Server((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self, seconds):
+        """Sleep with jitter"""
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _tokens(self, count):
+        """Text of a fake reply, one word per token"""
+        tokens = [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(count)]
+        if self.think and count > 4:
+            split = count // 2
+            tokens[0] = "<think>" + tokens[0]
+            tokens[split - 1] += "</think>"
+        tokens[-1] += "."
+        return tokens
+
+    def _generate(self, handler, payload):
+        """Answer /api/generate like Ollama"""
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            prompt = payload.get("prompt")
+            if not prompt:
+                # Empty prompt = load request
+                handler._send_json({"model": payload.get("model"), "response": "", "done": True, "done_reason": "load"})
+                return
+
+            limit = payload.get("options", {}).get("num_predict", self.response_tokens)
+            tokens = self._tokens(min(self.response_tokens, limit) if limit and limit > 0 else self.response_tokens)
+            prompt_tokens = len(prompt) // 4
+            self._delay(self.first_token_latency + prompt_tokens / self.prompt_rate)
+
+            if not payload.get("stream", True):
+                self._delay(len(tokens) / self.token_rate)
+                handler._send_json({"response": "".join(tokens), "done": True, "prompt_eval_count": prompt_tokens,
+                                    "eval_count": len(tokens)})
+                return
+
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/x-ndjson")
+            handler.send_header("Transfer-Encoding", "chunked")
+            handler.end_headers()
+            for i, token in enumerate(tokens):
+                if i:
+                    self._delay(1.0 / self.token_rate)
+                self._write_chunk(handler, {"model": payload.get("model"), "response": token, "done": False})
+            self._write_chunk(handler, {"response": "", "done": True, "prompt_eval_count": prompt_tokens,
+                                        "eval_count": len(tokens)})
+            handler.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client cancelled
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    @staticmethod
+    def _write_chunk(handler, payload):
+        """Write one NDJSON line as an HTTP chunk"""
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        handler.wfile.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        handler.wfile.flush()
+
+    def start(self):
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
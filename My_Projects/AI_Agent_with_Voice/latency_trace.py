@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Stages of a voice turn, in the order they normally happen
+STAGES = [
+    "vad_end",          # Last voiced audio frame (the user stopped talking)
+    "callback",         # SpeechRecognizer handed the final transcript to the controller
+    "request_send",     # Generation request started
+    "first_token",      # First answer token arrived
+    "sentence_ready",   # First complete sentence was handed to the TTS
+    "synthesis_start",  # XTTS started on the first sentence
+    "synthesis_end",    # First sentence synthesized
+    "playback_start",   # First audio reached the sound device
+]
+
+# Short names of the step ending at each stage, for the status bar
+STEP_LABELS = {
+    "callback": "stt",
+    "request_send": "send",
+    "first_token": "ttft",
+    "sentence_ready": "sentence",
+    "synthesis_start": "tts queue",
+    "synthesis_end": "synth",
+    "playback_start": "play",
+}
+
+class LatencyTracer:
+    """
+    Timestamps the stages of every voice turn, from the end of the user's
+    speech to the first audio of the reply.
+
+    Every stage keeps its first timestamp within a turn, so marking is cheap to
+    call from hot paths (each token, each sentence). Per-sentence work is
+    recorded as spans. Finished turns are appended to a JSONL file (stage
+    offsets in ms from the start of the turn) and can be exported in Chrome
+    trace format (open it in chrome://tracing or Perfetto).
+    """
+    def __init__(self, jsonl_file=None, chrome_file=None, max_turns=200):
+        self.jsonl_file = jsonl_file
+        self.chrome_file = chrome_file
+        self.turns = deque(maxlen=max_turns)  # Finished turns
+        self.current = None
+        self.turn_count = 0
+        self.on_update = None  # Called with summary() whenever a stage is marked
+        self.lock = threading.Lock()
+
+    def begin_turn(self, start=None, source="voice"):
+        """Start a new turn (the previous one is finished), start defaults to now"""
+        with self.lock:
+            self._finish_turn()
+            self.turn_count += 1
+            self.current = {
+                "turn": self.turn_count,
+                "source": source,
+                "origin": start if start is not None else time.time(),
+                "stages": {},
+                "spans": [],
+            }
+            if source == "voice":
+                self.current["stages"]["vad_end"] = self.current["origin"]
+
+    def mark(self, stage, when=None):
+        """Record a stage of the current turn (only its first occurrence counts)"""
+        if self.current is None or stage in self.current["stages"]:
+            return
+        with self.lock:
+            if self.current is None or stage in self.current["stages"]:
+                return
+            self.current["stages"][stage] = when if when is not None else time.time()
+        if self.on_update:
+            self.on_update(self.summary())
+
+    def span(self, name, start, end, **args):
+        """Record one piece of per-sentence work, e.g. synthesis of a sentence"""
+        with self.lock:
+            if self.current is not None:
+                self.current["spans"].append({"name": name, "start": start, "end": end, "args": args})
+
+    def breakdown(self, turn=None):
+        """Milliseconds between consecutive stages of a turn (the current one by default)"""
+        turn = turn or self.current
+        if turn is None:
+            return []
+        stages = turn["stages"]
+        present = [s for s in STAGES if s in stages]
+        steps = []
+        for previous, stage in zip(present, present[1:]):
+            steps.append((previous, stage, (stages[stage] - stages[previous]) * 1000))
+        return steps
+
+    def summary(self, turn=None):
+        """One line for the status bar, e.g. 'stt 2004 | send 1 | ttft 420 | ... | total 3120 ms'"""
+        turn = turn or self.current
+        steps = self.breakdown(turn)
+        if not steps:
+            return ""
+        parts = [f"{STEP_LABELS.get(b, b)} {ms:.0f}" for a, b, ms in steps]
+        stages = turn["stages"]
+        total = (max(stages.values()) - turn["origin"]) * 1000
+        return " | ".join(parts) + f" | total {total:.0f} ms"
+
+    def _finish_turn(self):
+        """Store the current turn and append it to the JSONL file (lock held)"""
+        turn = self.current
+        self.current = None
+        if turn is None or len(turn["stages"]) < 2:
+            return
+        self.turns.append(turn)
+        if self.jsonl_file:
+            origin = turn["origin"]
+            record = {
+                "turn": turn["turn"],
+                "source": turn["source"],
+                "timestamp": origin,
+                "stages_ms": {s: round((t - origin) * 1000, 1) for s, t in turn["stages"].items()},
+                "spans_ms": [
+                    {"name": sp["name"], "start": round((sp["start"] - origin) * 1000, 1),
+                     "duration": round((sp["end"] - sp["start"]) * 1000, 1), **sp["args"]}
+                    for sp in turn["spans"]
+                ],
+            }
+            try:
+                with open(self.jsonl_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Could not write latency trace: {e}")
+
+    def chrome_trace(self):
+        """All stored turns as a Chrome trace event list"""
+        with self.lock:
+            turns = list(self.turns) + ([self.current] if self.current else [])
+        events = []
+        for turn in turns:
+            tid = turn["turn"]
+            stages = turn["stages"]
+            present = [s for s in STAGES if s in stages]
+            # Each gap between stages is a slice, so the trace reads like a waterfall
+            for previous, stage in zip(present, present[1:]):
+                events.append({
+                    "name": f"{previous}→{stage}", "cat": "stage", "ph": "X", "pid": 1, "tid": tid,
+                    "ts": stages[previous] * 1e6, "dur": (stages[stage] - stages[previous]) * 1e6,
+                })
+            for stage in present:
+                events.append({"name": stage, "cat": "mark", "ph": "i", "s": "t", "pid": 1, "tid": tid,
+                               "ts": stages[stage] * 1e6})
+            for sp in turn["spans"]:
+                events.append({
+                    "name": sp["name"], "cat": "span", "ph": "X", "pid": 2, "tid": tid,
+                    "ts": sp["start"] * 1e6, "dur": (sp["end"] - sp["start"]) * 1e6, "args": sp["args"],
+                })
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                           "args": {"name": f"turn {tid} ({turn['source']})"}})
+        return events
+
+    def export_chrome_trace(self, path=None):
+        """Write the stored turns as a Chrome trace file, returns the path"""
+        path = path or self.chrome_file
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.chrome_trace(), "displayTimeUnit": "ms"}, f)
+        return path
+
+    def close(self):
+        """Finish the current turn and write the Chrome trace if configured"""
+        with self.lock:
+            self._finish_turn()
+        if self.chrome_file and self.turns:
+            self.export_chrome_trace()
+
+
+# Shared tracer - speech, controller and TTS mark stages on it.
+# VOICE_TRACE_FILE changes the JSONL file, VOICE_CHROME_TRACE adds a Chrome trace on exit.
+tracer = LatencyTracer(
+    jsonl_file=os.getenv("VOICE_TRACE_FILE", "latency_trace.jsonl"),
+    chrome_file=os.getenv("VOICE_CHROME_TRACE")
+)
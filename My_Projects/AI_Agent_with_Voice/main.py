@@ -2,6 +2,12 @@ import tkinter as tk
 from model import ChatbotModel
 from view import ChatbotView
 from controller import ChatbotController
+from semantic_cache import SemanticCache
+from latency_trace import tracer
+from metrics import metrics
+
+METRICS_FILE = "metrics.jsonl"
+METRICS_INTERVAL = 60  # Seconds between metric snapshots
 
 def main():
     """Main entry point for the chatbot application"""
@@ -10,11 +16,24 @@ def main():
     
     # Create the MVC components
     model = ChatbotModel()  # We'll set the model name from the view's selection
+    
+    # Reuse answers to near-identical questions for the slow 32B models (llama is fast enough)
+    model.semantic_cache = SemanticCache(thresholds={"llama3.1:8b": None})
+    
     view = ChatbotView(root)
     controller = ChatbotController(model, view)
     
+    # Per-stage counters and timings (VOICE_METRICS=1), dumped to a file periodically
+    if metrics.enabled:
+        metrics.start_periodic_dump(METRICS_FILE, METRICS_INTERVAL)
+    
     # Start the Tkinter event loop
     root.mainloop()
+    
+    # Save the last turn's latency trace
+    tracer.close()
+    if metrics.enabled:
+        metrics.stop_periodic_dump(METRICS_FILE)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
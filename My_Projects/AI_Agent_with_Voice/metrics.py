@@ -0,0 +1,282 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Default histogram buckets in milliseconds (upper bounds, the last bucket is open)
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# For per-chunk / per-character work that takes well under a millisecond
+FINE_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)
+
+class Counter:
+    """Monotonic count"""
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Recording is a short scan and a few additions, and
+    memory stays constant no matter how many values are observed.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = 0
+        # Buckets are few, a linear scan beats bisect's call overhead here
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (max for the open bucket)"""
+        if not self.count:
+            return None
+        target = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": round(self.max, 3),
+            "buckets": {f"le_{b}": c for b, c in zip(self.buckets, self.counts) if c},
+            "overflow": self.counts[-1],
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads at a fixed interval (cProfile only sees
+    the thread that enabled it, but generation, TTS and audio run on their own).
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = {}  # Innermost frame -> samples
+        self.total_counts = {}  # Any frame on the stack -> samples
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                seen = set()
+                innermost = True
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_filename, code.co_firstlineno, code.co_name)
+                    if innermost:
+                        self.self_counts[key] = self.self_counts.get(key, 0) + 1
+                        innermost = False
+                    if key not in seen:
+                        seen.add(key)
+                        self.total_counts[key] = self.total_counts.get(key, 0) + 1
+                    frame = frame.f_back
+
+    def report(self, limit=30):
+        """Top functions by own and cumulative samples"""
+        lines = [f"{self.samples} samples every {self.interval * 1000:g}ms"]
+        for title, counts in (("self", self.self_counts), ("cumulative", self.total_counts)):
+            lines.append(f"\n--- {title} ---")
+            for (filename, line, name), count in sorted(counts.items(), key=lambda kv: -kv[1])[:limit]:
+                share = count / self.samples if self.samples else 0
+                lines.append(f"{share:7.1%} {count:7d}  {name} ({os.path.basename(filename)}:{line})")
+        return "\n".join(lines) + "\n"
+
+
+NULL_TIMER = nullcontext()  # Shared, reusable no-op context for disabled timers
+
+class MetricsRegistry:
+    """
+    Named counters and histograms for the voice pipeline.
+
+    When disabled every call returns right away (timers hand out a shared
+    no-op context), so the instrumentation can stay in the hot paths.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.dump_thread = None
+        self.dump_stop = threading.Event()
+        self.profiler = None
+        self.profile_mode = None
+
+    def counter(self, name):
+        counter = self.counters.get(name)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(name, Counter())
+        return counter
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS_MS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(buckets))
+        return histogram
+
+    def inc(self, name, amount=1):
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS_MS):
+        if self.enabled:
+            self.histogram(name, buckets).observe(value)
+
+    def timer(self, name, buckets=DEFAULT_BUCKETS_MS):
+        """Context manager recording the duration of the block in ms under name"""
+        if not self.enabled:
+            return NULL_TIMER
+        return self._timer(name, buckets)
+
+    @contextmanager
+    def _timer(self, name, buckets):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, buckets).observe((time.perf_counter() - start) * 1000)
+
+    def timed(self, name, buckets=DEFAULT_BUCKETS_MS):
+        """Decorator version of timer()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.histogram(name, buckets).observe((time.perf_counter() - start) * 1000)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """All metrics as a JSON-friendly dict"""
+        return {
+            "timestamp": time.time(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "counters": {name: c.value for name, c in sorted(self.counters.items())},
+            "histograms": {name: h.snapshot() for name, h in sorted(self.histograms.items())},
+        }
+
+    def dump(self, path):
+        """Append a snapshot to a JSONL file"""
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot()) + "\n")
+        except OSError as e:
+            print(f"Could not write metrics: {e}")
+
+    def start_periodic_dump(self, path, interval=60.0):
+        """Dump a snapshot every interval seconds from a background thread"""
+        if self.dump_thread and self.dump_thread.is_alive():
+            return
+        self.dump_stop.clear()
+
+        def run():
+            while not self.dump_stop.wait(interval):
+                self.dump(path)
+
+        self.dump_thread = threading.Thread(target=run, daemon=True, name="metrics-dump")
+        self.dump_thread.start()
+
+    def stop_periodic_dump(self, path=None):
+        """Stop the dump thread, writing one last snapshot if a path is given"""
+        self.dump_stop.set()
+        if path:
+            self.dump(path)
+
+    # --- Profiling ---
+
+    def start_profiling(self, mode="sampling"):
+        """Start the sampling profiler (all threads) or cProfile (calling thread only)"""
+        if self.profiler is not None:
+            return
+        if mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+        self.profile_mode = mode
+
+    def stop_profiling(self, path):
+        """Stop profiling and write the report to path, returns the path"""
+        if self.profiler is None:
+            return None
+        if self.profile_mode == "cprofile":
+            self.profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            report = out.getvalue()
+        else:
+            self.profiler.stop()
+            report = self.profiler.report()
+        self.profiler = None
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        return path
+
+    def toggle_profiling(self, path, mode="sampling"):
+        """Start profiling, or stop it and write the report - returns True while running"""
+        if self.profiler is None:
+            self.start_profiling(mode)
+            return True
+        self.stop_profiling(path)
+        return False
+
+
+# Shared registry - enable with VOICE_METRICS=1
+metrics = MetricsRegistry(enabled=os.getenv("VOICE_METRICS", "") == "1")
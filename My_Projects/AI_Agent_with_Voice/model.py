@@ -1,5 +1,61 @@
 import requests
-import re
+import json
+import threading
+import time
+from think_filter import ThinkTagFilter, split_thinking
+from metrics import metrics, FINE_BUCKETS_MS
+from request_scheduler import PRIORITY_BACKGROUND
+
+# Models that reason on their own and emit <think>...</think> before the answer
+NATIVE_THINKING_MODELS = {"deepseek-r1:32b", "qwq:latest"}
+
+class GenerationError(Exception):
+    """A generation failed - there is no reply to show or keep in memory"""
+
+class GenerationHandle:
+    """
+    Handle for an in-flight generation. Cancelling it closes the streaming
+    connection, which makes Ollama stop generating right away.
+    """
+    def __init__(self, generation_id=0):
+        self.generation_id = generation_id
+        self.cancelled_event = threading.Event()
+        self.response = None  # Streaming HTTP response while the request is running
+        self.future = None  # Future of the task when running on the AgentCore
+    
+    def attach(self, response):
+        """Attach the streaming response (closed immediately if already cancelled)"""
+        self.response = response
+        if self.is_cancelled():
+            self._close()
+    
+    def attach_future(self, future):
+        """Attach the AgentCore task running the generation"""
+        self.future = future
+        if self.is_cancelled():
+            future.cancel()
+    
+    def cancel(self):
+        """Cancel the generation and free the Ollama server"""
+        self.cancelled_event.set()
+        self._close()
+        if self.future is not None:
+            # Cancelling the task closes its socket
+            self.future.cancel()
+    
+    def is_cancelled(self):
+        """Check if the generation was cancelled"""
+        return self.cancelled_event.is_set()
+    
+    def _close(self):
+        """Close the streaming connection"""
+        response = self.response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
 
 class ChatbotModel:
     """
@@ -9,6 +65,13 @@ class ChatbotModel:
         self.model_name = model_name
         self.api_endpoint = "http://localhost:11434/api/generate"
         
+        # Generation options - set "seed" (or temperature 0) to make answers repeatable and cacheable
+        self.options = {"num_predict": 512}
+        # Optional ResponseCache for the blocking generate_response (the AgentCore client has its own)
+        self.response_cache = None
+        # Optional SemanticCache - answers near-identical questions without generating
+        self.semantic_cache = None
+        
         # Initialize conversation memory
         self.system_message = """<|im_start|>system
 You are a helpful AI assistant that provides clear, accurate, and thoughtful responses.
@@ -27,7 +90,7 @@ You are a helpful AI assistant that provides clear, accurate, and thoughtful res
         """Remove thinking tags based on show_thinking setting"""
         if not show_thinking:
             # Remove anything between <think> and </think> tags
-            cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+            _, cleaned = split_thinking(text)
         else:
             # Keep thinking but make it visually distinct
             cleaned = text.replace('<think>', '\n--- THINKING ---\n').replace('</think>', '\n--- END THINKING ---\n')
@@ -35,7 +98,44 @@ You are a helpful AI assistant that provides clear, accurate, and thoughtful res
         cleaned = cleaned.lstrip()
         return cleaned
     
-    def format_conversation(self):
+    def has_native_thinking(self):
+        """Check if the current model emits its own <think> section"""
+        return self.model_name in NATIVE_THINKING_MODELS
+    
+    def _last_exchange(self, pending_message=None):
+        """Get the last user turn and the AI reply before it"""
+        question = pending_message
+        previous_reply = ""
+        for item in reversed(self.memory):
+            if "agent" in item:
+                previous_reply = item["agent"]
+                break
+            if "user" in item and question is None:
+                question = item["user"]
+        return question, previous_reply
+    
+    def semantic_lookup(self, pending_message=None):
+        """Look up the last user turn in the semantic cache, returns (answer, cache_key)"""
+        if self.semantic_cache is None or not self.semantic_cache.is_active(self.model_name):
+            return None, None
+        question, previous_reply = self._last_exchange(pending_message)
+        if not question:
+            return None, None
+        
+        model_name = self.model_name
+        fingerprint = self.semantic_cache.context_fingerprint(model_name, self.system_message, previous_reply)
+        answer, vector = self.semantic_cache.lookup(model_name, question, fingerprint)
+        return answer, (model_name, question, fingerprint, vector)
+    
+    def semantic_store(self, cache_key, answer):
+        """Remember an answer for the question looked up with semantic_lookup"""
+        if cache_key is None or self.semantic_cache is None:
+            return
+        model_name, question, fingerprint, vector = cache_key
+        self.semantic_cache.add(model_name, question, fingerprint, answer, vector)
+    
+    @metrics.timed("model.format_conversation_ms", FINE_BUCKETS_MS)
+    def format_conversation(self, pending_message=None):
         """Format the conversation history for the AI model"""
         formatted_conversation = ""
         for item in self.memory:
@@ -45,35 +145,227 @@ You are a helpful AI assistant that provides clear, accurate, and thoughtful res
                 formatted_conversation += f"<|im_start|>user\n{item['user']}<|im_end|>\n"
             elif "agent" in item:
                 formatted_conversation += f"<|im_start|>assistant\n{item['agent']}<|im_end|>\n"
+        
+        # A user message that isn't in memory yet (e.g. a speculative request)
+        if pending_message is not None:
+            formatted_conversation += f"<|im_start|>user\n{pending_message}<|im_end|>\n"
         return formatted_conversation
     
-    def generate_response(self, show_thinking=False):
-        """Generate the AI's response directly"""
+    @metrics.timed("model.generate_response_ms")
+    def generate_response(self, show_thinking=False, pending_message=None, handle=None, use_cache=True):
+        """Generate the AI's response directly (returns None if the handle was cancelled)"""
+        metrics.inc("model.requests")
         # Format the conversation history
-        formatted_conversation = self.format_conversation()
+        formatted_conversation = self.format_conversation(pending_message)
         
         # Add assistant prompt
         formatted_conversation += f"<|im_start|>assistant\n"
         
         try:
-            # Make API request
+            if handle and handle.is_cancelled():
+                return None
+            
+            # A near-identical question was answered before in this context
+            cache_key = None
+            if use_cache:
+                cached, cache_key = self.semantic_lookup(pending_message)
+                if cached is not None:
+                    metrics.inc("model.semantic_cache_hits")
+                    return cached
+            
+            # Same deterministic request as before - no need to ask Ollama again
+            if self.response_cache is not None:
+                cached = self.response_cache.get(self.model_name, formatted_conversation, self.options)
+                if cached is not None:
+                    metrics.inc("model.response_cache_hits")
+                    return self.remove_thinking(cached, show_thinking)
+            
+            # Make a streaming API request so the connection can be closed to cancel it
+            request_start = time.perf_counter()
             response = requests.post(
                 self.api_endpoint,
                 json={
                     "model": self.model_name,
                     "prompt": formatted_conversation,
-                    "stream": False,
-                    "options": {
-                        "num_predict": 512
-                    }
-                }
+                    "stream": True,
+                    "options": self.options
+                },
+                stream=True
             )
+            if handle:
+                handle.attach(response)
+            
+            # Collect the streamed tokens
+            full_response = ""
+            tokens = 0
+            with response:
+                for line in response.iter_lines():
+                    if handle and handle.is_cancelled():
+                        return None
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        if not tokens:
+                            metrics.observe("model.ttft_ms", (time.perf_counter() - request_start) * 1000)
+                        tokens += 1
+                    full_response += chunk.get("response", "")
+                    if chunk.get("done", False):
+                        break
+            
+            if handle and handle.is_cancelled():
+                return None
+            metrics.inc("model.tokens", tokens)
+            
+            if self.response_cache is not None:
+                self.response_cache.put(self.model_name, formatted_conversation, self.options, full_response)
             
-            # Extract and clean the response
-            result = response.json()
-            full_response = result["response"]
+            # Clean the response
             cleaned_response = self.remove_thinking(full_response, show_thinking)
             
+            # The cache keeps the answer only, without the thinking
+            self.semantic_store(cache_key, self.remove_thinking(full_response))
+            
             return cleaned_response
         except Exception as e:
-            return f"Error: {str(e)}"
\ No newline at end of file
+            # Closing the connection from another thread ends up here
+            if handle and handle.is_cancelled():
+                return None
+            metrics.inc("model.errors")
+            return f"Error: {str(e)}"
+    
+    async def agenerate_response(self, core, show_thinking=False, pending_message=None, on_token=None, use_cache=True):
+        """Generate the AI's response on the AgentCore (cancel the task to stop it, raises GenerationError)"""
+        # Format the conversation history
+        formatted_conversation = self.format_conversation(pending_message)
+        
+        # Add assistant prompt
+        formatted_conversation += f"<|im_start|>assistant\n"
+        
+        try:
+            cache_key = None
+            if use_cache and self.semantic_cache is not None:
+                cached, cache_key = await core.run_blocking("cache", self.semantic_lookup, pending_message)
+                if cached is not None:
+                    metrics.inc("model.semantic_cache_hits")
+                    if on_token:
+                        on_token(cached)
+                    return cached
+            
+            full_response = await core.stream(
+                "answer",
+                self.model_name,
+                formatted_conversation,
+                options=self.options,
+                on_token=on_token
+            )
+            if cache_key is not None:
+                await core.run_blocking("cache", self.semantic_store, cache_key, self.remove_thinking(full_response))
+            return self.remove_thinking(full_response, show_thinking)
+        except GenerationError:
+            raise
+        except Exception as e:
+            raise GenerationError(str(e)) from e
+    
+    def build_thinking_prompt(self, pending_message=None):
+        """Prompt for the explicit thinking stage (models without native thinking)"""
+        formatted_conversation = self.format_conversation(pending_message)
+        formatted_conversation += "<|im_start|>system\nThink deeply about the user's latest question in the context of the entire conversation. Consider all relevant information from previous exchanges. This is just your internal thinking process.\n<|im_end|>\n"
+        formatted_conversation += "<|im_start|>assistant\n"
+        return formatted_conversation
+    
+    def build_answer_prompt(self, thinking, pending_message=None):
+        """Prompt for the answer stage, with the thinking as system context"""
+        formatted_conversation = self.format_conversation(pending_message)
+        formatted_conversation += f"<|im_start|>system\nBelow is your detailed thinking about the user's question. Use this analysis to provide a clear, concise, and helpful answer. Do not mention that you've done this thinking process.\n\n{thinking}\n<|im_end|>\n"
+        formatted_conversation += "<|im_start|>assistant\n"
+        return formatted_conversation
+    
+    async def thinking_cycle(self, core, pending_message=None, on_thinking=None):
+        """Explicit thinking stage for models that don't think on their own"""
+        thinking = await core.stream(
+            "think",
+            self.model_name,
+            self.build_thinking_prompt(pending_message),
+            options=self.options,
+            on_token=on_thinking
+        )
+        return thinking.strip()
+    
+    async def asummarize(self, core, priority=PRIORITY_BACKGROUND):
+        """Summarize the conversation so far - background work that waits behind replies on a shared server"""
+        formatted_conversation = self.format_conversation()
+        formatted_conversation += "<|im_start|>system\nSummarize the conversation so far in a few sentences. Keep names, facts and decisions.\n<|im_end|>\n"
+        formatted_conversation += "<|im_start|>assistant\n"
+        summary = await core.stream(
+            "summary",
+            self.model_name,
+            formatted_conversation,
+            options=self.options,
+            priority=priority
+        )
+        return self.remove_thinking(summary).strip()
+    
+    async def agenerate_reasoned_response(self, core, show_thinking=False, think_first=False,
+                                          pending_message=None, on_token=None, on_thinking=None,
+                                          use_cache=True):
+        """
+        Generate a response with reasoning, using as few model calls as possible.
+        Reasoning models think and answer in ONE generation, split as it streams:
+        answer tokens go to on_token and thinking to on_thinking. Other models
+        only reason when think_first is set, with a separate thinking_cycle call.
+        Raises GenerationError when the generation fails.
+        """
+        try:
+            # Near-identical question already answered - skip the reasoning entirely
+            cache_key = None
+            if use_cache and self.semantic_cache is not None:
+                cached, cache_key = await core.run_blocking("cache", self.semantic_lookup, pending_message)
+                if cached is not None:
+                    metrics.inc("model.semantic_cache_hits")
+                    if on_token:
+                        on_token(cached)
+                    return cached
+            
+            if self.has_native_thinking():
+                formatted_conversation = self.format_conversation(pending_message)
+                formatted_conversation += f"<|im_start|>assistant\n"
+                
+                # Split the stream as it arrives - answer tokens are forwarded without waiting
+                think_filter = ThinkTagFilter(on_answer=on_token, on_thinking=on_thinking)
+                
+                await core.stream(
+                    "answer",
+                    self.model_name,
+                    formatted_conversation,
+                    # Thinking and answer share the budget of what used to be two calls
+                    options={**self.options, "num_predict": 1024},
+                    on_token=think_filter.feed
+                )
+                think_filter.flush()
+                thinking, answer = think_filter.thinking.strip(), think_filter.answer
+            elif think_first:
+                thinking = await self.thinking_cycle(core, pending_message, on_thinking)
+                answer = await core.stream(
+                    "answer",
+                    self.model_name,
+                    self.build_answer_prompt(thinking, pending_message),
+                    options=self.options,
+                    on_token=on_token
+                )
+                answer = answer.lstrip()
+            else:
+                thinking = ""
+                answer = await self.agenerate_response(core, pending_message=pending_message, on_token=on_token,
+                                                       use_cache=False)
+            
+            if cache_key is not None:
+                await core.run_blocking("cache", self.semantic_store, cache_key, answer)
+            
+            if show_thinking and thinking:
+                return f"--- THINKING ---\n{thinking}\n--- END THINKING ---\n{answer}"
+            return answer
+        except GenerationError:
+            raise
+        except Exception as e:
+            raise GenerationError(str(e)) from e
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+class ModelResidencyManager:
+    """
+    Keeps the selected model loaded in Ollama so the first reply after a switch
+    isn't a cold start.
+
+    - preload: an empty-prompt request makes Ollama load the model right away
+    - keep_alive: per model, sent with every request so idle models stay loaded
+    - pre-warm: optionally loads the model most likely to be picked next
+    - progress: Ollama doesn't report load progress, so it is estimated from
+      how long the model took to load before
+    """
+    def __init__(self, core, models, keep_alive=None, default_keep_alive="10m", prewarm=False,
+                 unload_previous=True, progress_interval=0.5):
+        self.core = core
+        self.client = core.client
+        self.models = list(models)  # Dropdown order
+        # Big models are slow to load - keep them around longer
+        self.keep_alive = {"deepseek-r1:32b": "30m", "qwq:latest": "30m"}
+        if keep_alive:
+            self.keep_alive.update(keep_alive)
+        self.default_keep_alive = default_keep_alive
+        self.prewarm = prewarm  # Off by default, two 32B models rarely fit in VRAM together
+        self.unload_previous = unload_previous
+        self.progress_interval = progress_interval
+
+        self.current_model = None
+        self.usage_counts = {}
+        self.load_times = {}  # model -> seconds of the last load (estimates progress)
+        self.loaded = set()
+        self.loading_task = None
+
+        # The client sends the per-model keep_alive with every generation
+        for model in self.models:
+            self.client.keep_alive[model] = self.keep_alive_for(model)
+
+    def keep_alive_for(self, model):
+        """How long Ollama keeps a model loaded after its last request"""
+        return self.keep_alive.get(model, self.default_keep_alive)
+
+    async def loaded_models(self):
+        """Names of the models Ollama currently has in memory"""
+        try:
+            status = await self.client.get_json("/api/ps")
+        except Exception as e:
+            print(f"Could not get loaded models: {e}")
+            return set()
+        return {m.get("name") for m in status.get("models", [])}
+
+    async def preload(self, model, on_progress=None):
+        """Load a model with an empty-prompt request, returns the load time in seconds"""
+        start = time.time()
+        request = asyncio.ensure_future(self.client.load_model(model, self.keep_alive_for(model)))
+
+        # Estimated progress while waiting (the last load time of this model, or a guess)
+        expected = self.load_times.get(model, 20.0 if "32b" in model else 5.0)
+        try:
+            while not request.done():
+                if on_progress:
+                    elapsed = time.time() - start
+                    percent = min(95, int(100 * elapsed / expected))
+                    on_progress(f"Loading {model}... {percent}% ({elapsed:.0f}s)")
+                await asyncio.wait([request], timeout=self.progress_interval)
+        except asyncio.CancelledError:
+            # Superseded by a newer switch - don't let this model finish loading (and stay resident)
+            request.cancel()
+            raise
+
+        request.result()  # Raise if the load failed
+        load_time = time.time() - start
+        # Very quick means it was already loaded - that says nothing about load time
+        if load_time > 1.0:
+            self.load_times[model] = load_time
+        self.loaded.add(model)
+        return load_time
+
+    async def unload(self, model):
+        """Ask Ollama to free a model right away"""
+        try:
+            await self.client.load_model(model, keep_alive=0)
+        except Exception as e:
+            print(f"Could not unload {model}: {e}")
+        self.loaded.discard(model)
+
+    def next_likely_model(self):
+        """The model most likely to be selected next: most used, else the next in the dropdown"""
+        others = [m for m in self.models if m != self.current_model]
+        if not others:
+            return None
+        used = [m for m in others if self.usage_counts.get(m)]
+        if used:
+            return max(used, key=lambda m: self.usage_counts[m])
+        position = self.models.index(self.current_model) if self.current_model in self.models else -1
+        return self.models[(position + 1) % len(self.models)]
+
+    async def switch_to(self, model, on_progress=None):
+        """Make a model the active one: unload the previous one, preload it, maybe pre-warm another"""
+        previous = self.current_model
+        self.current_model = model
+        self.usage_counts[model] = self.usage_counts.get(model, 0) + 1
+
+        if previous and previous != model and self.unload_previous:
+            await self.unload(previous)
+
+        try:
+            load_time = await self.preload(model, on_progress)
+        except Exception as e:
+            if on_progress:
+                on_progress(f"Could not load {model}: {e}")
+            return False
+
+        if on_progress:
+            on_progress(f"{model} ready (loaded in {load_time:.1f}s)")
+
+        if self.prewarm:
+            next_model = self.next_likely_model()
+            if next_model and next_model not in self.loaded:
+                print(f"Pre-warming {next_model}")
+                try:
+                    await self.preload(next_model)
+                except Exception as e:
+                    print(f"Could not pre-warm {next_model}: {e}")
+        return True
+
+    def request_switch(self, model, on_progress=None):
+        """Switch from any thread - a newer switch cancels one that is still loading"""
+        # Cancelling the concurrent future is thread safe: run_coroutine_threadsafe
+        # hands the cancel to the core's loop with call_soon_threadsafe
+        if self.loading_task is not None and not self.loading_task.done():
+            self.loading_task.cancel()
+        self.loading_task = self.core.submit(self.switch_to(model, on_progress))
+        return self.loading_task
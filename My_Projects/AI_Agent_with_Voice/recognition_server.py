@@ -0,0 +1,275 @@
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from vosk import Model, KaldiRecognizer
+from speech import SpeechRecognizer
+
+class RecognitionSession:
+    """
+    One audio stream (one operator / microphone) with its own KaldiRecognizer.
+    The heavy Vosk Model is shared, only the recognizer state is per session.
+    """
+    def __init__(self, session_id, model, sample_rate=16000, max_pending_chunks=32, send=None):
+        self.session_id = session_id
+        self.recognizer = KaldiRecognizer(model, sample_rate)
+        self.recognizer.SetWords(True)
+
+        # Bounded queue - when it is full the socket reader blocks (backpressure)
+        self.audio_queue = queue.Queue(maxsize=max_pending_chunks)
+        self.send = send  # Function used to push results back to the client
+
+        # Guards the scheduling flag - a session is handed to at most one worker at a time,
+        # which keeps the (not thread safe) KaldiRecognizer on a single thread
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.closed = False
+        self.drained = threading.Event()
+        self.drained.set()
+        self.last_partial_text = ""
+        self.odd_byte = b""  # Half of a 16-bit sample left over from the last read
+
+        # Per-session metrics
+        self.created_at = time.time()
+        self.bytes_received = 0
+        self.chunks_processed = 0
+        self.backpressure_waits = 0
+        self.partial_results = 0
+        self.final_results = 0
+        self.processing_time = 0.0
+
+    def metrics(self):
+        """Get a snapshot of this session's metrics"""
+        return {
+            "session_id": self.session_id,
+            "uptime": round(time.time() - self.created_at, 2),
+            "bytes_received": self.bytes_received,
+            "chunks_processed": self.chunks_processed,
+            "pending_chunks": self.audio_queue.qsize(),
+            "backpressure_waits": self.backpressure_waits,
+            "partial_results": self.partial_results,
+            "final_results": self.final_results,
+            "processing_time": round(self.processing_time, 3),
+        }
+
+
+class RecognitionServer:
+    """
+    Recognition service that keeps ONE Vosk model in memory and multiplexes
+    many recognition sessions over a fixed pool of worker threads.
+
+    Clients connect over a local TCP socket and stream raw 16-bit mono PCM at
+    the server sample rate. Results are sent back as one JSON object per line:
+        {"type": "partial", "text": "..."}
+        {"type": "final", "text": "..."}
+    """
+    def __init__(self, model_path=None, sample_rate=16000, max_workers=4, max_pending_chunks=32,
+                 chunks_per_turn=4, host="127.0.0.1", port=2700):
+        self.sample_rate = sample_rate
+        self.max_pending_chunks = max_pending_chunks
+        self.chunks_per_turn = chunks_per_turn  # Chunks a worker handles before yielding to other sessions
+        self.host = host
+        self.port = port
+
+        # Load the model once - every session shares it
+        self.model_path = SpeechRecognizer.locate_model_path(model_path)
+        self.model = Model(self.model_path)
+        print(f"Loaded shared Vosk model from {self.model_path}")
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vosk-worker")
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.next_session_id = 1
+        self.total_sessions = 0
+        self.tcp_server = None
+
+    def create_session(self, send=None):
+        """Create a new recognition session that shares the loaded model"""
+        with self.sessions_lock:
+            session_id = self.next_session_id
+            self.next_session_id += 1
+            session = RecognitionSession(
+                session_id,
+                self.model,
+                sample_rate=self.sample_rate,
+                max_pending_chunks=self.max_pending_chunks,
+                send=send
+            )
+            self.sessions[session_id] = session
+            self.total_sessions += 1
+        print(f"Session {session_id} opened ({len(self.sessions)} active)")
+        return session
+
+    def feed(self, session, audio_data, timeout=None):
+        """Queue PCM audio for a session, blocking while the session is backed up"""
+        session.bytes_received += len(audio_data)
+
+        # Socket reads can end in the middle of a sample - only queue whole samples
+        if session.odd_byte:
+            audio_data = session.odd_byte + audio_data
+        whole = len(audio_data) - len(audio_data) % 2
+        session.odd_byte = audio_data[whole:]
+        audio_data = audio_data[:whole]
+        if not audio_data:
+            return
+        try:
+            session.audio_queue.put_nowait(audio_data)
+        except queue.Full:
+            # The workers are behind - block the producer until there is room
+            session.backpressure_waits += 1
+            session.audio_queue.put(audio_data, timeout=timeout)
+        self._schedule(session)
+
+    def close_session(self, session, timeout=10.0):
+        """Finish a session: process remaining audio, send the final result and drop it"""
+        session.closed = True
+        self._schedule(session)
+        if session.drained.wait(timeout=timeout):
+            result = json.loads(session.recognizer.FinalResult())
+            text = result.get("text", "").strip()
+            if text:
+                session.final_results += 1
+                self._send(session, {"type": "final", "text": text})
+        else:
+            # A worker still owns the recognizer (not thread safe) - skip the final result
+            print(f"Session {session.session_id} did not drain within {timeout}s, dropping its final result")
+
+        with self.sessions_lock:
+            self.sessions.pop(session.session_id, None)
+        print(f"Session {session.session_id} closed: {session.metrics()}")
+
+    def _schedule(self, session):
+        """Hand a session to the worker pool if it has audio and isn't already scheduled"""
+        with session.lock:
+            if session.scheduled or session.audio_queue.empty():
+                return
+            session.scheduled = True
+            session.drained.clear()
+        self.executor.submit(self._process_session, session)
+
+    def _process_session(self, session):
+        """Worker: run a few chunks through the session's recognizer, then yield"""
+        try:
+            for _ in range(self.chunks_per_turn):
+                try:
+                    audio_data = session.audio_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                start = time.perf_counter()
+                is_final = session.recognizer.AcceptWaveform(audio_data)
+                payload = session.recognizer.Result() if is_final else session.recognizer.PartialResult()
+                session.processing_time += time.perf_counter() - start
+                session.chunks_processed += 1
+
+                if is_final:
+                    text = json.loads(payload).get("text", "").strip()
+                    session.last_partial_text = ""
+                    if text:
+                        session.final_results += 1
+                        self._send(session, {"type": "final", "text": text})
+                else:
+                    text = json.loads(payload).get("partial", "").strip()
+                    if text and text != session.last_partial_text:
+                        session.last_partial_text = text
+                        session.partial_results += 1
+                        self._send(session, {"type": "partial", "text": text})
+        except Exception as e:
+            print(f"Error processing session {session.session_id}: {e}")
+        finally:
+            with session.lock:
+                session.scheduled = False
+                idle = session.audio_queue.empty()
+                if idle:
+                    session.drained.set()
+            # More audio arrived while we were working - go round again (after other sessions)
+            if not idle:
+                self._schedule(session)
+
+    def _send(self, session, message):
+        """Send a result message to the session's client"""
+        if not session.send:
+            return
+        try:
+            session.send(message)
+        except Exception as e:
+            print(f"Could not send result to session {session.session_id}: {e}")
+
+    def metrics(self):
+        """Get server-wide and per-session metrics"""
+        with self.sessions_lock:
+            sessions = [s.metrics() for s in self.sessions.values()]
+        return {
+            "active_sessions": len(sessions),
+            "total_sessions": self.total_sessions,
+            "pending_chunks": sum(s["pending_chunks"] for s in sessions),
+            "backpressure_waits": sum(s["backpressure_waits"] for s in sessions),
+            "sessions": sessions,
+        }
+
+    def serve_forever(self, metrics_interval=10.0):
+        """Accept PCM streams over TCP until interrupted"""
+        server = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                send_lock = threading.Lock()
+
+                def send(message):
+                    data = (json.dumps(message) + "\n").encode("utf-8")
+                    with send_lock:
+                        self.request.sendall(data)
+
+                session = server.create_session(send=send)
+                try:
+                    while True:
+                        # 0.25s of audio per chunk at 16kHz / 16-bit
+                        data = self.request.recv(8000)
+                        if not data:
+                            break
+                        server.feed(session, data)
+                except (ConnectionError, socket.timeout) as e:
+                    print(f"Session {session.session_id} connection error: {e}")
+                finally:
+                    server.close_session(session)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.tcp_server = socketserver.ThreadingTCPServer((self.host, self.port), _Handler)
+        self.tcp_server.daemon_threads = True
+
+        # Periodically print metrics
+        def report_metrics():
+            while self.tcp_server:
+                time.sleep(metrics_interval)
+                m = self.metrics()
+                print(f"[metrics] active={m['active_sessions']} total={m['total_sessions']} "
+                      f"pending={m['pending_chunks']} backpressure={m['backpressure_waits']}")
+
+        if metrics_interval:
+            threading.Thread(target=report_metrics, daemon=True).start()
+
+        print(f"Recognition server listening on {self.host}:{self.port}")
+        try:
+            self.tcp_server.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop accepting connections and stop the worker pool"""
+        if self.tcp_server:
+            tcp_server = self.tcp_server
+            self.tcp_server = None
+            tcp_server.server_close()
+        self.executor.shutdown(wait=False)
+
+
+# Run the server
+if __name__ == "__main__":
+    server = RecognitionServer()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Recognition server stopped.")
@@ -0,0 +1,107 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Priority classes - lower runs first
+PRIORITY_INTERACTIVE = 0  # A user is waiting for the reply
+PRIORITY_BACKGROUND = 10  # Summaries, pre-computation, anything nobody is watching
+
+class RequestScheduler:
+    """
+    Client-side scheduler for requests from many sessions to one Ollama server.
+
+    Ollama only runs OLLAMA_NUM_PARALLEL requests at a time and queues the
+    rest in arrival order. Queueing here instead lets us decide the order:
+    interactive before background, and short requests before long ones within
+    the same priority. The wait time of every request is recorded.
+    Must be used from the event loop that runs the requests.
+    """
+    def __init__(self, max_concurrent=None, window=500):
+        if max_concurrent is None:
+            # Match the server's parallel slots
+            max_concurrent = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+        self.max_concurrent = max(1, max_concurrent)
+        self.running = 0
+        self.queue = []  # Heap of (priority, cost, sequence, future)
+        self.sequence = itertools.count()  # Keeps arrival order among equals
+
+        # Wait times per priority class (recent window)
+        self.wait_times = {}
+        self.window = window
+        self.completed = 0
+        self.max_queue_depth = 0
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_INTERACTIVE, cost=0):
+        """Hold one server slot while the block runs (cost: e.g. expected tokens, shorter goes first)"""
+        queued_at = time.time()
+        await self._acquire(priority, cost)
+        self._record_wait(priority, time.time() - queued_at)
+        try:
+            yield
+        finally:
+            self.completed += 1
+            self._release()
+
+    async def _acquire(self, priority, cost):
+        """Take a slot now, or wait in the queue for one"""
+        # While a slot is free nobody is waiting (released slots go straight to a waiter)
+        if self.running < self.max_concurrent:
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, cost, next(self.sequence), future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just as we were cancelled - pass it on
+                self._release()
+            raise
+
+    def _release(self):
+        """Give the slot to the best waiting request"""
+        while self.queue:
+            _, _, _, future = heapq.heappop(self.queue)
+            if not future.done():
+                # The slot moves to the waiter, running stays the same
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    def _record_wait(self, priority, seconds):
+        waits = self.wait_times.setdefault(priority, deque(maxlen=self.window))
+        waits.append(seconds)
+
+    def queue_depth(self):
+        """Requests waiting for a slot"""
+        return sum(1 for entry in self.queue if not entry[3].done())
+
+    def stats(self):
+        """Queue state and wait time percentiles per priority"""
+        def percentile(values, p):
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "wait": {
+                priority: {
+                    "count": len(waits),
+                    "p50": round(percentile(waits, 50), 3),
+                    "p95": round(percentile(waits, 95), 3),
+                    "max": round(max(waits), 3),
+                }
+                for priority, waits in self.wait_times.items() if waits
+            },
+        }
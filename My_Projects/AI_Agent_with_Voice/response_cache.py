@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_cache")
+
+class ResponseCache:
+    """
+    On-disk cache of complete responses for identical requests.
+
+    The key is a hash of (model, prompt, options). Only deterministic requests
+    are cached - temperature 0 or a fixed seed - since any other request is
+    supposed to give a different answer each time. Entries expire after a TTL
+    and the least recently used ones are evicted above the size caps.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=7 * 24 * 3600, max_entries=1000, max_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl  # Seconds an entry stays valid (None for no expiry)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # key -> size in bytes, least recently used first
+        self.index = OrderedDict()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files' access times (mtime is touched on every hit)"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+
+    @staticmethod
+    def is_deterministic(options):
+        """Only greedy (temperature 0) or seeded requests give repeatable answers"""
+        options = options or {}
+        return options.get("temperature") == 0 or options.get("seed") is not None
+
+    @staticmethod
+    def make_key(model, prompt, options):
+        """Hash of everything that decides the response"""
+        payload = json.dumps([model, prompt, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, model, prompt, options=None):
+        """Get the cached response, or None (also None for non-deterministic requests)"""
+        if not self.is_deterministic(options):
+            return None
+        key = self.make_key(model, prompt, options)
+
+        with self.lock:
+            if key not in self.index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            if self.ttl is not None and time.time() - entry["created"] > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            # Mark as recently used (in memory and on disk for the next run)
+            self.index.move_to_end(key)
+            os.utime(path, None)
+            self.hits += 1
+            return entry["response"]
+
+    def put(self, model, prompt, options, response):
+        """Store a complete response (ignored for non-deterministic requests)"""
+        if not self.is_deterministic(options):
+            return
+        key = self.make_key(model, prompt, options)
+        entry = {"model": model, "options": options, "created": time.time(), "response": response}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+
+        with self.lock:
+            try:
+                with open(self._path(key), "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                print(f"Could not write response cache entry: {e}")
+                return
+            self.index[key] = len(data)
+            self.index.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until both caps are respected"""
+        total = sum(self.index.values())
+        while self.index and (len(self.index) > self.max_entries or total > self.max_bytes):
+            key, size = next(iter(self.index.items()))
+            self._remove(key)
+            total -= size
+
+    def _remove(self, key):
+        """Delete one entry"""
+        self.index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Delete every entry"""
+        with self.lock:
+            for key in list(self.index):
+                self._remove(key)
+
+    def stats(self):
+        """Hit/miss counters and size"""
+        with self.lock:
+            return {
+                "entries": len(self.index),
+                "bytes": sum(self.index.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+import requests
+
+DEFAULT_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_cache.json")
+
+class SemanticCache:
+    """
+    Cache of answers for near-identical questions.
+
+    The last user turn is embedded (Ollama embeddings API) and compared with
+    earlier questions asked in the same context - the context fingerprint is a
+    hash of the model, the system message and the previous AI reply. If the
+    cosine similarity is above the model's threshold the cached answer is
+    returned, so common questions skip a multi-second generation.
+    """
+    def __init__(self, embedding_model="nomic-embed-text", api_url="http://localhost:11434/api/embeddings",
+                 thresholds=None, default_threshold=0.92, max_entries=500, index_file=DEFAULT_INDEX_FILE):
+        self.embedding_model = embedding_model
+        self.api_url = api_url
+        # Per model threshold - None disables the cache for that model
+        self.thresholds = thresholds or {}
+        self.default_threshold = default_threshold
+        self.max_entries = max_entries
+        self.index_file = index_file
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # Entries with their unit-length vectors, plus one matrix per (model, fingerprint)
+        self.entries = []
+        self.matrices = {}
+        self._load()
+
+    def threshold_for(self, model_name):
+        """Similarity threshold of a model (None if the cache is off for it)"""
+        return self.thresholds.get(model_name, self.default_threshold)
+
+    def is_active(self, model_name):
+        """Check if lookups should be made for this model"""
+        return self.enabled and self.threshold_for(model_name) is not None
+
+    @staticmethod
+    def context_fingerprint(model_name, system_message, previous_reply):
+        """Short hash of what the question depends on besides itself"""
+        text = f"{model_name}\n{system_message}\n{(previous_reply or '')[:300]}"
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+    def embed(self, text):
+        """Get the unit-length embedding of a text (None if the embedding model is unavailable)"""
+        try:
+            response = requests.post(
+                self.api_url,
+                json={"model": self.embedding_model, "prompt": text},
+                timeout=10
+            )
+            response.raise_for_status()
+            vector = np.array(response.json()["embedding"], dtype=np.float32)
+        except Exception as e:
+            # Without an embedding model there is no semantic cache - don't slow every turn down
+            print(f"Semantic cache disabled, embedding failed: {e}")
+            self.enabled = False
+            return None
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, model_name, question, fingerprint):
+        """Find a cached answer for a similar question, returns (answer, vector)"""
+        if not self.is_active(model_name):
+            return None, None
+        vector = self.embed(question)
+        if vector is None:
+            return None, None
+
+        with self.lock:
+            key = (model_name, fingerprint)
+            if key not in self.matrices:
+                self.misses += 1
+                return None, vector
+            matrix, positions = self.matrices[key]
+            if matrix.shape[1] != vector.shape[0]:
+                # The embedding model changed - old vectors can't be compared
+                self.misses += 1
+                return None, vector
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold_for(model_name):
+                self.misses += 1
+                return None, vector
+
+            entry = self.entries[positions[best]]
+            entry["hits"] += 1
+            self.hits += 1
+            print(f"Semantic cache hit ({similarities[best]:.3f}): '{entry['question']}'")
+            return entry["answer"], vector
+
+    def add(self, model_name, question, fingerprint, answer, vector=None):
+        """Store an answer (vector is the one returned by lookup, to avoid embedding twice)"""
+        if not self.is_active(model_name) or not answer or answer.startswith("Error:"):
+            return
+        if vector is None:
+            vector = self.embed(question)
+            if vector is None:
+                return
+
+        with self.lock:
+            self.entries.append({
+                "model": model_name,
+                "fingerprint": fingerprint,
+                "question": question,
+                "answer": answer,
+                "created": time.time(),
+                "hits": 0,
+                "vector": vector,
+            })
+            if len(self.entries) > self.max_entries:
+                # Drop the least useful entries: fewest hits, then oldest
+                self.entries.sort(key=lambda e: (e["hits"], e["created"]))
+                self.entries = self.entries[len(self.entries) - self.max_entries:]
+            self._rebuild_matrices()
+            self._save()
+
+    def _rebuild_matrices(self):
+        """Stack the vectors of each (model, fingerprint) for fast search"""
+        groups = {}
+        for position, entry in enumerate(self.entries):
+            groups.setdefault((entry["model"], entry["fingerprint"]), []).append(position)
+        self.matrices = {
+            key: (np.vstack([self.entries[p]["vector"] for p in positions]), positions)
+            for key, positions in groups.items()
+        }
+
+    def _load(self):
+        """Read the index from disk"""
+        if not self.index_file or not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, encoding="utf-8") as f:
+                stored = json.load(f)
+            for entry in stored:
+                entry["vector"] = np.array(entry["vector"], dtype=np.float32)
+            self.entries = stored
+            self._rebuild_matrices()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load semantic cache: {e}")
+            self.entries = []
+
+    def _save(self):
+        """Write the index to disk"""
+        if not self.index_file:
+            return
+        stored = [{**entry, "vector": entry["vector"].tolist()} for entry in self.entries]
+        try:
+            with open(self.index_file, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+        except OSError as e:
+            print(f"Could not save semantic cache: {e}")
+
+    def clear(self):
+        """Forget every cached answer"""
+        with self.lock:
+            self.entries = []
+            self.matrices = {}
+            self._save()
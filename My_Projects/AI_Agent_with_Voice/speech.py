@@ -4,16 +4,21 @@ import json
 import queue
 import threading
 import time
-import sounddevice as sd
 import numpy as np
 from vosk import Model, KaldiRecognizer
+from latency_trace import tracer
+from metrics import metrics, FINE_BUCKETS_MS
+from audio_io import default_backend
 
 class SpeechRecognizer:
     """
     Handles speech recognition using Vosk for offline processing
     """
-    def __init__(self, model_path=None, sample_rate=16000, device_index=None, default_device_name="SSL 2 USB Audio"):
+    def __init__(self, model_path=None, sample_rate=16000, device_index=None, default_device_name="SSL 2 USB Audio", model=None, blocksize=8000,
+                 audio=None):
         self.sample_rate = sample_rate
+        self.blocksize = blocksize  # Samples per audio callback (smaller = faster speech onset detection)
+        self.audio = audio or default_backend()  # Sound card or virtual device (see audio_io.py)
         
         # Try to find the preferred device if specified and device_index is None
         if device_index is None and default_device_name:
@@ -23,46 +28,8 @@ class SpeechRecognizer:
                 
         self.device_index = device_index
         
-        # Try to find the model in different locations
-        if model_path is None:
-            # List of possible model locations to try
-            possible_paths = [
-                "vosk-model-small-en-us-0.15",
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), "vosk-model-small-en-us-0.15"),
-                os.path.join(os.getcwd(), "vosk-model-small-en-us-0.15"),
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), "_pycache_", "vosk-model-small-en-us-0.15")
-            ]
-            
-            # Try each path
-            model_found = False
-            for path in possible_paths:
-                if os.path.exists(path):
-                    self.model_path = path
-                    model_found = True
-                    print(f"Found Vosk model at: {path}")
-                    break
-            
-            if not model_found:
-                print("VOSK model not found. Attempted these locations:")
-                for path in possible_paths:
-                    print(f"- {path}")
-                print("\nPlease download the model from https://alphacephei.com/vosk/models")
-                print("and extract it to one of the locations above.")
-                
-                # Ask user for model path
-                user_path = input("\nOr enter the full path to the model directory: ").strip()
-                if user_path and os.path.exists(user_path):
-                    self.model_path = user_path
-                    model_found = True
-                else:
-                    sys.exit(1)
-        else:
-            self.model_path = model_path
-            if not os.path.exists(self.model_path):
-                print(f"VOSK model not found at {self.model_path}")
-                print("Please download the model from https://alphacephei.com/vosk/models")
-                print(f"and extract it to {self.model_path}")
-                sys.exit(1)
+        # Find the model directory (shared lookup so other components can reuse it)
+        self.model_path = self.locate_model_path(model_path)
         
         self.recognizer = None
         self.audio_queue = queue.Queue()
@@ -72,9 +39,9 @@ class SpeechRecognizer:
         self.callback = None
         self.partial_callback = None  # New callback for partial results
         
-        # Initialize model
+        # Initialize model (a loaded Model can be passed in to share it between recognizers)
         try:
-            self.model = Model(self.model_path)
+            self.model = model if model is not None else Model(self.model_path)
             self.recognizer = KaldiRecognizer(self.model, self.sample_rate)
             self.recognizer.SetWords(True)  # Show word timestamps
             print(f"Successfully initialized Vosk model from {self.model_path}")
@@ -86,22 +53,86 @@ class SpeechRecognizer:
         self.silence_threshold = 0.03  # Energy level below which is considered silence
         self.speech_detected = False
         self.silent_frames = 0
-        self.silent_threshold = 30  # Number of silent frames before processing
+        self.silent_threshold = int(15 * sample_rate / blocksize)  # Number of silent frames (15s of audio) before processing
         self.current_speech = ""
         
         # Variables for handling partial results
-        self.last_partial_time = 0
-        self.partial_delay = 0.1  # Seconds between partial updates (shorter for word-by-word)
-        self.last_partial_text = ""  # Track the last partial text to detect new words
+        self.last_partial_text = ""  # Track the last partial text to detect changes
+        self.sent_word_count = 0  # Number of words of the current utterance already sent to word_callback
         
         # Variables for handling silence detection
-        self.silence_start_time = 0
+        self.silence_start_time = 0  # Stream clock (timeouts)
+        self.silence_start_wall = 0  # Wall clock, the latency tracer's time base
         self.silence_timeout = 2.0  # 2 seconds of silence to trigger completion (reduced from 3)
         self.word_callback = None  # Callback for individual words
+        
+        # Optional grammar-based command recognizer (see voice_commands.py)
+        self.command_recognizer = None
+        self.command_mode = "alongside"  # "alongside" dictation or "only" commands
+        
+        # Speech onset detection (used for barge-in while the assistant is speaking)
+        self.speech_start_callback = None
+        self.onset_frames = 0
+        self.onset_required_frames = 2  # Consecutive loud frames needed to count as speech
+        self.echo_reference = None  # Function returning the current playback level of our own voice
+        # How loud our own voice reaches the mic depends on the speakers, the room and the mic gain,
+        # so the coupling (mic energy per unit of playback level) is learned while only we are talking
+        self.echo_coupling = 1.0
+        self.echo_margin = 2.0  # The user must be this much louder than the expected echo
+        self.echo_calibration_time = 0.3  # Seconds at the start of each playback treated as echo only
+        self.playback_started_at = None
+        self.reset_requested = False
+        
+        # Short pause detection (used to start a speculative response before the utterance ends)
+        self.pause_callback = None
+        self.pause_timeout = 0.4  # Seconds of silence that count as a pause
+        self.pause_notified = False
+    
+    @staticmethod
+    def locate_model_path(model_path=None):
+        """Find the Vosk model directory, asking the user if it can't be found"""
+        if model_path is not None:
+            if not os.path.exists(model_path):
+                print(f"VOSK model not found at {model_path}")
+                print("Please download the model from https://alphacephei.com/vosk/models")
+                print(f"and extract it to {model_path}")
+                sys.exit(1)
+            return model_path
+        
+        # List of possible model locations to try
+        possible_paths = [
+            "vosk-model-small-en-us-0.15",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "vosk-model-small-en-us-0.15"),
+            os.path.join(os.getcwd(), "vosk-model-small-en-us-0.15"),
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "_pycache_", "vosk-model-small-en-us-0.15")
+        ]
+        
+        # Try each path
+        for path in possible_paths:
+            if os.path.exists(path):
+                print(f"Found Vosk model at: {path}")
+                return path
+        
+        print("VOSK model not found. Attempted these locations:")
+        for path in possible_paths:
+            print(f"- {path}")
+        print("\nPlease download the model from https://alphacephei.com/vosk/models")
+        print("and extract it to one of the locations above.")
+        
+        # Ask user for model path
+        user_path = input("\nOr enter the full path to the model directory: ").strip()
+        if user_path and os.path.exists(user_path):
+            return user_path
+        sys.exit(1)
+    
+    def set_command_recognizer(self, command_recognizer, mode="alongside"):
+        """Run a command recognizer alongside dictation, or in place of it (mode="only")"""
+        self.command_recognizer = command_recognizer
+        self.command_mode = mode
     
     def find_device_by_name(self, name_substring):
         """Find a device by substring in its name"""
-        devices = sd.query_devices()
+        devices = self.audio.query_devices()
         
         for i, device in enumerate(devices):
             if device['max_input_channels'] > 0:  # Input devices (microphones)
@@ -116,33 +147,80 @@ class SpeechRecognizer:
         if status:
             print(f"Audio status: {status}")
         
-        # Add audio data to queue
-        self.audio_queue.put(bytes(indata))
+        # Calculate energy level of the 16-bit samples, normalized to 0..1
+        samples = np.frombuffer(indata, dtype=np.int16)
+        energy = np.mean(np.abs(samples.astype(np.float32))) / 32768.0
+        current_time = self.audio.time()  # Stream clock, so timeouts also work on accelerated virtual audio
+        
+        # Echo gating - while our own voice is playing, only audio clearly louder than
+        # the echo expected from the playback signal is treated as the user speaking
+        echo_level = self.echo_reference() if self.echo_reference else 0.0
+        calibrating = False
+        if echo_level > 0:
+            if self.playback_started_at is None:
+                self.playback_started_at = current_time
+            calibrating = current_time - self.playback_started_at < self.echo_calibration_time
+        else:
+            self.playback_started_at = None
+        expected_echo = echo_level * self.echo_coupling
+        is_user_speech = (energy > self.silence_threshold and energy > expected_echo * self.echo_margin
+                          and not calibrating)
         
-        # Calculate energy level (for silence detection only)
-        energy = np.mean(np.abs(indata))
-        current_time = time.time()
+        # Only our voice is playing - update the coupling estimate (quickly while calibrating)
+        if echo_level > self.silence_threshold and not is_user_speech:
+            rate = 0.3 if calibrating else 0.05
+            self.echo_coupling += rate * (energy / echo_level - self.echo_coupling)
+        
+        # Add audio data to queue (echo-only audio is replaced by silence so the
+        # assistant's own speech is not transcribed)
+        if echo_level > 0 and not is_user_speech:
+            self.audio_queue.put(bytes(len(indata)))
+        else:
+            self.audio_queue.put(bytes(indata))
+        
+        # Speech onset detection
+        if is_user_speech:
+            self.onset_frames += 1
+            if self.onset_frames == self.onset_required_frames and self.speech_start_callback:
+                self.speech_start_callback()
+        else:
+            self.onset_frames = 0
         
         # Simple silence detection
-        if energy > self.silence_threshold:
+        if is_user_speech:
             self.speech_detected = True
             self.silent_frames = 0
             self.silence_start_time = 0  # Reset silence timer
+            self.silence_start_wall = 0
+            self.pause_notified = False
         elif self.speech_detected:
             self.silent_frames += 1
             
             # Start silence timer if this is the beginning of silence
             if self.silent_frames == 1:
                 self.silence_start_time = current_time
+                self.silence_start_wall = time.time()
+            
+            # Short pause with a stable partial transcript - report it once
+            if (self.pause_callback and not self.pause_notified and self.silence_start_time > 0
+                    and (current_time - self.silence_start_time) > self.pause_timeout
+                    and self.last_partial_text.strip()):
+                self.pause_notified = True
+                self.pause_callback(self.last_partial_text.strip())
             
             # Check if silence timeout has been reached
             if self.silence_start_time > 0 and (current_time - self.silence_start_time) > self.silence_timeout:
                 # If silence has lasted long enough, end the utterance
                 if self.callback and self.last_partial_text.strip():
                     print(f"Silence detected for {self.silence_timeout}s - completing utterance: '{self.last_partial_text}'")
+                    tracer.begin_turn(self.silence_start_wall)
+                    tracer.mark("callback")
                     self.callback(self.last_partial_text.strip())
                     self.last_partial_text = ""  # Reset for next utterance
+                    self.sent_word_count = 0
+                    self.reset_requested = True  # Vosk must not finalize the same words again
                     self.silence_start_time = 0
+                    self.silence_start_wall = 0
                     self.speech_detected = False
             
             # Traditional end-of-speech detection
@@ -151,6 +229,45 @@ class SpeechRecognizer:
     
     # Audio level method removed
     
+    @staticmethod
+    def _parse_partial(partial_json):
+        """Extract the text from a Vosk partial result without a full JSON parse"""
+        # Partial payloads are always tiny and shaped like: {"partial" : "some words"}
+        # Slicing between the quotes is much cheaper than json.loads for every chunk
+        _, sep, rest = partial_json.partition('"partial"')
+        if sep:
+            start = rest.find('"')
+            end = rest.rfind('"')
+            if start != -1 and end > start:
+                text = rest[start + 1:end]
+                if '\\' not in text:  # Escaped characters - let json handle those
+                    return text.strip()
+        # Fall back to the json module for anything unexpected
+        return json.loads(partial_json).get('partial', '').strip()
+    
+    def _handle_partial(self):
+        """Query the partial result and send only the words that weren't sent yet"""
+        partial_text = self._parse_partial(self.recognizer.PartialResult())
+        
+        # Nothing changed since the last chunk
+        if not partial_text or partial_text == self.last_partial_text:
+            return
+        
+        # Compare token lists instead of strings - only words past the ones already
+        # sent go to word_callback, so corrections by Vosk never replay earlier words
+        words = partial_text.split()
+        if self.word_callback and len(words) > self.sent_word_count:
+            new_words = " ".join(words[self.sent_word_count:])
+            self.sent_word_count = len(words)
+            self.word_callback(new_words)
+        
+        # For standard partial updates, send the full text
+        if self.partial_callback:
+            self.partial_callback(partial_text)
+        
+        # Save current text for comparison next time
+        self.last_partial_text = partial_text
+    
     def process_audio(self):
         """Process audio data from the queue"""
         while not self.should_stop.is_set():
@@ -158,43 +275,34 @@ class SpeechRecognizer:
                 # Get audio data from queue with timeout
                 audio_data = self.audio_queue.get(timeout=0.5)
                 
-                # Check for partial results if we have a word callback and speech is detected
-                if (self.word_callback or self.partial_callback) and self.speech_detected:
-                    # Only get partial results at certain intervals to avoid flickering
-                    current_time = time.time()
-                    if current_time - self.last_partial_time > self.partial_delay:
-                        self.last_partial_time = current_time
-                        
-                        # Get partial result
-                        partial_json = self.recognizer.PartialResult()
-                        partial_result = json.loads(partial_json)
-                        
-                        # Extract text from partial result
-                        partial_text = partial_result.get('partial', '').strip()
-                        
-                        # Check if we have new words (by comparing with last partial text)
-                        if partial_text and partial_text != self.last_partial_text:
-                            # For word-by-word, extract just the new words
-                            if self.word_callback:
-                                # If previous text is a substring of current text, extract only new words
-                                if partial_text.startswith(self.last_partial_text) and len(self.last_partial_text) > 0:
-                                    new_words = partial_text[len(self.last_partial_text):].strip()
-                                    if new_words:  # Only call if there are actual new words
-                                        self.word_callback(new_words)
-                                else:
-                                    # If not a simple extension, just use the whole new text
-                                    # This handles cases where Vosk corrects previous words
-                                    self.word_callback(partial_text)
-                            
-                            # For standard partial updates, send the full text
-                            if self.partial_callback:
-                                self.partial_callback(partial_text)
-                            
-                            # Save current text for comparison next time
-                            self.last_partial_text = partial_text
+                # The utterance was completed elsewhere (silence timeout) - start fresh
+                if self.reset_requested:
+                    self.reset_requested = False
+                    self.recognizer.Reset()
+                    self.last_partial_text = ""
+                    self.sent_word_count = 0
                 
-                # Process audio chunk for final results
-                if self.recognizer.AcceptWaveform(audio_data):
+                # Voice commands get the first look at the audio
+                if self.command_recognizer:
+                    if self.command_recognizer.accept_audio(audio_data):
+                        # Drop the dictated words of the command so they aren't sent as a message
+                        self.recognizer.Reset()
+                        self.last_partial_text = ""
+                        self.sent_word_count = 0
+                        continue
+                    if self.command_mode == "only":
+                        continue
+                
+                if metrics.enabled:
+                    metrics.inc("speech.chunks")
+                    # Chunks still waiting - a growing backlog means recognition can't keep up
+                    metrics.observe("speech.queue_depth", self.audio_queue.qsize(), buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+                
+                # Process audio chunk - partial results only change after the recognizer
+                # consumed new audio, so they are only queried here
+                with metrics.timer("speech.accept_waveform_ms", FINE_BUCKETS_MS):
+                    is_final = self.recognizer.AcceptWaveform(audio_data)
+                if is_final:
                     result_json = self.recognizer.Result()
                     result = json.loads(result_json)
                     
@@ -203,19 +311,30 @@ class SpeechRecognizer:
                     
                     # Reset state variables
                     self.last_partial_text = ""
+                    self.sent_word_count = 0
                     
                     # If we have text and a callback, call it
                     if text and self.callback:
+                        metrics.inc("speech.final_results")
+                        # Speech ended at the first silent frame (or now if Vosk ended it first)
+                        tracer.begin_turn(self.silence_start_wall or time.time())
+                        tracer.mark("callback")
                         self.callback(text)
                 
+                # Check for partial results if we have a word callback and speech is detected
+                elif (self.word_callback or self.partial_callback) and self.speech_detected:
+                    self._handle_partial()
+                
             except queue.Empty:
                 # If queue is empty, just continue
                 continue
             except Exception as e:
                 print(f"Error processing audio: {e}")
+                metrics.inc("speech.errors")
                 continue
     
-    def start_listening(self, callback, partial_callback=None, word_callback=None):
+    def start_listening(self, callback, partial_callback=None, word_callback=None, speech_start_callback=None,
+                        pause_callback=None):
         """Start listening for speech"""
         if self.listening_thread and self.listening_thread.is_alive():
             print("Already listening")
@@ -225,10 +344,20 @@ class SpeechRecognizer:
         self.callback = callback
         self.partial_callback = partial_callback
         self.word_callback = word_callback
+        self.speech_start_callback = speech_start_callback
+        self.pause_callback = pause_callback
         
         # Reset state variables
+        self.onset_frames = 0
+        self.pause_notified = False
         self.last_partial_text = ""
+        self.sent_word_count = 0
         self.silence_start_time = 0
+        self.silence_start_wall = 0
+        
+        # Start each session with a clean command recognizer
+        if self.command_recognizer:
+            self.command_recognizer.reset()
         
         # Reset stop event
         self.should_stop.clear()
@@ -240,26 +369,17 @@ class SpeechRecognizer:
         
         # Start audio stream
         try:
-            # Use the specified device if provided
-            if self.device_index is not None:
-                self.stream = sd.RawInputStream(
-                    samplerate=self.sample_rate,
-                    blocksize=8000,
-                    channels=1,
-                    dtype='int16',
-                    callback=self._audio_callback,
-                    device=self.device_index
-                )
-            else:
-                self.stream = sd.RawInputStream(
-                    samplerate=self.sample_rate,
-                    blocksize=8000,
-                    channels=1,
-                    dtype='int16',
-                    callback=self._audio_callback
-                )
+            # Use the specified device if provided (None = default input)
+            self.stream = self.audio.input_stream(
+                samplerate=self.sample_rate,
+                blocksize=self.blocksize,
+                callback=self._audio_callback,
+                device=self.device_index,
+                channels=1,
+                dtype='int16'
+            )
             self.stream.start()
-            device_info = sd.query_devices(self.device_index or sd.default.device[0], 'input')
+            device_info = self.audio.query_devices(self.device_index or self.audio.default_input_device(), 'input')
             print(f"Listening for speech on device: {device_info['name']}")
             return True
         except Exception as e:
@@ -268,6 +388,8 @@ class SpeechRecognizer:
             self.callback = None
             self.partial_callback = None
             self.word_callback = None
+            self.speech_start_callback = None
+            self.pause_callback = None
             return False
     
     def stop_listening(self):
@@ -297,17 +419,21 @@ class SpeechRecognizer:
         self.callback = None
         self.partial_callback = None
         self.word_callback = None
+        self.speech_start_callback = None
+        self.pause_callback = None
         
         # Reset state variables
         self.last_partial_text = ""
+        self.sent_word_count = 0
         self.silence_start_time = 0
+        self.silence_start_wall = 0
         
         print("Stopped listening")
 
     @staticmethod
-    def list_microphones():
+    def list_microphones(audio=None):
         """List available microphones"""
-        devices = sd.query_devices()
+        devices = (audio or default_backend()).query_devices()
         microphones = []
         
         print("\nAvailable Microphones:")
@@ -0,0 +1,83 @@
+class ThinkTagFilter:
+    """
+    Incremental <think>...</think> splitter for streamed responses.
+
+    Feed it token chunks as they arrive. Answer text goes to on_answer and
+    thinking text to on_thinking right away - the only text held back is a
+    possible tag split across chunks (e.g. "</thi" + "nk>"), which is at most
+    a few characters.
+    """
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self, on_answer=None, on_thinking=None, starts_in_thinking=False):
+        self.on_answer = on_answer
+        self.on_thinking = on_thinking
+        # Some templates open the thinking in the prompt, so the output starts inside it
+        self.in_thinking = starts_in_thinking
+        self.pending = ""  # Possible start of a tag, waiting for the next chunk
+        self.answer_started = False  # Leading whitespace of the answer is dropped
+        self.answer = ""
+        self.thinking = ""
+
+    def feed(self, chunk):
+        """Process one chunk of streamed text"""
+        text = self.pending + chunk
+        self.pending = ""
+
+        while text:
+            tag = self.CLOSE_TAG if self.in_thinking else self.OPEN_TAG
+            position = text.find(tag)
+            if position != -1:
+                # Complete tag - emit what comes before it and switch state
+                self._emit(text[:position])
+                text = text[position + len(tag):]
+                self.in_thinking = not self.in_thinking
+                continue
+
+            # Hold back the longest tail that could still become the tag
+            keep = self._partial_tag_length(text, tag)
+            self._emit(text[:len(text) - keep])
+            self.pending = text[len(text) - keep:]
+            break
+
+    def flush(self):
+        """End of the stream - whatever was held back is plain text"""
+        text = self.pending
+        self.pending = ""
+        self._emit(text)
+
+    @staticmethod
+    def _partial_tag_length(text, tag):
+        """Length of the longest suffix of text that is a prefix of tag"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _emit(self, text):
+        """Send text to the channel of the current state"""
+        if not text:
+            return
+        if self.in_thinking:
+            self.thinking += text
+            if self.on_thinking:
+                self.on_thinking(text)
+            return
+
+        if not self.answer_started:
+            text = text.lstrip()
+            if not text:
+                return
+            self.answer_started = True
+        self.answer += text
+        if self.on_answer:
+            self.on_answer(text)
+
+
+def split_thinking(text):
+    """Split a complete response into (thinking, answer)"""
+    think_filter = ThinkTagFilter()
+    think_filter.feed(text)
+    think_filter.flush()
+    return think_filter.thinking.strip(), think_filter.answer
@@ -5,16 +5,19 @@ import os
 import sys
 import re
 import numpy as np
-import sounddevice as sd
 import shutil
 from datetime import datetime
+from latency_trace import tracer
+from metrics import metrics
+from audio_io import default_backend
 
 class TextToSpeech:
     """
     Text-to-Speech engine using XTTS-v2 for high-quality speech synthesis.
     """
-    def __init__(self, model_name="tts_models/multilingual/multi-dataset/xtts_v2"):
+    def __init__(self, model_name="tts_models/multilingual/multi-dataset/xtts_v2", audio=None):
         self.model_name = model_name
+        self.audio = audio or default_backend()  # Sound card or virtual device (see audio_io.py)
         self.is_initialized = False
         self.initialized = False  # For compatibility with existing code 
         self.tts_available = False
@@ -25,6 +28,11 @@ class TextToSpeech:
         self.processing_thread = None
         self.tts = None  # Instance of the TTS model
         
+        # Playback tracking (the known playback signal is used for echo gating / barge-in)
+        self.playback_audio = None
+        self.playback_start_time = 0
+        self.playback_generation = 0  # Bumped on interrupt so in-flight synthesis is not played
+        
         # Current settings
         self.current_speaker = None
         self.language = "en"
@@ -255,10 +263,13 @@ class TextToSpeech:
             try:
                 # Get text from queue with timeout
                 text = self.speech_queue.get(timeout=0.5)
+                generation = self.playback_generation
                 
                 try:
                     self.is_speaking = True
                     print(f"🔊 Speaking: '{text}'")
+                    synthesis_start = time.time()
+                    tracer.mark("synthesis_start", synthesis_start)
                     
                     # Check if we're using a custom voice (from a wav file)
                     if isinstance(self.speakers.get(self.current_speaker), str) and self.speakers[self.current_speaker].endswith('.wav'):
@@ -277,20 +288,45 @@ class TextToSpeech:
                             language=self.language
                         )
                     
-                    # Convert to proper format for sounddevice
+                    # Convert to proper format for the audio device
                     audio_np = np.array(audio)
+                    synthesis_end = time.time()
+                    tracer.mark("synthesis_end", synthesis_end)
+                    tracer.span("synthesis", synthesis_start, synthesis_end, chars=len(text),
+                                audio_seconds=round(len(audio_np) / self.sample_rate, 3))
+                    if metrics.enabled:
+                        metrics.inc("tts.sentences")
+                        metrics.inc("tts.chars", len(text))
+                        metrics.observe("tts.synthesis_ms", (synthesis_end - synthesis_start) * 1000)
+                        # Above 1 the voice can't keep up with its own playback
+                        audio_seconds = len(audio_np) / self.sample_rate
+                        if audio_seconds > 0:
+                            metrics.observe("tts.real_time_factor", (synthesis_end - synthesis_start) / audio_seconds,
+                                            buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 4, 8))
+                    
+                    # Speech was interrupted while this sentence was being synthesized
+                    if generation != self.playback_generation:
+                        metrics.inc("tts.dropped_sentences")
+                        self.speech_queue.task_done()
+                        continue
                     
-                    # Play the audio using sounddevice
-                    sd.play(audio_np, self.sample_rate)
+                    # Play the audio on the audio device
+                    self.playback_audio = audio_np
+                    self.playback_start_time = time.time()
+                    self.audio.play(audio_np, self.sample_rate)
+                    tracer.mark("playback_start", self.playback_start_time)
                     
                     # Mark the queue item as done immediately so next sentence can be processed
                     # This allows us to generate the next sentence while the current one is playing
                     self.speech_queue.task_done()
                     
                     # Wait until audio is finished playing
-                    sd.wait()
+                    self.audio.wait()
+                    tracer.span("playback", self.playback_start_time, time.time(), chars=len(text))
+                    metrics.observe("tts.playback_ms", (time.time() - self.playback_start_time) * 1000)
                     
                 finally:
+                    self.playback_audio = None
                     self.is_speaking = False
                 
             except queue.Empty:
@@ -299,6 +335,7 @@ class TextToSpeech:
             
             except Exception as e:
                 print(f"Error in TTS processing: {e}")
+                metrics.inc("tts.errors")
                 try:
                     # Make sure we mark the queue item as done even if there's an error
                     self.speech_queue.task_done()
@@ -312,7 +349,7 @@ class TextToSpeech:
         self.stop_event.set()
         
         # Stop any current audio playback
-        sd.stop()
+        self.audio.stop()
         
         # Clear the queue
         while not self.speech_queue.empty():
@@ -329,6 +366,39 @@ class TextToSpeech:
         self.is_speaking = False
         print("Speech stopped")
     
+    def interrupt(self):
+        """Cut off speech immediately but keep the processing thread alive (barge-in)"""
+        # Anything still being synthesized must not be played afterwards
+        self.playback_generation += 1
+        
+        # Drop the sentences that haven't been spoken yet
+        while not self.speech_queue.empty():
+            try:
+                self.speech_queue.get_nowait()
+                self.speech_queue.task_done()
+            except queue.Empty:
+                break
+        
+        # Stop the current playback
+        self.audio.stop()
+        self.playback_audio = None
+        self.is_speaking = False
+        print("Speech interrupted")
+    
+    def get_playback_level(self, window=0.25):
+        """Get the average level of the audio playing right now (0 when silent)"""
+        audio = self.playback_audio
+        if audio is None:
+            return 0.0
+        
+        # Look slightly back in time to cover output and input latency
+        position = int((time.time() - self.playback_start_time) * self.sample_rate)
+        start = max(0, position - int(window * self.sample_rate))
+        end = min(len(audio), position + int(0.05 * self.sample_rate))
+        if start >= end:
+            return 0.0
+        return float(np.mean(np.abs(audio[start:end])))
+    
     def is_busy(self):
         """Check if TTS is currently busy speaking"""
         return self.is_speaking or not self.speech_queue.empty()
@@ -336,11 +406,10 @@ class TextToSpeech:
     def debug_audio_devices(self):
         """Print information about audio devices to help debugging"""
         try:
-            import sounddevice as sd
             print("\nAudio Device Information:")
             print("-" * 50)
-            devices = sd.query_devices()
-            default_output = sd.query_devices(kind='output')
+            devices = self.audio.query_devices()
+            default_output = self.audio.query_devices(kind='output')
             print(f"Default output device: {default_output['name']}")
             
             print("\nAvailable Output Devices:")
@@ -355,9 +424,6 @@ class TextToSpeech:
     def test_audio(self):
         """Generate a test sound to verify audio is working"""
         try:
-            import numpy as np
-            import sounddevice as sd
-            
             # Generate a simple beep sound
             sample_rate = 44100
             duration = 0.5  # half second
@@ -366,8 +432,8 @@ class TextToSpeech:
             beep = 0.5 * np.sin(2 * np.pi * frequency * t)
             
             # Play the beep
-            sd.play(beep, sample_rate)
-            sd.wait()  # Wait until sound is finished
+            self.audio.play(beep, sample_rate)
+            self.audio.wait()  # Wait until sound is finished
             print("Test audio played successfully")
             return True
         except Exception as e:
@@ -445,13 +511,13 @@ class TextToSpeech:
         try:
             print(f"Recording voice sample for {duration} seconds...")
             # Record audio
-            recording = sd.rec(int(duration * sample_rate), 
+            recording = self.audio.rec(int(duration * sample_rate), 
                               samplerate=sample_rate, 
                               channels=1,
                               dtype='float32')
             
             # Wait for recording to complete
-            sd.wait()
+            self.audio.wait()
             
             # Validate recording
             if recording is None or recording.size == 0:
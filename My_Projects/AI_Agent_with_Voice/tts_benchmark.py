@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import re
+import resource
+import time
+import tracemalloc
+from benchmark import percentiles, RESULTS_DIR
+from tts import TextToSpeech
+from audio_io import VirtualAudioBackend
+
+# Sentences of different lengths, like the replies of the LLM
+CORPUS = [
+    "Sure!",
+    "Hello, how can I help you today?",
+    "The weather in Mexico City is mild all year round.",
+    "On the first day you could visit the historic center, the cathedral and the National Palace.",
+    "For tacos, try the small stands around Roma and Condesa, they are cheap, fast and usually better than the restaurants.",
+    "The metro is the quickest way from the airport to the center, but with luggage a registered taxi from the official booth is easier, and it costs about the same as a ride-hailing app at night.",
+    "Yes.",
+    "That depends on what you enjoy most: museums, food, or walking around the old neighborhoods.",
+    "In short: day one is the historic center, day two is Chapultepec and the anthropology museum, and day three is Coyoacán with a boat ride in Xochimilco in the afternoon.",
+    "Let me know if you want me to change anything!",
+]
+
+# Length groups (characters) for latency vs. sentence length
+LENGTH_GROUPS = [(0, 40), (40, 80), (80, 120), (120, 200), (200, 10000)]
+
+
+def split_sentences(text):
+    """Sentence terminators only, long sentences cut at 200 characters"""
+    parts = []
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        sentence = sentence.strip()
+        parts.extend(sentence[i:i + 200] for i in range(0, len(sentence), 200))
+    return [p for p in parts if p]
+
+
+def split_clauses(text):
+    """Every sentence and clause (commas, semicolons, colons) on its own"""
+    return [p.strip() for p in re.split(r'(?<=[.!?,;:])\s+', text) if p.strip()]
+
+
+def split_merged(text, limit=150):
+    """Whole sentences merged up to limit characters - fewer, longer synthesis calls"""
+    merged = []
+    for sentence in split_sentences(text):
+        if merged and len(merged[-1]) + 1 + len(sentence) <= limit:
+            merged[-1] += " " + sentence
+        else:
+            merged.append(sentence)
+    return merged
+
+
+STRATEGIES = {
+    "default": None,  # TextToSpeech._split_into_sentences
+    "sentences": split_sentences,
+    "clauses": split_clauses,
+    "merged": split_merged,
+}
+
+
+def rss_kb():
+    """Current resident memory in KiB (Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def load_tts(audio):
+    """Create TextToSpeech on the given audio device and wait until XTTS is loaded"""
+    tts = TextToSpeech(audio=audio)
+    tts.initialization_thread.join()
+    if not tts.is_initialized or not tts.tts:
+        raise RuntimeError("XTTS could not be loaded (pip install TTS)")
+    return tts
+
+
+def instrument(tts):
+    """Wrap the XTTS call to record (characters, synthesis seconds, audio seconds) per sentence"""
+    calls = []
+    synthesize = tts.tts.tts
+
+    def timed_tts(*args, **kwargs):
+        start = time.perf_counter()
+        audio = synthesize(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        calls.append((len(kwargs.get("text", args[0] if args else "")), elapsed, len(audio) / tts.sample_rate))
+        return audio
+
+    tts.tts.tts = timed_tts
+    return calls
+
+
+def run_strategy(tts, sink, calls, splitter, texts, timeout):
+    """Speak every text with one split strategy, returns the measurements"""
+    tts._split_into_sentences = splitter
+    del calls[:]
+    del sink.played[:]
+
+    runs = []
+    start_rss = rss_kb()
+    for text in texts:
+        expected = len([s for s in splitter(text) if s.strip()])
+        played_before = len(sink.played)
+        start = time.perf_counter()
+        tts.speak(text)
+
+        # Done when every chunk reached the sink
+        deadline = start + timeout
+        while len(sink.played) - played_before < expected and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        tts.speech_queue.join()
+        while tts.is_speaking and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        end = time.perf_counter()
+
+        played = sink.played[played_before:]
+        audio_seconds = sum(samples / rate for _, samples, rate in played)
+        runs.append({
+            "chars": len(text),
+            "chunks": expected,
+            "time_to_first_audio": played[0][0] - start if played else None,
+            "wall_time": end - start,
+            "audio_seconds": audio_seconds,
+        })
+
+    synthesis_time = sum(c[1] for c in calls)
+    audio_seconds = sum(c[2] for c in calls)
+    total_chars = sum(c[0] for c in calls)
+
+    by_length = {}
+    for chars, elapsed, _ in calls:
+        for low, high in LENGTH_GROUPS:
+            if low <= chars < high:
+                by_length.setdefault(f"{low}-{high}", []).append(elapsed)
+                break
+
+    # Least-squares line: synthesis time = fixed cost + per-character cost
+    slope = intercept = None
+    if len(calls) > 1:
+        xs = [c[0] for c in calls]
+        ys = [c[1] for c in calls]
+        mean_x = sum(xs) / len(xs)
+        mean_y = sum(ys) / len(ys)
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        if var_x:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+            intercept = mean_y - slope * mean_x
+
+    return {
+        "chunks": len(calls),
+        # Synthesis time per second of audio - above 1 the voice falls behind its own playback
+        "real_time_factor": round(synthesis_time / audio_seconds, 3) if audio_seconds else None,
+        "wall_real_time_factor": round(sum(r["wall_time"] for r in runs) / audio_seconds, 3) if audio_seconds else None,
+        "chars_per_second": round(total_chars / synthesis_time, 1) if synthesis_time else None,
+        "time_to_first_audio": percentiles([r["time_to_first_audio"] for r in runs if r["time_to_first_audio"] is not None]),
+        "sentence_latency": percentiles([c[1] for c in calls]),
+        "latency_by_length": {group: percentiles(values) for group, values in by_length.items()},
+        "fixed_cost_seconds": round(intercept, 4) if intercept is not None else None,
+        "seconds_per_char": round(slope, 5) if slope is not None else None,
+        "rss_growth_kb": rss_kb() - start_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XTTS throughput benchmark on a virtual speaker (no sound card needed)")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument("--corpus", help="text file, one reply per line (default: built-in replies)")
+    parser.add_argument("--repeat", type=int, default=1, help="times to go through the corpus per strategy")
+    parser.add_argument("--realtime-playback", action="store_true", help="the sink waits for the audio length like a device")
+    parser.add_argument("--cpu", action="store_true", help="hide the GPU and synthesize on the CPU")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds per reply")
+    parser.add_argument("--output", help="results file (default: benchmark_results/tts_<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.cpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+    texts = CORPUS
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    texts = texts * args.repeat
+
+    # Virtual speaker: plays nothing, only records when each chunk arrived
+    sink = VirtualAudioBackend(speed=1.0 if args.realtime_playback else 0, keep_output=False)
+    rss_before = rss_kb()
+    load_start = time.perf_counter()
+    tts = load_tts(sink)
+    load_time = time.perf_counter() - load_start
+    calls = instrument(tts)
+    default_split = tts._split_into_sentences
+
+    # The first synthesis pays for lazy initialization - keep it out of the numbers
+    tts.speak("Warming up.")
+    tts.speech_queue.join()
+
+    tracemalloc.start()
+    results = {
+        "timestamp": time.time(),
+        "config": vars(args),
+        "device": getattr(tts, "device", None),
+        "load_time": round(load_time, 2),
+        "model_rss_kb": rss_kb() - rss_before,
+        "strategies": {},
+    }
+    for name in args.strategies:
+        print(f"Running split strategy '{name}'...")
+        splitter = STRATEGIES[name] or default_split
+        results["strategies"][name] = run_strategy(tts, sink, calls, splitter, texts, args.timeout)
+    results["python_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    tts.stop()
+
+    print(f"\nXTTS on {results['device']}, loaded in {results['load_time']}s (+{results['model_rss_kb'] / 1024:.0f} MiB RSS)")
+    print(f"{'strategy':<11}{'chunks':>7}{'RTF':>7}{'wall RTF':>10}{'chars/s':>9}{'TTFA p50':>10}{'TTFA p95':>10}{'fixed s':>9}{'ms/char':>9}")
+    for name, r in results["strategies"].items():
+        ttfa = r["time_to_first_audio"]
+        print(f"{name:<11}{r['chunks']:>7}{r['real_time_factor'] or 0:>7.2f}{r['wall_real_time_factor'] or 0:>10.2f}"
+              f"{r['chars_per_second'] or 0:>9.1f}{ttfa.get('p50', 0):>10.2f}{ttfa.get('p95', 0):>10.2f}"
+              f"{r['fixed_cost_seconds'] or 0:>9.3f}{(r['seconds_per_char'] or 0) * 1000:>9.2f}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, "tts_" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
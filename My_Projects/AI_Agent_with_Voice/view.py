@@ -1,6 +1,68 @@
 import tkinter as tk
 from tkinter import scrolledtext, ttk, BooleanVar, StringVar, font, Toplevel, Canvas, messagebox
+import re
 import time
+import threading
+from collections import deque
+from metrics import metrics, FINE_BUCKETS_MS
+
+class UIEventChannel:
+    """
+    Thread-safe channel for UI updates. Worker threads post functions to run
+    on the Tk thread, and a virtual event wakes the Tk loop immediately.
+    Everything pending is run in one batch per wakeup. A slow periodic drain
+    picks up updates whose wakeup could not be sent.
+    """
+    def __init__(self, root, event_name="<<UIUpdate>>", fallback_interval=500):
+        self.root = root
+        self.event_name = event_name
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.wakeup_pending = False
+        self.fallback_interval = fallback_interval  # ms
+        self.root.bind(self.event_name, self._drain)
+        self.root.after(self.fallback_interval, self._fallback_drain)
+    
+    def post(self, func, *args):
+        """Schedule func(*args) on the Tk thread (safe to call from any thread)"""
+        with self.lock:
+            self.pending.append((func, args))
+            # One wakeup is enough for any number of queued updates
+            if self.wakeup_pending:
+                return
+            self.wakeup_pending = True
+        
+        try:
+            self.root.event_generate(self.event_name, when="tail")
+        except Exception as e:
+            # The window is being destroyed, or Tcl can't take events from this thread -
+            # leave the update queued for the next post or the fallback drain
+            with self.lock:
+                self.wakeup_pending = False
+            print(f"Could not post UI update: {e}")
+    
+    def _drain(self, event=None):
+        """Run all pending updates (called on the Tk thread)"""
+        with self.lock:
+            batch = list(self.pending)
+            self.pending.clear()
+            self.wakeup_pending = False
+        
+        for func, args in batch:
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error in UI update {getattr(func, '__name__', func)}: {e}")
+    
+    def _fallback_drain(self):
+        """Run updates left behind by a failed wakeup, then check again later"""
+        if self.pending:
+            self._drain()
+        try:
+            self.root.after(self.fallback_interval, self._fallback_drain)
+        except tk.TclError:
+            pass  # The window was destroyed
+
 
 class MicrophoneSelector:
     """Dialog for selecting microphones"""
@@ -353,6 +415,9 @@ class ChatbotView:
         # Set up the interface
         self._setup_ui()
         
+        # Channel used by worker threads to update the UI
+        self.ui_events = UIEventChannel(self.root)
+        
         # Initialize callbacks
         self.send_callback = None
         self.reset_callback = None
@@ -362,6 +427,22 @@ class ChatbotView:
         self.tts_toggle_callback = None
         self.voice_change_callback = None
         self.clone_voice_callback = None
+        self.voice_commands_toggle_callback = None
+        self.barge_in_toggle_callback = None
+        self.speculative_toggle_callback = None
+        self.stop_callback = None
+        self.profile_toggle_callback = None
+        
+        # F9 starts/stops the profiler
+        self.root.bind("<F9>", self._on_profile_toggle)
+        
+        # Set when the current AI response should stop typing out (barge-in)
+        self.response_interrupted = False
+        
+        # AI response arriving token by token (see start_ai_stream)
+        self.stream_speak_callback = None
+        self.streamed_text = ""
+        self.stream_sentence = ""  # Text not spoken yet
     
     def _setup_ui(self):
         """Set up the UI components"""
@@ -405,9 +486,38 @@ class ChatbotView:
         )
         self.show_thinking_check.pack(side=tk.LEFT)
         
+        # Think first checkbox (explicit thinking step for models that don't think on their own)
+        self.think_first_var = BooleanVar(value=False)
+        self.think_first_frame = ttk.Frame(toolbar_frame)
+        self.think_first_check = ttk.Checkbutton(
+            self.think_first_frame,
+            text="Think First",
+            variable=self.think_first_var
+        )
+        self.think_first_check.pack(side=tk.LEFT)
+        
         # Update thinking checkbox visibility based on selected model
         self._update_thinking_checkbox_visibility()
         
+        # Collapsible thinking panel - reasoning is streamed here, apart from the answer
+        self.thinking_panel_frame = ttk.Frame(main_frame)
+        self.thinking_panel_frame.pack(fill=tk.X, padx=10)
+        self.thinking_panel_expanded = False
+        self.thinking_toggle_button = ttk.Button(
+            self.thinking_panel_frame,
+            text="▶ Thinking",
+            command=self._toggle_thinking_panel
+        )
+        self.thinking_toggle_button.pack(side=tk.TOP, anchor=tk.W)
+        self.thinking_display = scrolledtext.ScrolledText(
+            self.thinking_panel_frame,
+            wrap=tk.WORD,
+            height=6,
+            font=("Helvetica", 9)
+        )
+        self.thinking_display.tag_configure("thinking", foreground="purple")
+        self.thinking_display.config(state=tk.DISABLED)
+        
         # Create conversation display
         self.conversation_display = scrolledtext.ScrolledText(
             main_frame, 
@@ -433,6 +543,20 @@ class ChatbotView:
         self.voice_line_start = None
         self.voice_text_start = None
         
+        # Windowed transcript: only the last messages stay in the widget, so inserts and
+        # scrolling cost the same after hours of conversation. Older messages are kept
+        # in the transcript store and paged back in when scrolling to the top.
+        self.transcript = []  # Finished messages: (speaker line, text, tag)
+        self.max_visible_messages = 60
+        self.page_size = 20
+        self.first_visible = 0  # Transcript index of the first message in the widget
+        self.visible_marks = []  # Text mark at the start of each visible message
+        self.pending_message_mark = None  # Start of the message being written
+        self.message_counter = 0
+        self.typing_response = False
+        self.window_update_scheduled = False
+        self.conversation_display.configure(yscrollcommand=self._on_conversation_scroll)
+        
         # Create improved input area - MIDDLE SECTION
         input_frame = ttk.Frame(main_frame)
         input_frame.pack(fill=tk.X, padx=10, pady=(5, 5))
@@ -463,6 +587,16 @@ class ChatbotView:
         )
         self.send_button.pack(side=tk.RIGHT, padx=(10, 0))
         
+        # Stop button - aborts the running generation (enabled only while generating)
+        self.stop_button = ttk.Button(
+            input_frame,
+            text="Stop",
+            command=self._on_stop,
+            padding=(10, 15),
+            state="disabled"
+        )
+        self.stop_button.pack(side=tk.RIGHT, padx=(10, 0))
+        
         # BOTTOM SECTION - Voice controls (now below the input area)
         voice_section_frame = ttk.LabelFrame(main_frame, text="Voice Controls")
         voice_section_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
@@ -499,6 +633,36 @@ class ChatbotView:
         )
         self.voice_button.pack(side=tk.LEFT, pady=5)
         
+        # Voice commands toggle (stop, reset, change voice, use <model>)
+        self.voice_commands_enabled = BooleanVar(value=True)
+        self.voice_commands_checkbox = ttk.Checkbutton(
+            input_buttons,
+            text="Voice Commands",
+            variable=self.voice_commands_enabled,
+            command=self._on_voice_commands_toggle
+        )
+        self.voice_commands_checkbox.pack(side=tk.LEFT, padx=(10, 0), pady=5)
+        
+        # Barge-in toggle (speaking interrupts the AI voice)
+        self.barge_in_enabled = BooleanVar(value=False)
+        self.barge_in_checkbox = ttk.Checkbutton(
+            input_buttons,
+            text="Barge-in",
+            variable=self.barge_in_enabled,
+            command=self._on_barge_in_toggle
+        )
+        self.barge_in_checkbox.pack(side=tk.LEFT, padx=(10, 0), pady=5)
+        
+        # Speculative responses toggle (start answering on a pause in speech)
+        self.speculative_enabled = BooleanVar(value=False)
+        self.speculative_checkbox = ttk.Checkbutton(
+            input_buttons,
+            text="Speculative",
+            variable=self.speculative_enabled,
+            command=self._on_speculative_toggle
+        )
+        self.speculative_checkbox.pack(side=tk.LEFT, padx=(10, 0), pady=5)
+        
         # OUTPUT SECTION - Right side
         output_controls = ttk.LabelFrame(voice_grid, text="AI Voice Output")
         output_controls.grid(row=0, column=1, sticky="ew")
@@ -559,11 +723,13 @@ class ChatbotView:
         """Update visibility of thinking checkbox based on selected model"""
         current_model = self.model_var.get()
         
-        # Hide checkbox for llama3.1 model
+        # Hide checkbox for llama3.1 model - it can think in a separate step instead
         if current_model == "llama3.1:8b":
             self.show_thinking_frame.pack_forget()
+            self.think_first_frame.pack(side=tk.LEFT, padx=(0, 10))
         else:
-            # Make sure it's visible for other models
+            # Make sure it's visible for other models (they think natively)
+            self.think_first_frame.pack_forget()
             self.show_thinking_frame.pack(side=tk.LEFT, padx=(0, 10))
     
     def _on_model_change(self, event=None):
@@ -595,6 +761,21 @@ class ChatbotView:
         if self.voice_toggle_callback:
             self.voice_toggle_callback(new_active_state)
     
+    def _on_voice_commands_toggle(self):
+        """Handle voice commands toggle"""
+        if self.voice_commands_toggle_callback:
+            self.voice_commands_toggle_callback(self.voice_commands_enabled.get())
+    
+    def _on_barge_in_toggle(self):
+        """Handle barge-in toggle"""
+        if self.barge_in_toggle_callback:
+            self.barge_in_toggle_callback(self.barge_in_enabled.get())
+    
+    def _on_speculative_toggle(self):
+        """Handle speculative responses toggle"""
+        if self.speculative_toggle_callback:
+            self.speculative_toggle_callback(self.speculative_enabled.get())
+    
     def _on_tts_toggle(self):
         """Handle TTS toggle"""
         if self.tts_toggle_callback:
@@ -618,9 +799,25 @@ class ChatbotView:
         """Set callback for voice change"""
         self.voice_change_callback = callback
     
+    def set_voice_commands_toggle_callback(self, callback):
+        """Set callback for voice commands toggle"""
+        self.voice_commands_toggle_callback = callback
+    
+    def set_barge_in_toggle_callback(self, callback):
+        """Set callback for barge-in toggle"""
+        self.barge_in_toggle_callback = callback
+    
+    def set_speculative_toggle_callback(self, callback):
+        """Set callback for speculative responses toggle"""
+        self.speculative_toggle_callback = callback
+    
     def set_clone_voice_callback(self, callback):
         """Set callback for voice cloning"""
         self.clone_voice_callback = callback
+    
+    def set_profile_toggle_callback(self, callback):
+        """Set callback for the profiler toggle (F9)"""
+        self.profile_toggle_callback = callback
         
     def update_voice_list(self, voices):
         """Update the list of available voices"""
@@ -647,6 +844,7 @@ class ChatbotView:
         
         # Add the speaker line
         self.voice_line_start = self.conversation_display.index(tk.END)
+        self._start_message()
         self.conversation_display.insert(tk.END, "You (voice):\n", "speaker")
         
         # Mark where the text will start
@@ -674,20 +872,36 @@ class ChatbotView:
         self.conversation_display.see(tk.END)
         self.conversation_display.config(state=tk.DISABLED)
     
-    def end_voice_input(self):
-        """Finalize the voice input display"""
+    def clear_voice_text(self):
+        """Remove the words typed so far for the current voice input (e.g. a spoken command)"""
+        if not self.voice_input_active or not self.voice_text_start:
+            return
+        
+        self.conversation_display.config(state=tk.NORMAL)
+        self.conversation_display.delete(self.voice_text_start, tk.END + "-1c")
+        self.conversation_display.config(state=tk.DISABLED)
+    
+    def end_voice_input(self, final_text=None):
+        """Finalize the voice input display (final_text: the recognized message, replaces the partial words)"""
         if not self.voice_input_active:
             return
         
         self.conversation_display.config(state=tk.NORMAL)
         
+        # The words typed so far are partial results - show what was actually recognized
+        if final_text is not None and self.voice_text_start:
+            self.conversation_display.delete(self.voice_text_start, tk.END + "-1c")
+            self.conversation_display.insert(tk.END, final_text, "voice_typing")
+        
         # Add a double newline to separate from next message
         self.conversation_display.insert(tk.END, "\n\n")
         
         # Change text tag from voice_typing to final voice tag
+        text = ""
         if self.voice_text_start:
             # Get all text from the voice input
             text_end = self.conversation_display.index(tk.END + "-3c")  # Account for the \n\n we just added
+            text = self.conversation_display.get(self.voice_text_start, text_end)
             
             # Change tag from temporary to final
             self.conversation_display.tag_remove("voice_typing", self.voice_text_start, text_end)
@@ -701,6 +915,9 @@ class ChatbotView:
         # Make sure it's visible
         self.conversation_display.see(tk.END)
         self.conversation_display.config(state=tk.DISABLED)
+        if final_text is not None:
+            text = final_text
+        self._finish_message("You (voice):\n", f"{text}\n\n", "voice")
     
     def show_microphone_selector(self, microphones):
         """Show microphone selection dialog"""
@@ -724,6 +941,16 @@ class ChatbotView:
         # Call the registered callback
         self.send_callback(message)
     
+    def _on_stop(self):
+        """Handle stop button click"""
+        if self.stop_callback:
+            self.stop_callback()
+    
+    def _on_profile_toggle(self, event=None):
+        """Handle the profiler shortcut"""
+        if self.profile_toggle_callback:
+            self.profile_toggle_callback()
+    
     def _on_reset(self):
         """Handle reset button click"""
         if self.reset_callback:
@@ -733,6 +960,10 @@ class ChatbotView:
         """Set the callback for when a message is sent"""
         self.send_callback = callback
     
+    def set_stop_callback(self, callback):
+        """Set the callback for when the running generation should be stopped"""
+        self.stop_callback = callback
+    
     def set_reset_callback(self, callback):
         """Set the callback for when the conversation is reset"""
         self.reset_callback = callback
@@ -753,6 +984,11 @@ class ChatbotView:
         """Get the currently selected model"""
         return self.model_var.get()
     
+    def select_model(self, model_name):
+        """Select a model in the dropdown and notify the controller"""
+        self.model_var.set(model_name)
+        self._on_model_change()
+    
     def get_show_thinking(self):
         """Get the current show thinking setting"""
         # Always return False for llama3.1 model
@@ -760,6 +996,12 @@ class ChatbotView:
             return False
         return self.show_thinking_var.get()
     
+    def get_think_first(self):
+        """Get the think first setting (only used by models without native thinking)"""
+        if self.model_var.get() != "llama3.1:8b":
+            return False
+        return self.think_first_var.get()
+    
     def set_status(self, status):
         """Update the status bar text"""
         self.status_var.set(status)
@@ -771,6 +1013,8 @@ class ChatbotView:
         self.send_button.config(state=state)
         self.restart_button.config(state=state)
         self.model_dropdown.config(state="readonly" if enabled else tk.DISABLED)
+        # Input is disabled while generating, that's when stopping makes sense
+        self.stop_button.config(state=tk.DISABLED if enabled else tk.NORMAL)
         if enabled:
             self.input_field.focus()
     
@@ -782,20 +1026,35 @@ class ChatbotView:
         self.conversation_display.config(state=tk.NORMAL)
         self.conversation_display.delete(1.0, tk.END)
         self.conversation_display.config(state=tk.DISABLED)
+        
+        # Any voice input markers pointed into the deleted text
+        self.voice_input_active = False
+        self.voice_line_start = None
+        self.voice_text_start = None
+        
+        # Start a new transcript
+        for mark in self.visible_marks + [self.pending_message_mark]:
+            if mark:
+                self.conversation_display.mark_unset(mark)
+        self.transcript = []
+        self.first_visible = 0
+        self.visible_marks = []
+        self.pending_message_mark = None
     
     def display_welcome_message(self):
         """Display initial welcome message"""
         self.conversation_display.config(state=tk.NORMAL)
-        self.conversation_display.insert(tk.END, "System:\n", "speaker")
+        self._start_message()
         welcome_text = f"Welcome to Luis AI HUB!\nUsing model: {self.model_var.get()}\nType your message below to start chatting.\n\n"
-        self.conversation_display.insert(tk.END, welcome_text, "system")
+        self.conversation_display.insert(tk.END, "System:\n", "speaker", welcome_text, "system")
         self.conversation_display.config(state=tk.DISABLED)
+        self._finish_message("System:\n", welcome_text, "system")
     
     def display_user_message(self, message, is_voice=False):
         """Display a user message in the conversation"""
         # If we have an active voice input, end it first
         if self.voice_input_active:
-            self.end_voice_input()
+            self.end_voice_input(message)
             # Since we just added the speaker line and the message in end_voice_input,
             # we don't need to do it again
             return
@@ -803,15 +1062,13 @@ class ChatbotView:
         # Normal display logic
         self.conversation_display.config(state=tk.NORMAL)
         
-        if is_voice:
-            self.conversation_display.insert(tk.END, "You (voice):\n", "speaker")
-            self.conversation_display.insert(tk.END, f"{message}\n\n", "voice")
-        else:
-            self.conversation_display.insert(tk.END, "You:\n", "speaker")
-            self.conversation_display.insert(tk.END, f"{message}\n\n", "user")
+        speaker, tag = ("You (voice):\n", "voice") if is_voice else ("You:\n", "user")
+        self._start_message()
+        self.conversation_display.insert(tk.END, speaker, "speaker", f"{message}\n\n", tag)
             
         self.conversation_display.see(tk.END)
         self.conversation_display.config(state=tk.DISABLED)
+        self._finish_message(speaker, f"{message}\n\n", tag)
     
     def start_thinking_animation(self):
         """Start the thinking animation in the conversation"""
@@ -833,6 +1090,7 @@ class ChatbotView:
             self.conversation_display.insert(tk.END, "\n")
         
         # Now add the AI speaker tag
+        self._start_message()
         self.conversation_display.insert(tk.END, "AI:\n", "speaker")
         
         # Insert initial thinking text
@@ -866,10 +1124,14 @@ class ChatbotView:
     
     def stop_thinking_animation(self):
         """Stop the thinking animation"""
-        # Cancel the timer if it exists
-        if self.animation_timer_id:
-            self.root.after_cancel(self.animation_timer_id)
-            self.animation_timer_id = None
+        # Nothing to remove unless the animation is running (its positions go stale
+        # once the text moves, e.g. when old messages leave the transcript window)
+        if not self.animation_timer_id:
+            return
+        
+        # Cancel the timer
+        self.root.after_cancel(self.animation_timer_id)
+        self.animation_timer_id = None
         
         # Remove the animation text if it exists
         try:
@@ -880,27 +1142,67 @@ class ChatbotView:
             # Animation marks might not exist, or might be invalid
             pass
     
+    def _toggle_thinking_panel(self):
+        """Show or hide the thinking panel"""
+        self.thinking_panel_expanded = not self.thinking_panel_expanded
+        if self.thinking_panel_expanded:
+            self.thinking_display.pack(fill=tk.X, pady=(2, 0))
+        else:
+            self.thinking_display.pack_forget()
+        self._update_thinking_toggle_label()
+    
+    def _update_thinking_toggle_label(self):
+        """Show the panel state and how much thinking it holds"""
+        arrow = "▼" if self.thinking_panel_expanded else "▶"
+        length = len(self.thinking_display.get(1.0, "end-1c"))
+        suffix = f" ({length} chars)" if length else ""
+        self.thinking_toggle_button.config(text=f"{arrow} Thinking{suffix}")
+    
+    def start_thinking_panel(self):
+        """Clear the thinking panel for a new response"""
+        self.thinking_display.config(state=tk.NORMAL)
+        self.thinking_display.delete(1.0, tk.END)
+        self.thinking_display.config(state=tk.DISABLED)
+        self._update_thinking_toggle_label()
+    
+    def append_thinking(self, text):
+        """Add streamed thinking text to the thinking panel"""
+        self.thinking_display.config(state=tk.NORMAL)
+        self.thinking_display.insert(tk.END, text, "thinking")
+        self.thinking_display.see(tk.END)
+        self.thinking_display.config(state=tk.DISABLED)
+        self._update_thinking_toggle_label()
+    
+    @metrics.timed("view.display_ai_response_ms")
     def display_ai_response(self, response, speak_callback=None):
         """Display an AI response with typing animation and progressive speech"""
         # Stop the thinking animation (if any)
         self.stop_thinking_animation()
         
         self.conversation_display.config(state=tk.NORMAL)
+        self.typing_response = True
         # No need to insert "AI:" again as it was already inserted by thinking animation
         
         # Split response into sentences to handle progressive speech
-        import re
         sentences = re.split(r'(?<=[.!?])\s+', response)
         
         current_sentence = ""
         current_position = 0
+        self.response_interrupted = False
         
         # Process each character, tracking sentence boundaries
         for char in response:
+            # The user interrupted - show the rest at once and stop speaking
+            if self.response_interrupted:
+                self.conversation_display.insert(tk.END, response[current_position:], "ai")
+                current_sentence = ""
+                break
+            
             # Add the character to the display
-            self.conversation_display.insert(tk.END, char, "ai")
-            self.conversation_display.see(tk.END)
-            self.conversation_display.update()
+            with metrics.timer("view.insert_char_ms", FINE_BUCKETS_MS):
+                self.conversation_display.insert(tk.END, char, "ai")
+                self.conversation_display.see(tk.END)
+                self.conversation_display.update()
             
             # Add to current sentence
             current_sentence += char
@@ -922,15 +1224,156 @@ class ChatbotView:
         self.conversation_display.insert(tk.END, "\n\n")
         self.conversation_display.see(tk.END)
         self.conversation_display.config(state=tk.DISABLED)
+        self.typing_response = False
+        self._finish_message("AI:\n", f"{response}\n\n", "ai")
         
         # Ensure we're ready for a fresh voice input next time
         self.voice_input_active = False  # Reset voice input state
     
-    def start_response_checker(self, check_function):
-        """Start the response checker thread"""
-        def check_and_reschedule():
-            check_function()
-            self.root.after(100, check_and_reschedule)
+    def start_ai_stream(self, speak_callback=None):
+        """Start showing an AI response that arrives token by token"""
+        self.stop_thinking_animation()
+        self.typing_response = True
+        self.response_interrupted = False
+        self.stream_speak_callback = speak_callback
+        self.streamed_text = ""
+        self.stream_sentence = ""
+    
+    def append_ai_token(self, text):
+        """Show a streamed token, speaking every sentence as soon as it is complete"""
+        if not self.streamed_text:
+            text = text.lstrip()
+            if not text:
+                return
+        self.streamed_text += text
+        
+        self.conversation_display.config(state=tk.NORMAL)
+        self.conversation_display.insert(tk.END, text, "ai")
+        self.conversation_display.see(tk.END)
+        self.conversation_display.config(state=tk.DISABLED)
+        
+        if not self.stream_speak_callback or self.response_interrupted:
+            return
+        # The last part may still grow - everything before it is a finished sentence
+        self.stream_sentence += text
+        *sentences, self.stream_sentence = re.split(r'(?<=[.!?])\s+', self.stream_sentence)
+        for sentence in sentences:
+            if sentence.strip():
+                self.stream_speak_callback(sentence.strip())
+    
+    def finish_ai_stream(self):
+        """End the streamed AI response and store it in the transcript"""
+        if self.stream_speak_callback and not self.response_interrupted and self.stream_sentence.strip():
+            self.stream_speak_callback(self.stream_sentence.strip())
+        
+        self.conversation_display.config(state=tk.NORMAL)
+        self.conversation_display.insert(tk.END, "\n\n")
+        self.conversation_display.see(tk.END)
+        self.conversation_display.config(state=tk.DISABLED)
+        self.typing_response = False
+        self.stream_speak_callback = None
+        self._finish_message("AI:\n", f"{self.streamed_text}\n\n", "ai")
         
-        # Start the first check
-        self.root.after(100, check_and_reschedule)
+        # Ensure we're ready for a fresh voice input next time
+        self.voice_input_active = False
+    
+    # --- Windowed transcript ---
+    
+    def _start_message(self):
+        """Mark where the message about to be inserted at the end starts"""
+        if self.pending_message_mark:
+            # The previous message was never finished (e.g. a stopped generation)
+            self.conversation_display.mark_unset(self.pending_message_mark)
+        self.message_counter += 1
+        self.pending_message_mark = f"message{self.message_counter}"
+        self.conversation_display.mark_set(self.pending_message_mark, "end-1c")
+        self.conversation_display.mark_gravity(self.pending_message_mark, tk.LEFT)
+    
+    def _finish_message(self, speaker, text, tag):
+        """Add a finished message to the transcript store and keep the window size"""
+        self.transcript.append((speaker, text, tag))
+        self.visible_marks.append(self.pending_message_mark)
+        self.pending_message_mark = None
+        self._trim_transcript_window()
+    
+    def _transcript_busy(self):
+        """True while text positions are in use (voice input, thinking animation, typing)"""
+        return self.voice_input_active or self.animation_timer_id is not None or self.typing_response
+    
+    def _on_conversation_scroll(self, first, last):
+        """Scrollbar update - page older messages in at the top, drop them again at the bottom"""
+        self.conversation_display.vbar.set(first, last)
+        if self.window_update_scheduled:
+            return
+        if float(first) <= 0.0 and float(last) < 1.0 and self.first_visible > 0:
+            self.window_update_scheduled = True
+            self.root.after_idle(self._page_in_older_messages)
+        elif float(last) >= 1.0 and len(self.visible_marks) > self.max_visible_messages:
+            self.window_update_scheduled = True
+            self.root.after_idle(self._trim_transcript_window)
+    
+    def _trim_transcript_window(self):
+        """Remove the oldest messages from the widget while the user is at the bottom"""
+        self.window_update_scheduled = False
+        excess = len(self.visible_marks) - self.max_visible_messages
+        if excess <= 0 or self._transcript_busy():
+            return
+        if self.conversation_display.yview()[1] < 1.0:
+            return  # The user is reading older messages
+        
+        cut = self.visible_marks[excess]
+        if cut is None:
+            return
+        self.conversation_display.config(state=tk.NORMAL)
+        self.conversation_display.delete("1.0", cut)
+        self.conversation_display.config(state=tk.DISABLED)
+        for mark in self.visible_marks[:excess]:
+            if mark:
+                self.conversation_display.mark_unset(mark)
+        self.visible_marks = self.visible_marks[excess:]
+        self.first_visible += excess
+        self.conversation_display.see(tk.END)
+    
+    def _page_in_older_messages(self):
+        """Insert the previous page of messages from the transcript store at the top"""
+        self.window_update_scheduled = False
+        if self.first_visible == 0 or self._transcript_busy():
+            return
+        
+        start = max(0, self.first_visible - self.page_size)
+        older = self.transcript[start:self.first_visible]
+        top_line = int(self.conversation_display.index("@0,0").split(".")[0])
+        
+        # Marks at 1.0 must move right while text is inserted in front of them
+        if self.visible_marks and self.visible_marks[0]:
+            self.conversation_display.mark_gravity(self.visible_marks[0], tk.RIGHT)
+        
+        self.conversation_display.config(state=tk.NORMAL)
+        marks = []
+        for speaker, text, tag in reversed(older):
+            # One insert per message, with one tag range for the speaker and one for the text
+            self.conversation_display.insert("1.0", speaker, "speaker", text, tag)
+            self.message_counter += 1
+            mark = f"message{self.message_counter}"
+            self.conversation_display.mark_set(mark, "1.0")
+            self.conversation_display.mark_gravity(mark, tk.RIGHT)
+            marks.insert(0, mark)
+        self.conversation_display.config(state=tk.DISABLED)
+        
+        for mark in marks + self.visible_marks[:1]:
+            if mark:
+                self.conversation_display.mark_gravity(mark, tk.LEFT)
+        self.visible_marks = marks + self.visible_marks
+        self.first_visible = start
+        
+        # Keep the line the user was looking at in the same place
+        added_lines = sum((speaker + text).count("\n") for speaker, text, _ in older)
+        self.conversation_display.yview(f"{top_line + added_lines}.0")
+    
+    def interrupt_response(self):
+        """Stop typing out (and speaking) the current AI response"""
+        self.response_interrupted = True
+    
+    def post(self, func, *args):
+        """Run func(*args) on the Tk thread as soon as possible (callable from any thread)"""
+        self.ui_events.post(func, *args)
@@ -0,0 +1,110 @@
+import json
+import re
+import time
+from vosk import KaldiRecognizer
+
+# How model names are spoken (the Vosk vocabulary has no "qwq" or "deepseek")
+SPOKEN_MODEL_NAMES = {
+    "qwq:latest": "q w q",
+    "llama3.1:8b": "llama",
+    "deepseek-r1:32b": "deep seek",
+}
+
+def spoken_model_name(model_name):
+    """Get the phrase used to say a model name out loud"""
+    if model_name in SPOKEN_MODEL_NAMES:
+        return SPOKEN_MODEL_NAMES[model_name]
+    # Fall back to the letters of the name before the tag, e.g. "mistral:7b" -> "mistral"
+    return re.sub(r'[^a-z]+', ' ', model_name.split(':')[0].lower()).strip()
+
+
+class CommandRecognizer:
+    """
+    Fast voice command recognition using a Vosk grammar.
+
+    The recognizer only knows the registered command phrases, so decoding is
+    much cheaper and more reliable than open-vocabulary dictation. Commands are
+    dispatched as soon as a partial result matches a phrase, without waiting
+    for the end of the utterance.
+    """
+    def __init__(self, model, sample_rate=16000, dispatch=None):
+        self.model = model  # Shared Vosk model (no extra copy is loaded)
+        self.sample_rate = sample_rate
+        self.dispatch = dispatch  # Optional function used to run handlers (e.g. on the UI thread)
+        self.commands = {}  # phrase -> handler
+        self.recognizer = None
+        self.fired_phrase = None  # Command already dispatched for the current utterance
+        self.cooldown = 1.0  # Seconds before the same command can fire again
+        self.last_phrase = None
+        self.last_fired_time = 0
+
+    def add_command(self, phrase, handler):
+        """Register a command phrase and the function called when it is spoken"""
+        self.commands[phrase.lower().strip()] = handler
+        self.recognizer = None  # Grammar must be rebuilt
+
+    def clear_commands(self):
+        """Remove all registered commands"""
+        self.commands = {}
+        self.recognizer = None
+
+    def _build_recognizer(self):
+        """Create a KaldiRecognizer restricted to the command phrases"""
+        # "[unk]" lets the recognizer reject speech that isn't a command
+        grammar = json.dumps(sorted(self.commands.keys()) + ["[unk]"])
+        self.recognizer = KaldiRecognizer(self.model, self.sample_rate, grammar)
+        self.fired_phrase = None
+
+    def _is_prefix_of_other_command(self, phrase):
+        """Check if more words could still turn this phrase into a longer command"""
+        return any(other != phrase and other.startswith(phrase + " ") for other in self.commands)
+
+    def _fire(self, phrase):
+        """Dispatch the handler for a recognized command"""
+        now = time.time()
+        if phrase == self.fired_phrase:
+            return False
+        if phrase == self.last_phrase and now - self.last_fired_time < self.cooldown:
+            return False
+
+        self.fired_phrase = phrase
+        self.last_phrase = phrase
+        self.last_fired_time = now
+        print(f"Voice command: '{phrase}'")
+
+        handler = self.commands[phrase]
+        if self.dispatch:
+            self.dispatch(handler, phrase)
+        else:
+            handler(phrase)
+        return True
+
+    def accept_audio(self, audio_data):
+        """Feed an audio chunk, returns the command phrase if one fired on this chunk"""
+        if not self.commands:
+            return None
+        if self.recognizer is None:
+            self._build_recognizer()
+
+        if self.recognizer.AcceptWaveform(audio_data):
+            # End of utterance - fire if the partial didn't already
+            text = json.loads(self.recognizer.Result()).get('text', '').strip()
+            already_fired = self.fired_phrase
+            self.fired_phrase = None
+            fired = text in self.commands and text != already_fired and self._fire(text)
+            self.fired_phrase = None  # The next utterance starts fresh
+            return text if fired else None
+
+        # Early dispatch on partial results for low latency - unless a longer command
+        # starting with the same words is still possible
+        partial = json.loads(self.recognizer.PartialResult()).get('partial', '').strip()
+        if partial in self.commands and not self._is_prefix_of_other_command(partial):
+            if self._fire(partial):
+                return partial
+        return None
+
+    def reset(self):
+        """Forget any in-progress utterance"""
+        if self.recognizer is not None:
+            self.recognizer.Reset()
+        self.fired_phrase = None
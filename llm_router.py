@@ -0,0 +1,263 @@
+# Backends and a router for the LLMs used in this repo.
+# The scripts talk to Ollama (localhost:11434) or the HuggingFace Inference API, each
+# hardcoded. Here both are backends with the same generate() call, and the router sends
+# every request to the fastest healthy backend/model. If the chosen one misses a latency
+# deadline, a smaller model (llama3.1:8b) is started as a hedge and the first answer wins.
+# Run this file to try it against two local stub servers.
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+
+
+class OllamaBackend:
+    """Local Ollama server"""
+    def __init__(self, base_url="http://localhost:11434", name="ollama"):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+
+    def generate(self, model, prompt, max_tokens=512, timeout=300):
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json={
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {
+                    "num_predict": max_tokens
+                }
+            },
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def health_check(self, timeout=2):
+        """True if the server answers"""
+        try:
+            return requests.get(f"{self.base_url}/api/tags", timeout=timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+
+class HuggingFaceBackend:
+    """HuggingFace Inference API (token from HUGGINGFACE_API_TOKEN)"""
+    def __init__(self, api_token=None, base_url="https://api-inference.huggingface.co/models", name="huggingface"):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_token = api_token or os.getenv("HUGGINGFACE_API_TOKEN")
+
+    def generate(self, model, prompt, max_tokens=256, timeout=120):
+        response = requests.post(
+            f"{self.base_url}/{model}",
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            json={"inputs": prompt, "parameters": {"max_new_tokens": max_tokens, "return_full_text": False}},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        result = response.json()
+        text = result[0]["generated_text"]
+        # Some models ignore return_full_text - keep only the assistant part
+        if "<|im_start|>assistant\n" in text:
+            text = text.split("<|im_start|>assistant\n")[-1]
+        return text
+
+    def health_check(self, timeout=5):
+        """True if the API is reachable (any HTTP answer counts)"""
+        try:
+            requests.get(self.base_url, timeout=timeout)
+            return True
+        except requests.RequestException:
+            return False
+
+
+class LatencyTracker:
+    """Recent latencies of one route with percentiles"""
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        """Latency percentile (None without samples)"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class Route:
+    """One backend + model the router can use"""
+    def __init__(self, backend, model, max_tokens=512):
+        self.backend = backend
+        self.model = model
+        self.max_tokens = max_tokens
+        self.latency = LatencyTracker()
+        self.unhealthy_until = 0  # Time before which the route is skipped after a failure
+
+    @property
+    def name(self):
+        return f"{self.backend.name}/{self.model}"
+
+    def is_healthy(self):
+        return time.time() >= self.unhealthy_until
+
+
+class LLMRouter:
+    """
+    Sends each request to the fastest healthy route, falls back to the next
+    one on errors and hedges with a small model when the deadline is missed.
+    """
+    def __init__(self, routes, hedge_route=None, hedge_after=None, retry_after=30.0, max_workers=8):
+        self.routes = list(routes)  # Preference order for routes without latency data
+        self.hedge_route = hedge_route
+        self.hedge_after = hedge_after  # Seconds, None uses the p95 of the chosen route
+        self.retry_after = retry_after  # Seconds a failed route is skipped
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self.lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def ranked_routes(self):
+        """Healthy routes, fastest p50 first (routes without data keep their order, first)"""
+        healthy = [r for r in self.routes if r.is_healthy()] or list(self.routes)
+        return sorted(healthy, key=lambda r: (r.latency.percentile(50) is not None, r.latency.percentile(50) or 0))
+
+    def _call(self, route, prompt):
+        """Run one request on a route, recording its latency or failure"""
+        start = time.time()
+        with self.lock:
+            route.latency.requests += 1
+        try:
+            text = route.backend.generate(route.model, prompt, route.max_tokens)
+        except Exception:
+            with self.lock:
+                route.latency.errors += 1
+                route.unhealthy_until = time.time() + self.retry_after
+            raise
+        with self.lock:
+            route.latency.record(time.time() - start)
+        return text
+
+    def _deadline_for(self, route):
+        """How long to wait for a route before hedging"""
+        if self.hedge_after is not None:
+            return self.hedge_after
+        return route.latency.percentile(95)
+
+    def generate(self, prompt):
+        """Get a response, returns (text, route_name)"""
+        last_error = None
+        for route in self.ranked_routes():
+            primary = self.pool.submit(self._call, route, prompt)
+            pending = {primary: route}
+
+            deadline = self._deadline_for(route)
+            hedge = self.hedge_route
+            if hedge is not None and hedge is not route and deadline is not None:
+                done, _ = wait([primary], timeout=deadline)
+                if not done:
+                    # Too slow - start the small model and take whichever finishes first
+                    print(f"{route.name} missed its {deadline:.1f}s deadline, hedging with {hedge.name}")
+                    with self.lock:
+                        self.hedges += 1
+                    pending[self.pool.submit(self._call, hedge, prompt)] = hedge
+
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    winner = pending.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        last_error = e
+                        print(f"{winner.name} failed: {e}")
+                        continue
+                    if winner is hedge and winner is not route:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    # The losing request is left to finish in the background (its latency still counts)
+                    return text, winner.name
+        raise RuntimeError(f"All backends failed: {last_error}")
+
+    def stats(self):
+        """Requests, errors and latency percentiles per route"""
+        routes = self.routes + ([self.hedge_route] if self.hedge_route and self.hedge_route not in self.routes else [])
+        with self.lock:
+            return {
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "routes": {
+                    r.name: {
+                        "requests": r.latency.requests,
+                        "errors": r.latency.errors,
+                        "p50": r.latency.percentile(50),
+                        "p95": r.latency.percentile(95),
+                        "healthy": r.is_healthy(),
+                    }
+                    for r in routes
+                },
+            }
+
+
+def default_router():
+    """Local Ollama first (32B with a llama3.1:8b hedge), HuggingFace as fallback"""
+    ollama = OllamaBackend()
+    routes = [Route(ollama, "qwq:latest")]
+    if os.getenv("HUGGINGFACE_API_TOKEN"):
+        routes.append(Route(HuggingFaceBackend(), os.getenv("DEFAULT_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"), max_tokens=256))
+    return LLMRouter(routes, hedge_route=Route(ollama, "llama3.1:8b"))
+
+
+# Try the router against stub servers (no Ollama or HuggingFace needed)
+if __name__ == "__main__":
+    import json
+    import random
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    def start_stub(delay_range, fail_rate=0.0):
+        """Ollama-like stub answering after a random delay"""
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.end_headers()
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(random.uniform(*delay_range))
+                if random.random() < fail_rate:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps({"response": f"answer from {payload['model']}", "done": True}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_port}"
+
+    big = OllamaBackend(start_stub((0.2, 1.5), fail_rate=0.1), name="big-stub")
+    small = OllamaBackend(start_stub((0.05, 0.15)), name="small-stub")
+    router = LLMRouter([Route(big, "qwq:latest")], hedge_route=Route(small, "llama3.1:8b"), hedge_after=0.8, retry_after=1.0)
+
+    for i in range(20):
+        try:
+            text, route_name = router.generate("<|im_start|>user\nhello<|im_end|>\n<|im_start|>assistant\n")
+            print(f"{i:2d} {route_name}: {text}")
+        except RuntimeError as e:
+            print(f"{i:2d} {e}")
+    print(json.dumps(router.stats(), indent=2))